@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+asyncio interface for reading a gamepad or joystick.
+
+Wraps any Gamepad object, including all of the Controllers classes, and reads
+its device through the event loop's add_reader instead of a background thread.
+The wrapped gamepad keeps its state, so isPressed, axis and friends still work.
+An exception from a handler, plain or coroutine, goes to the wrapped gamepad's
+callbackErrorHandler if set, otherwise to the event loop's exception handler.
+
+Example:
+    async def main():
+        pad = AsyncGamepad(Controllers.Joystick())
+        pad.start()
+        await pad.waitReady()
+        pad.addButtonPressedHandler('RED', honk)   # honk may be a coroutine function
+        await pad.waitPressed('TRIGGER')
+        async for eventType, control, value in pad.events():
+            print(eventType, control, value)
+"""
+
+import asyncio
+import inspect
+
+from Gamepad.Gamepad import Gamepad
+
+
+class AsyncGamepad:
+    def __init__(self, gamepad):
+        if not isinstance(gamepad, Gamepad):
+            raise ValueError('AsyncGamepad was not created with a valid Gamepad object')
+        self.gamepad = gamepad
+        self.loop = None
+        self.eventQueues = []
+        self.pressedWaiters = {}
+        self.releasedWaiters = {}
+        self.readyWaiters = []
+        self.pressedHandlers = {}
+        self.releasedHandlers = {}
+        self.changedHandlers = {}
+        self.movedHandlers = {}
+        self.handlerTasks = set()
+
+    def __getattr__(self, name):
+        # Everything else, such as isPressed or axis, comes straight from the wrapped gamepad
+        if name == 'gamepad':
+            raise AttributeError(name)
+        return getattr(self.gamepad, name)
+
+    def start(self):
+        """Starts reading the gamepad from the running event loop.
+
+        Do not use with startBackgroundUpdates, getNextEvent or updateState on the same gamepad"""
+        if self.loop is not None:
+            raise RuntimeError('Called start when the gamepad is already being read')
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.gamepad.joystickFile.fileno(), self._onReadable)
+
+    def stop(self):
+        """Stops reading the gamepad, any events iterators finish."""
+        if self.loop is not None:
+            self.loop.remove_reader(self.gamepad.joystickFile.fileno())
+            self.loop = None
+        self._finish(None)
+
+    def disconnect(self):
+        """Stops reading, then cleanly disconnects the wrapped gamepad."""
+        self.stop()
+        self.gamepad.disconnect()
+
+    def _onReadable(self):
+        try:
+            events = self.gamepad._getPendingEventsRaw(block = False)
+        except IOError as e:
+            self.loop.remove_reader(self.gamepad.joystickFile.fileno())
+            self.loop = None
+            self._finish(e)
+            return
+        if events:
+            self.gamepad._storeEvents(events)
+        for timestamp, value, eventType, index in events:
+            self.gamepad.lastTimestamp = timestamp
+            try:
+                self.gamepad._applyEvent(value, eventType, index)
+            except Exception as e:
+                # Raised by a callback on the wrapped gamepad, the rest of the batch still has to be handled
+                self.loop.call_exception_handler({'message': 'Gamepad callback failed', 'exception': e})
+            if eventType == Gamepad.EVENT_CODE_BUTTON:
+                pressed = value != 0
+                if pressed:
+                    self._resolveWaiters(self.pressedWaiters, index)
+                    self._runHandlers(self.pressedHandlers, index)
+                else:
+                    self._resolveWaiters(self.releasedWaiters, index)
+                    self._runHandlers(self.releasedHandlers, index)
+                self._runHandlers(self.changedHandlers, index, pressed)
+                if self.eventQueues:
+                    event = (Gamepad.EVENT_BUTTON, self.gamepad.buttonNames.get(index, index), pressed)
+                    for queue in self.eventQueues:
+                        queue.put_nowait(event)
+            elif eventType == Gamepad.EVENT_CODE_AXIS:
+                position = self.gamepad.axisMap[index]
+                self._runHandlers(self.movedHandlers, index, position)
+                if self.eventQueues:
+                    event = (Gamepad.EVENT_AXIS, self.gamepad.axisNames.get(index, index), position)
+                    for queue in self.eventQueues:
+                        queue.put_nowait(event)
+        if self.readyWaiters and self.gamepad.isReady():
+            waiters = self.readyWaiters
+            self.readyWaiters = []
+            for future in waiters:
+                if not future.done():
+                    future.set_result(True)
+
+    def _resolveWaiters(self, waiterMap, index):
+        waiters = waiterMap.pop(index, None)
+        if waiters:
+            for future in waiters:
+                if not future.done():
+                    future.set_result(True)
+
+    def _runHandlers(self, handlerMap, index, *args):
+        handlers = handlerMap.get(index)
+        if handlers:
+            for callback in handlers:
+                try:
+                    result = callback(*args)
+                except Exception as e:
+                    self._handlerFailed(callback, e)
+                    continue
+                if inspect.isawaitable(result):
+                    # Keep a reference so the task is not garbage collected part way through
+                    task = self.loop.create_task(result)
+                    self.handlerTasks.add(task)
+                    task.add_done_callback(lambda task, callback = callback: self._handlerDone(task, callback))
+
+    def _handlerDone(self, task, callback):
+        self.handlerTasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._handlerFailed(callback, task.exception())
+
+    def _handlerFailed(self, callback, error):
+        """Passes an exception from a handler to the wrapped gamepad's callbackErrorHandler if set,
+        otherwise to the event loop's exception handler, so the other handlers and waiters still run."""
+        if self.gamepad.callbackErrorHandler is not None:
+            self.gamepad.callbackErrorHandler(self.gamepad, callback, error)
+        else:
+            asyncio.get_running_loop().call_exception_handler({'message': 'Gamepad handler %r failed' % callback,
+                                                                'exception': error})
+
+    def _finish(self, error):
+        """Ends every events iterator and fails every waiter, used when reading stops."""
+        for queue in self.eventQueues:
+            queue.put_nowait(None)
+        waiters = self.readyWaiters
+        self.readyWaiters = []
+        for waiterMap in (self.pressedWaiters, self.releasedWaiters):
+            for futures in waiterMap.values():
+                waiters.extend(futures)
+            waiterMap.clear()
+        for future in waiters:
+            if not future.done():
+                if error is None:
+                    future.cancel()
+                else:
+                    future.set_exception(IOError(str(error)))
+
+    async def events(self):
+        """Asynchronously iterates over the gamepad events as they arrive.
+
+        Each event has the same format as Gamepad.getNextEvent:
+            event name, entity name, value
+        Initial state events from the device are not included.
+
+        Iteration finishes when reading stops or the gamepad is disconnected.
+        Any number of iterators may be used at once, each sees every event."""
+        queue = asyncio.Queue()
+        self.eventQueues.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.eventQueues.remove(queue)
+
+    async def waitReady(self):
+        """Waits until the isReady call is True."""
+        if self.gamepad.isReady():
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.readyWaiters.append(future)
+        await future
+
+    async def waitPressed(self, buttonName):
+        """Waits for the next press of a button specified by name or index.
+
+        Throws IOError if the gamepad is disconnected while waiting."""
+        index = self.gamepad._findButtonIndex(buttonName)
+        future = asyncio.get_running_loop().create_future()
+        self.pressedWaiters.setdefault(index, []).append(future)
+        await future
+
+    async def waitReleased(self, buttonName):
+        """Waits for the next release of a button specified by name or index.
+
+        Throws IOError if the gamepad is disconnected while waiting."""
+        index = self.gamepad._findButtonIndex(buttonName)
+        future = asyncio.get_running_loop().create_future()
+        self.releasedWaiters.setdefault(index, []).append(future)
+        await future
+
+    def addButtonPressedHandler(self, buttonName, callback):
+        """Adds a callback for when a specific button specified by name or index is pressed.
+        The callback may be a plain function or a coroutine function, it gets no parameters passed."""
+        handlers = self.pressedHandlers.setdefault(self.gamepad._findButtonIndex(buttonName), [])
+        if callback not in handlers:
+            handlers.append(callback)
+
+    def removeButtonPressedHandler(self, buttonName, callback):
+        """Removes a callback for when a specific button specified by name or index is pressed."""
+        handlers = self.pressedHandlers.get(self.gamepad._findButtonIndex(buttonName), [])
+        if callback in handlers:
+            handlers.remove(callback)
+
+    def addButtonReleasedHandler(self, buttonName, callback):
+        """Adds a callback for when a specific button specified by name or index is released.
+        The callback may be a plain function or a coroutine function, it gets no parameters passed."""
+        handlers = self.releasedHandlers.setdefault(self.gamepad._findButtonIndex(buttonName), [])
+        if callback not in handlers:
+            handlers.append(callback)
+
+    def removeButtonReleasedHandler(self, buttonName, callback):
+        """Removes a callback for when a specific button specified by name or index is released."""
+        handlers = self.releasedHandlers.get(self.gamepad._findButtonIndex(buttonName), [])
+        if callback in handlers:
+            handlers.remove(callback)
+
+    def addButtonChangedHandler(self, buttonName, callback):
+        """Adds a callback for when a specific button specified by name or index changes.
+        The callback may be a plain function or a coroutine function, it gets a boolean for the button pressed state."""
+        handlers = self.changedHandlers.setdefault(self.gamepad._findButtonIndex(buttonName), [])
+        if callback not in handlers:
+            handlers.append(callback)
+
+    def removeButtonChangedHandler(self, buttonName, callback):
+        """Removes a callback for when a specific button specified by name or index changes."""
+        handlers = self.changedHandlers.get(self.gamepad._findButtonIndex(buttonName), [])
+        if callback in handlers:
+            handlers.remove(callback)
+
+    def addAxisMovedHandler(self, axisName, callback):
+        """Adds a callback for when a specific axis specified by name or index changes.
+        The callback may be a plain function or a coroutine function, it gets the updated position of the axis."""
+        handlers = self.movedHandlers.setdefault(self.gamepad._findAxisIndex(axisName), [])
+        if callback not in handlers:
+            handlers.append(callback)
+
+    def removeAxisMovedHandler(self, axisName, callback):
+        """Removes a callback for when a specific axis specified by name or index changes."""
+        handlers = self.movedHandlers.get(self.gamepad._findAxisIndex(axisName), [])
+        if callback in handlers:
+            handlers.remove(callback)
+
+    def removeAllEventHandlers(self):
+        """Removes all event handlers from all axes and buttons, including those on the wrapped gamepad."""
+        self.pressedHandlers.clear()
+        self.releasedHandlers.clear()
+        self.changedHandlers.clear()
+        self.movedHandlers.clear()
+        self.gamepad.removeAllEventHandlers()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Runs gamepad event callbacks away from the thread reading the device.
+
+Normally callbacks run inline in updateState, so one slow callback holds up
+reading every other event. Give a gamepad a CallbackDispatcher and its
+callbacks are put on a bounded queue instead, served by one or more worker
+threads. What happens when callbacks arrive faster than they run is set by a
+policy, per kind of event or per callback:
+
+    LATEST       - a newer call for the same callback and control replaces one
+                   still waiting, so only the latest position is seen. At most
+                   one per callback and control waits, so these are never
+                   dropped and do not count towards the queue's limit
+    NEVER_DROP   - always queued, even when the queue is over its limit
+    DROP_NEWEST  - dropped when the queue is full
+
+By default axis moved callbacks use LATEST and button callbacks use NEVER_DROP.
+
+With more than one worker, callbacks for different controls run in parallel but
+those for the same axis or button still run one at a time in the order they
+were queued, so a button's released callback never runs before its pressed one.
+
+Example:
+    dispatcher = CallbackDispatcher()
+    dispatcher.setPolicy(logPosition, DROP_NEWEST)
+    joystick.setDispatcher(dispatcher)
+"""
+
+import collections
+import threading
+import traceback
+
+from Gamepad.Gamepad import Gamepad
+
+LATEST = 'LATEST'
+NEVER_DROP = 'NEVER_DROP'
+DROP_NEWEST = 'DROP_NEWEST'
+POLICIES = (LATEST, NEVER_DROP, DROP_NEWEST)
+
+
+class CallbackDispatcher:
+    def __init__(self, maxQueued = 256, workers = 1, axisPolicy = LATEST, buttonPolicy = NEVER_DROP):
+        for policy in (axisPolicy, buttonPolicy):
+            if policy not in POLICIES:
+                raise ValueError('Unknown dispatch policy %s' % policy)
+        self.maxQueued = maxQueued
+        self.workerCount = workers
+        self.kindPolicies = {Gamepad.EVENT_AXIS: axisPolicy, Gamepad.EVENT_BUTTON: buttonPolicy}
+        self.callbackPolicies = {}
+        self.queue = collections.deque()
+        self.latest = {}
+        self.activeControls = set()
+        self.condition = threading.Condition()
+        self.workers = []
+        self.running = False
+        self.busy = 0
+        self.maxDepth = 0
+        self.submitted = 0
+        self.dispatched = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def setPolicy(self, callback, policy):
+        """Sets the policy for one callback, overriding the default for its kind of event.
+        A policy of None goes back to the default."""
+        if policy is None:
+            self.callbackPolicies.pop(callback, None)
+        elif policy in POLICIES:
+            self.callbackPolicies[callback] = policy
+        else:
+            raise ValueError('Unknown dispatch policy %s' % policy)
+
+    def submitAll(self, callbacks, args, kind, index):
+        """Queues each callback to be called with args.
+        kind is Gamepad.EVENT_AXIS or Gamepad.EVENT_BUTTON, index is the raw axis / button number."""
+        if not callbacks:
+            return
+        kindPolicy = self.kindPolicies[kind]
+        control = (kind, index)
+        with self.condition:
+            for callback in callbacks:
+                self.submitted += 1
+                policy = self.callbackPolicies.get(callback, kindPolicy)
+                if policy == LATEST:
+                    key = (callback, kind, index)
+                    entry = self.latest.get(key)
+                    if entry is not None:
+                        # Still waiting, just swap in the newer arguments
+                        entry[1] = args
+                        self.coalesced += 1
+                        continue
+                    entry = [callback, args, key, control]
+                    self.latest[key] = entry
+                elif policy == DROP_NEWEST:
+                    # Waiting LATEST entries are not counted, each one is there in place of many calls
+                    if len(self.queue) - len(self.latest) >= self.maxQueued:
+                        self.dropped += 1
+                        continue
+                    entry = [callback, args, None, control]
+                else:
+                    entry = [callback, args, None, control]
+                self.queue.append(entry)
+            depth = len(self.queue)
+            if depth > self.maxDepth:
+                self.maxDepth = depth
+            self.condition.notify(depth)
+
+    def _next(self):
+        """Removes and returns the oldest entry whose control is not being run by another worker, None if there is none."""
+        for position, entry in enumerate(self.queue):
+            if entry[3] not in self.activeControls:
+                del self.queue[position]
+                return entry
+        return None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while True:
+                    entry = self._next()
+                    if entry is not None:
+                        break
+                    if not self.running and not self.queue:
+                        return
+                    self.condition.wait()
+                callback, args, key, control = entry
+                if key is not None:
+                    del self.latest[key]
+                self.activeControls.add(control)
+                self.busy += 1
+            try:
+                callback(*args)
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+            with self.condition:
+                self.activeControls.discard(control)
+                self.busy -= 1
+                self.dispatched += 1
+                if self.queue:
+                    if self.workerCount > 1:
+                        # Another worker may be waiting for this control to be free
+                        self.condition.notify_all()
+                elif not self.busy:
+                    self.condition.notify_all()
+
+    def start(self):
+        """Starts the worker threads, done automatically by Gamepad.setDispatcher."""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.workers = [threading.Thread(target = self._work, name = 'CallbackDispatcher-%d' % number, daemon = True)
+                        for number in range(self.workerCount)]
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, wait = True):
+        """Stops the worker threads once everything already queued has run.
+        When wait is True this waits for them to finish."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                if worker is not threading.current_thread():
+                    worker.join()
+        self.workers = []
+
+    def waitIdle(self, timeout = None):
+        """Waits until every queued callback has run, returns False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.busy, timeout)
+
+    def depth(self):
+        """Returns how many callbacks are currently waiting."""
+        return len(self.queue)
+
+    def stats(self):
+        """Returns a dictionary of the queue counters."""
+        with self.condition:
+            return {
+                'depth': len(self.queue),
+                'maxDepth': self.maxDepth,
+                'submitted': self.submitted,
+                'dispatched': self.dispatched,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'errors': self.errors,
+            }
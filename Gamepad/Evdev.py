@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Reads a gamepad or joystick through the evdev interface, /dev/input/eventN.
+
+EvdevGamepad works like the other Gamepad classes, using the same registered
+mappings, but compared to the legacy joystick interface it gets:
+    Each axis scaled from its real absinfo range instead of a fixed +/-32767,
+    so no resolution is lost to the joystick driver's 16 bit correction.
+    Microsecond timestamps on the monotonic clock, see lastTimestampUs.
+    Whole SYN_REPORT frames, so every axis and button change reported together
+    reaches the state (and snapshot) together.
+
+Axes and buttons are numbered the same way the joystick driver numbers them,
+so the mappings in Controllers.py apply unchanged:
+    joystick = EvdevGamepad(4, 'Joystick')
+"""
+
+import fcntl
+import os
+import select
+import struct
+
+from Gamepad.Gamepad import Gamepad, controllerMapping
+
+EVENT_FORMAT = 'llHHi'
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0
+SYN_DROPPED = 3
+BTN_MISC = 0x100
+BTN_JOYSTICK = 0x120
+KEY_MAX = 0x2ff
+ABS_MAX = 0x3f
+CLOCK_MONOTONIC = 1
+
+
+def _ioctlRead(number, size):
+    return (2 << 30) | (size << 16) | (ord('E') << 8) | number
+
+EVIOCGKEY = _ioctlRead(0x18, (KEY_MAX + 8) // 8)
+EVIOCGBIT_KEY = _ioctlRead(0x20 + EV_KEY, (KEY_MAX + 8) // 8)
+EVIOCGBIT_ABS = _ioctlRead(0x20 + EV_ABS, (ABS_MAX + 8) // 8)
+EVIOCSCLOCKID = (1 << 30) | (4 << 16) | (ord('E') << 8) | 0xa0
+
+def EVIOCGABS(code):
+    return _ioctlRead(0x40 + code, 24)
+
+
+def _testBit(bits, number):
+    return bits[number >> 3] & (1 << (number & 7)) != 0
+
+
+class EvdevGamepad(Gamepad):
+    """A Gamepad reading /dev/input/eventN.
+
+    controller names a registered mapping, such as 'Joystick', for the axis and button names.
+
+    When the device cannot be asked for its layout, such as a pipe standing in for it,
+    pass axisCodes / buttonCodes with the ABS_* / BTN_* codes in index order and
+    absInfo with (minimum, maximum) ranges by ABS_* code. Without those, controls are
+    numbered in the order they first appear and axes assume +/-32767."""
+    fullName = 'Generic evdev (numbers only)'
+    devicePrefix = '/dev/input/event'
+
+    def __init__(self, eventNumber = 0, controller = None, axisCodes = None, buttonCodes = None, absInfo = None):
+        self.axisCodes = axisCodes
+        self.buttonCodes = buttonCodes
+        self.absInfo = absInfo
+        self.lastTimestampUs = 0
+        Gamepad.__init__(self, eventNumber)
+        self.eventSize = struct.calcsize(EVENT_FORMAT)
+        self.frame = []
+        self.dropping = False
+        if controller is not None:
+            mapping = controllerMapping(controller)
+            self.fullName = mapping.fullName
+            self.axisNames = dict(mapping.axisNames)
+            self.buttonNames = dict(mapping.buttonNames)
+            self._setupReverseMaps()
+        self._loadInitialState()
+
+    def _getDeviceSize(self):
+        """Works out the axis / button numbering and axis ranges, then returns how many there are."""
+        try:
+            fcntl.ioctl(self.joystickFile, EVIOCSCLOCKID, struct.pack('i', CLOCK_MONOTONIC))
+        except OSError:
+            pass
+        if self.axisCodes is None or self.buttonCodes is None:
+            try:
+                absBits = bytearray((ABS_MAX + 8) // 8)
+                fcntl.ioctl(self.joystickFile, EVIOCGBIT_ABS, absBits)
+                keyBits = bytearray((KEY_MAX + 8) // 8)
+                fcntl.ioctl(self.joystickFile, EVIOCGBIT_KEY, keyBits)
+            except OSError:
+                absBits = keyBits = None
+            if absBits is not None:
+                # The same order the joystick driver uses
+                if self.axisCodes is None:
+                    self.axisCodes = [code for code in range(ABS_MAX + 1) if _testBit(absBits, code)]
+                if self.buttonCodes is None:
+                    self.buttonCodes = ([code for code in range(BTN_JOYSTICK, KEY_MAX + 1) if _testBit(keyBits, code)] +
+                                        [code for code in range(BTN_MISC, BTN_JOYSTICK) if _testBit(keyBits, code)])
+        self.axisIndexByCode = {}
+        self.buttonIndexByCode = {}
+        self.axisScale = {}
+        for index, code in enumerate(self.axisCodes or []):
+            self.axisIndexByCode[code] = index
+            self._setupAxisScale(code)
+        for index, code in enumerate(self.buttonCodes or []):
+            self.buttonIndexByCode[code] = index
+        return len(self.axisIndexByCode), len(self.buttonIndexByCode)
+
+    def _setupAxisScale(self, code):
+        """Works out the (centre, scale) taking a raw value to the +/-MAX_AXIS joystick range."""
+        minimum, maximum = -int(Gamepad.MAX_AXIS), int(Gamepad.MAX_AXIS)
+        if self.absInfo is not None and code in self.absInfo:
+            minimum, maximum = self.absInfo[code][:2]
+        else:
+            try:
+                info = bytearray(24)
+                fcntl.ioctl(self.joystickFile, EVIOCGABS(code), info)
+                value, minimum, maximum = struct.unpack_from('iii', info)
+            except OSError:
+                pass
+        centre = (minimum + maximum) / 2.0
+        halfRange = (maximum - minimum) / 2.0
+        if halfRange <= 0:
+            halfRange = 1.0
+        self.axisScale[code] = (centre, Gamepad.MAX_AXIS / halfRange)
+
+    def _loadInitialState(self):
+        """Fills in the starting state the joystick driver would have sent as init events."""
+        events = self._readDeviceState(0)
+        if events:
+            self._storeEvents(events)
+            for timestamp, value, eventType, index in events:
+                self._applyEvent(value, eventType, index)
+
+    def _readDeviceState(self, timestamp):
+        """Returns the current state of every known axis and button as init events."""
+        keyState = None
+        try:
+            keyState = bytearray((KEY_MAX + 8) // 8)
+            fcntl.ioctl(self.joystickFile, EVIOCGKEY, keyState)
+        except OSError:
+            keyState = None
+        events = []
+        for code, index in self.buttonIndexByCode.items():
+            pressed = 1 if keyState is not None and _testBit(keyState, code) else 0
+            events.append((timestamp, pressed, Gamepad.EVENT_CODE_INIT_BUTTON, index))
+        for code, index in self.axisIndexByCode.items():
+            centre, scale = self.axisScale[code]
+            value = centre
+            try:
+                info = bytearray(24)
+                fcntl.ioctl(self.joystickFile, EVIOCGABS(code), info)
+                value = struct.unpack_from('i', info)[0]
+            except OSError:
+                pass
+            events.append((timestamp, (value - centre) * scale, Gamepad.EVENT_CODE_INIT_AXIS, index))
+        return events
+
+    def _convertEvent(self, seconds, microseconds, eventType, code, value):
+        """Turns one input_event into the joystick style (timestamp, value, type, index), or None to ignore it."""
+        timestamp = (seconds * 1000 + microseconds // 1000) & 0xFFFFFFFF
+        if eventType == EV_ABS:
+            index = self.axisIndexByCode.get(code)
+            if index is None:
+                if self.axisCodes is not None:
+                    return None
+                index = len(self.axisIndexByCode)
+                self.axisIndexByCode[code] = index
+                self._setupAxisScale(code)
+                self._applyEvent(0, Gamepad.EVENT_CODE_INIT_AXIS, index)
+            centre, scale = self.axisScale[code]
+            return (timestamp, (value - centre) * scale, Gamepad.EVENT_CODE_AXIS, index)
+        elif eventType == EV_KEY and value != 2:
+            # Value 2 is key auto-repeat, which the joystick driver ignores too
+            index = self.buttonIndexByCode.get(code)
+            if index is None:
+                if self.buttonCodes is not None or code < BTN_MISC:
+                    return None
+                index = len(self.buttonIndexByCode)
+                self.buttonIndexByCode[code] = index
+                self._applyEvent(0, Gamepad.EVENT_CODE_INIT_BUTTON, index)
+            return (timestamp, value, Gamepad.EVENT_CODE_BUTTON, index)
+        return None
+
+    def _getPendingEventsRaw(self, block = True):
+        """Returns a list of the events from every complete SYN_REPORT frame waiting on the device.
+
+        Events are converted to the same format as Gamepad._getNextEventRaw, with axis values
+        already scaled to the joystick range. A frame is only returned once its SYN_REPORT
+        arrives, so a frame is never split between calls. Events already read ahead by
+        _getNextEventRaw are returned first.
+        After a SYN_DROPPED, as the kernel documents, every event up to and including the
+        next SYN_REPORT is discarded and the state is then read back from the device, as
+        init events after any earlier frames so it is applied last.
+        Throws an IOError if the gamepad is disconnected"""
+        if self.pendingEvents:
+            events = list(self.pendingEvents)
+            self.pendingEvents.clear()
+            return events
+        if not self.connected:
+            raise IOError('Gamepad has been disconnected')
+        fileno = self.joystickFile.fileno()
+        if self.readBuffer is None:
+            self.readBuffer = bytearray(self.eventSize * Gamepad.MAX_BATCH_EVENTS)
+            self.readBufferUsed = 0
+            os.set_blocking(fileno, False)
+        view = memoryview(self.readBuffer)
+        events = []
+        while True:
+            try:
+                count = os.readv(fileno, [view[self.readBufferUsed:]])
+            except BlockingIOError:
+                if events or not block:
+                    return events
+                try:
+                    select.select([fileno], [], [])
+                except (OSError, ValueError) as e:
+                    self.connected = False
+                    raise IOError('Gamepad %s disconnected: %s' % (self.joystickNumber, str(e)))
+                continue
+            except OSError as e:
+                self.connected = False
+                raise IOError('Gamepad %s disconnected: %s' % (self.joystickNumber, str(e)))
+            if count == 0:
+                self.connected = False
+                raise IOError('Gamepad %s disconnected' % self.joystickNumber)
+            available = self.readBufferUsed + count
+            complete = available - (available % self.eventSize)
+            frame = self.frame
+            for seconds, microseconds, eventType, code, value in struct.iter_unpack(EVENT_FORMAT, view[:complete]):
+                if eventType == EV_SYN:
+                    if code == SYN_REPORT:
+                        if self.dropping:
+                            # The end of the damaged frame, only now is the device state consistent
+                            self.dropping = False
+                            self.lastTimestampUs = seconds * 1000000 + microseconds
+                            resync = self._readDeviceState((seconds * 1000 + microseconds // 1000) & 0xFFFFFFFF)
+                            if self.recorder is not None and resync:
+                                self._recordFrame(resync)
+                            events.extend(resync)
+                            continue
+                        if self.recorder is not None and frame:
+                            self._recordFrame(frame)
+                        events.extend(frame)
+                        frame.clear()
+                        self.lastTimestampUs = seconds * 1000000 + microseconds
+                    elif code == SYN_DROPPED:
+                        # The kernel buffer overflowed, the partial frame cannot be trusted
+                        frame.clear()
+                        self.dropping = True
+                    continue
+                if self.dropping:
+                    continue
+                event = self._convertEvent(seconds, microseconds, eventType, code, value)
+                if event is not None:
+                    frame.append(event)
+            self.readBufferUsed = available - complete
+            view[:self.readBufferUsed] = view[complete:available]
+            if events:
+                return events
+
+    def _recordFrame(self, frame):
+        """Session logs hold joystick style events, so frames are recorded as the joystick driver would report them."""
+        records = bytearray()
+        for timestamp, value, eventType, index in frame:
+            value = int(round(max(Gamepad.MIN_AXIS, min(Gamepad.MAX_AXIS, value))))
+            records += struct.pack('IhBB', timestamp, value, eventType, index)
+        self.recorder.write(records)
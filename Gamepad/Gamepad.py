@@ -16,13 +16,116 @@ import sys
 import struct
 import time
 import threading
-import inspect
+import importlib
+import select
+import array
+import fcntl
+import collections
 
 def available(joystickNumber = 0):
     """Check if a joystick is connected and ready to use."""
     joystickPath = '/dev/input/js' + str(joystickNumber)
     return os.path.exists(joystickPath)
 
+class GamepadSnapshot:
+    """A consistent copy of every axis and button state of a Gamepad at one moment.
+
+    Filled in by Gamepad.snapshot, pass an existing snapshot back in to reuse it.
+    axes holds positions between -1.0 and +1.0 and buttons holds 1 when pressed,
+    both indexed by the raw axis / button number.
+    timestamp is the js timestamp (ms) of the newest event and readTime the
+    time.monotonic_ns at which it was read from the device."""
+    __slots__ = ('axes', 'buttons', 'timestamp', 'readTime', 'sequence', 'axisIndex', 'buttonIndex')
+
+    def __init__(self, axisIndex = None, buttonIndex = None):
+        self.axes = array.array('d')
+        self.buttons = array.array('B')
+        self.timestamp = 0
+        self.readTime = 0
+        self.sequence = 0
+        self.axisIndex = {} if axisIndex is None else axisIndex
+        self.buttonIndex = {} if buttonIndex is None else buttonIndex
+
+    def isPressed(self, buttonName):
+        """Returns the captured state of a button specified by name or index.
+
+        Throws ValueError if the button name or index cannot be found."""
+        try:
+            if buttonName in self.buttonIndex:
+                buttonIndex = self.buttonIndex[buttonName]
+            else:
+                buttonIndex = int(buttonName)
+            return self.buttons[buttonIndex] != 0
+        except IndexError:
+            raise ValueError('Button %i was not found' % buttonIndex)
+        except ValueError:
+            raise ValueError('Button name %s was not found' % buttonName)
+
+    def axis(self, axisName):
+        """Returns the captured position of an axis specified by name or index.
+
+        Throws ValueError if the axis name or index cannot be found."""
+        try:
+            if axisName in self.axisIndex:
+                axisIndex = self.axisIndex[axisName]
+            else:
+                axisIndex = int(axisName)
+            return self.axes[axisIndex]
+        except IndexError:
+            raise ValueError('Axis %i was not found' % axisIndex)
+        except ValueError:
+            raise ValueError('Axis name %s was not found' % axisName)
+
+class ButtonHandle:
+    """A gamepad button resolved once by Gamepad.buttonHandle.
+
+    The name lookup and validation happen when the handle is made, so reading
+    pressed or read(snapshot) afterwards is just an index into the state array."""
+    __slots__ = ('gamepad', 'name', 'index', 'state')
+
+    def __init__(self, gamepad, name, index):
+        self.gamepad = gamepad
+        self.name = name
+        self.index = index
+        self.state = gamepad.buttonState
+
+    @property
+    def pressed(self):
+        """True if the button is currently pressed."""
+        return self.state[self.index] != 0
+
+    def read(self, snapshot):
+        """Returns True if the button was pressed in a GamepadSnapshot."""
+        return snapshot.buttons[self.index] != 0
+
+    def __repr__(self):
+        return 'ButtonHandle(%r, %i)' % (self.name, self.index)
+
+class AxisHandle:
+    """A gamepad axis resolved once by Gamepad.axisHandle.
+
+    The name lookup and validation happen when the handle is made, so reading
+    position or read(snapshot) afterwards is just an index into the state array."""
+    __slots__ = ('gamepad', 'name', 'index', 'state')
+
+    def __init__(self, gamepad, name, index):
+        self.gamepad = gamepad
+        self.name = name
+        self.index = index
+        self.state = gamepad.axisState
+
+    @property
+    def position(self):
+        """The current position of the axis, between -1.0 and +1.0."""
+        return self.state[self.index]
+
+    def read(self, snapshot):
+        """Returns the position of the axis in a GamepadSnapshot."""
+        return snapshot.axes[self.index]
+
+    def __repr__(self):
+        return 'AxisHandle(%r, %i)' % (self.name, self.index)
+
 class Gamepad:
     EVENT_CODE_BUTTON = 0x01
     EVENT_CODE_AXIS = 0x02
@@ -32,24 +135,34 @@ class Gamepad:
     MAX_AXIS = +32767.0
     EVENT_BUTTON = 'BUTTON'
     EVENT_AXIS = 'AXIS'
+    MAX_BATCH_EVENTS = 512
+    JSIOCGAXES = 0x80016a11
+    JSIOCGBUTTONS = 0x80016a12
+    OPEN_ATTEMPTS = 5
     fullName = 'Generic (numbers only)'
+    devicePrefix = '/dev/input/js'
 
     class UpdateThread(threading.Thread):
         """Thread used to continually run the updateState function on a Gamepad in the background
 
         One of these is created by the Gamepad startBackgroundUpdates function and closed by stopBackgroundUpdates"""
-        def __init__(self, gamepad):
+        def __init__(self, gamepad, batched = False, coalesceAxes = False):
             threading.Thread.__init__(self)
             if isinstance(gamepad, Gamepad):
                 self.gamepad = gamepad
             else:
                 raise ValueError('Gamepad update thread was not created with a valid Gamepad object')
+            self.batched = batched
+            self.coalesceAxes = coalesceAxes
             self.running = True
 
         def run(self):
             try:
                 while self.running:
-                    self.gamepad.updateState()
+                    if self.batched:
+                        self.gamepad.updateStateBatch(self.coalesceAxes)
+                    else:
+                        self.gamepad.updateState()
                 self.gamepad = None
             except:
                 self.running = False
@@ -58,19 +171,18 @@ class Gamepad:
 
     def __init__(self, joystickNumber = 0):
         self.joystickNumber = str(joystickNumber)
-        self.joystickPath = '/dev/input/js' + self.joystickNumber
-        retryCount = 5
-        while True:
-            try:
-                self.joystickFile = open(self.joystickPath, 'rb')
-                break
-            except IOError as e:
-                retryCount -= 1
-                if retryCount > 0:
-                    time.sleep(0.5)
-                else:
-                    raise IOError('Could not open gamepad %s: %s' % (self.joystickNumber, str(e)))
+        self.joystickPath = self.devicePrefix + self.joystickNumber
+        self._openDevice()
         self.eventSize = struct.calcsize('IhBB')
+        self.readBuffer = None
+        self.readBufferUsed = 0
+        self.pendingEvents = collections.deque()
+        self.deviceAxisCount, self.deviceButtonCount = self._getDeviceSize()
+        self.axisState = array.array('d', bytes(8 * self.deviceAxisCount))
+        self.buttonState = array.array('B', bytes(self.deviceButtonCount))
+        self.stateTimestamp = 0
+        self.stateReadTime = 0
+        self.stateSequence = 0
         self.pressedMap = {}
         self.wasPressedMap = {}
         self.wasReleasedMap = {}
@@ -86,6 +198,9 @@ class Gamepad:
         self.releasedEventMap = {}
         self.changedEventMap = {}
         self.movedEventMap = {}
+        self.recorder = None
+        self.dispatcher = None
+        self.callbackErrorHandler = None
 
     def __del__(self):
         try:
@@ -93,31 +208,133 @@ class Gamepad:
         except AttributeError:
             pass
 
+    def _openDevice(self):
+        """Opens joystickPath as joystickFile, retrying for a while if it is not ready yet.
+        openAttempts, if set on the instance before __init__ runs, overrides OPEN_ATTEMPTS."""
+        retryCount = getattr(self, 'openAttempts', Gamepad.OPEN_ATTEMPTS)
+        while True:
+            try:
+                self.joystickFile = open(self.joystickPath, 'rb')
+                break
+            except IOError as e:
+                retryCount -= 1
+                if retryCount > 0:
+                    time.sleep(0.5)
+                else:
+                    raise IOError('Could not open gamepad %s: %s' % (self.joystickNumber, str(e)))
+
+    def _getDeviceSize(self):
+        """Returns the number of axes and buttons reported by the joystick driver.
+        Devices which cannot say, such as a pipe, report none and the state grows as events arrive."""
+        try:
+            count = bytearray(1)
+            fcntl.ioctl(self.joystickFile, Gamepad.JSIOCGAXES, count)
+            axisCount = count[0]
+            fcntl.ioctl(self.joystickFile, Gamepad.JSIOCGBUTTONS, count)
+            buttonCount = count[0]
+            return axisCount, buttonCount
+        except OSError:
+            return 0, 0
+
     def _setupReverseMaps(self):
         for index in self.buttonNames:
             self.buttonIndex[self.buttonNames[index]] = index
         for index in self.axisNames:
             self.axisIndex[self.axisNames[index]] = index
 
+    def _findButtonIndex(self, buttonName):
+        """Returns the raw index for a button specified by name, index or ButtonHandle.
+
+        Throws ValueError if the button name cannot be found."""
+        if buttonName in self.buttonIndex:
+            return self.buttonIndex[buttonName]
+        if isinstance(buttonName, ButtonHandle):
+            return buttonName.index
+        try:
+            return int(buttonName)
+        except (TypeError, ValueError):
+            raise ValueError('Button name %s was not found' % buttonName)
+
+    def _findAxisIndex(self, axisName):
+        """Returns the raw index for an axis specified by name, index or AxisHandle.
+
+        Throws ValueError if the axis name cannot be found."""
+        if axisName in self.axisIndex:
+            return self.axisIndex[axisName]
+        if isinstance(axisName, AxisHandle):
+            return axisName.index
+        try:
+            return int(axisName)
+        except (TypeError, ValueError):
+            raise ValueError('Axis name %s was not found' % axisName)
+
     def _getNextEventRaw(self):
         """Returns the next raw event from the gamepad.
 
         The return format is:
             timestamp (ms), value, event type code, axis / button number
+        Events are read through _getPendingEventsRaw, so mixing single and batched reads
+        sees every event once and in order.
         Throws an IOError if the gamepad is disconnected"""
-        if self.connected:
+        while not self.pendingEvents:
+            self.pendingEvents.extend(self._getPendingEventsRaw(block = True))
+        return self.pendingEvents.popleft()
+
+    def _getPendingEventsRaw(self, block = True):
+        """Returns a list of every raw event currently waiting on the gamepad.
+
+        All pending events are drained with a single non-blocking read into a reused buffer
+        and decoded in one pass, rather than one read and unpack per event.
+        When block is True this waits for at least one event, otherwise an empty list is
+        returned if nothing is waiting. Events already read ahead by _getNextEventRaw are
+        returned first. The device is read through its non-blocking file descriptor only,
+        never through joystickFile, whose buffered reads fail once the fd is non-blocking.
+
+        Each event has the same format as _getNextEventRaw.
+        Throws an IOError if the gamepad is disconnected"""
+        if self.pendingEvents:
+            events = list(self.pendingEvents)
+            self.pendingEvents.clear()
+            return events
+        if not self.connected:
+            raise IOError('Gamepad has been disconnected')
+        fileno = self.joystickFile.fileno()
+        if self.readBuffer is None:
+            self.readBuffer = bytearray(self.eventSize * Gamepad.MAX_BATCH_EVENTS)
+            self.readBufferUsed = 0
+            os.set_blocking(fileno, False)
+        view = memoryview(self.readBuffer)
+        while True:
             try:
-                rawEvent = self.joystickFile.read(self.eventSize)
-            except IOError as e:
+                count = os.readv(fileno, [view[self.readBufferUsed:]])
+            except BlockingIOError:
+                if not block:
+                    return []
+                try:
+                    select.select([fileno], [], [])
+                except (OSError, ValueError) as e:
+                    self.connected = False
+                    raise IOError('Gamepad %s disconnected: %s' % (self.joystickNumber, str(e)))
+                continue
+            except OSError as e:
                 self.connected = False
                 raise IOError('Gamepad %s disconnected: %s' % (self.joystickNumber, str(e)))
-            if rawEvent is None:
+            if count == 0:
                 self.connected = False
                 raise IOError('Gamepad %s disconnected' % self.joystickNumber)
-            else:
-                return struct.unpack('IhBB', rawEvent)
-        else:
-            raise IOError('Gamepad has been disconnected')
+            available = self.readBufferUsed + count
+            complete = available - (available % self.eventSize)
+            if complete == 0:
+                # Only part of an event arrived, keep it and wait for the rest
+                self.readBufferUsed = available
+                continue
+            if self.recorder is not None:
+                self.recorder.write(view[:complete])
+            events = list(struct.iter_unpack('IhBB', view[:complete]))
+            # Keep any partial trailing event for the next read
+            self.readBufferUsed = available - complete
+            view[:self.readBufferUsed] = view[complete:available]
+            return events
 
     def _rawEventToDescription(self, event):
         """Decodes the raw event from getNextEventRaw into a formatted string."""
@@ -176,67 +393,30 @@ class Gamepad:
         After each call the internal state used by getPressed and getAxis is updated.
 
         Throws an IOError if the gamepad is disconnected"""
-        self.lastTimestamp, value, eventType, index = self._getNextEventRaw()
+        event = self._getNextEventRaw()
+        self.lastTimestamp, value, eventType, index = event
+        self._storeEvents((event,))
+        self._applyEvent(value, eventType, index)
         skip = False
         eventName = None
         entityName = None
         finalValue = None
-        if eventType == Gamepad.EVENT_CODE_BUTTON:
+        if eventType == Gamepad.EVENT_CODE_BUTTON or eventType == Gamepad.EVENT_CODE_INIT_BUTTON:
             eventName = Gamepad.EVENT_BUTTON
             if index in self.buttonNames:
                 entityName = self.buttonNames[index]
             else:
                 entityName = index
-            if value == 0:
-                finalValue = False
-                self.wasReleasedMap[index] = True
-                for callback in self.releasedEventMap[index]:
-                    callback()
-            else:
-                finalValue = True
-                self.wasPressedMap[index] = True
-                for callback in self.pressedEventMap[index]:
-                    callback()
-            self.pressedMap[index] = finalValue
-            for callback in self.changedEventMap[index]:
-                callback(finalValue)
-        elif eventType == Gamepad.EVENT_CODE_AXIS:
+            finalValue = self.pressedMap[index]
+            skip = skipInit and eventType == Gamepad.EVENT_CODE_INIT_BUTTON
+        elif eventType == Gamepad.EVENT_CODE_AXIS or eventType == Gamepad.EVENT_CODE_INIT_AXIS:
             eventName = Gamepad.EVENT_AXIS
             if index in self.axisNames:
                 entityName = self.axisNames[index]
             else:
                 entityName = index
-            finalValue = value / Gamepad.MAX_AXIS
-            self.axisMap[index] = finalValue
-            for callback in self.movedEventMap[index]:
-                callback(finalValue)
-        elif eventType == Gamepad.EVENT_CODE_INIT_BUTTON:
-            eventName = Gamepad.EVENT_BUTTON
-            if index in self.buttonNames:
-                entityName = self.buttonNames[index]
-            else:
-                entityName = index
-            if value == 0:
-                finalValue = False
-            else:
-                finalValue = True
-            self.pressedMap[index] = finalValue
-            self.wasPressedMap[index] = False
-            self.wasReleasedMap[index] = False
-            self.pressedEventMap[index] = []
-            self.releasedEventMap[index] = []
-            self.changedEventMap[index] = []
-            skip = skipInit
-        elif eventType == Gamepad.EVENT_CODE_INIT_AXIS:
-            eventName = Gamepad.EVENT_AXIS
-            if index in self.axisNames:
-                entityName = self.axisNames[index]
-            else:
-                entityName = index
-            finalValue = value / Gamepad.MAX_AXIS
-            self.axisMap[index] = finalValue
-            self.movedEventMap[index] = []
-            skip = skipInit
+            finalValue = self.axisMap[index]
+            skip = skipInit and eventType == Gamepad.EVENT_CODE_INIT_AXIS
         else:
             skip = True
 
@@ -245,30 +425,74 @@ class Gamepad:
         else:
             return eventName, entityName, finalValue
 
-    def updateState(self):
-        """Updates the internal button and axis states with the next pending event.
+    def _storeEvents(self, events):
+        """Writes raw events into the array backed state read by snapshot.
 
-        This call waits for a new event if there are not any waiting to be processed."""
-        self.lastTimestamp, value, eventType, index = self._getNextEventRaw()
+        The whole group is written inside one seqlock update so a snapshot sees
+        either none or all of it."""
+        axes = self.axisState
+        buttons = self.buttonState
+        readTime = time.monotonic_ns()
+        self.stateSequence += 1
+        try:
+            for timestamp, value, eventType, index in events:
+                eventType &= ~0x80
+                if eventType == Gamepad.EVENT_CODE_AXIS:
+                    if index >= len(axes):
+                        axes.frombytes(bytes(8 * (index + 1 - len(axes))))
+                    axes[index] = value / Gamepad.MAX_AXIS
+                elif eventType == Gamepad.EVENT_CODE_BUTTON:
+                    if index >= len(buttons):
+                        buttons.frombytes(bytes(index + 1 - len(buttons)))
+                    buttons[index] = value != 0
+                self.stateTimestamp = timestamp
+            self.stateReadTime = readTime
+        finally:
+            self.stateSequence += 1
+
+    def _runCallbacks(self, callbacks, args):
+        """Calls each event callback with args.
+        An exception from one is passed to callbackErrorHandler if set, so the rest still run,
+        otherwise it is raised."""
+        for callback in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                if self.callbackErrorHandler is None:
+                    raise
+                self.callbackErrorHandler(self, callback, e)
+
+    def _applyEvent(self, value, eventType, index):
+        """Updates the internal button and axis states and runs any callbacks for one raw event.
+        With a dispatcher set the callbacks are queued for it instead of being run here."""
         if eventType == Gamepad.EVENT_CODE_BUTTON:
+            dispatcher = self.dispatcher
             if value == 0:
                 finalValue = False
                 self.wasReleasedMap[index] = True
-                for callback in self.releasedEventMap[index]:
-                    callback()
+                if dispatcher is None:
+                    self._runCallbacks(self.releasedEventMap[index], ())
+                else:
+                    dispatcher.submitAll(self.releasedEventMap[index], (), Gamepad.EVENT_BUTTON, index)
             else:
                 finalValue = True
                 self.wasPressedMap[index] = True
-                for callback in self.pressedEventMap[index]:
-                    callback()
+                if dispatcher is None:
+                    self._runCallbacks(self.pressedEventMap[index], ())
+                else:
+                    dispatcher.submitAll(self.pressedEventMap[index], (), Gamepad.EVENT_BUTTON, index)
             self.pressedMap[index] = finalValue
-            for callback in self.changedEventMap[index]:
-                callback(finalValue)
+            if dispatcher is None:
+                self._runCallbacks(self.changedEventMap[index], (finalValue,))
+            else:
+                dispatcher.submitAll(self.changedEventMap[index], (finalValue,), Gamepad.EVENT_BUTTON, index)
         elif eventType == Gamepad.EVENT_CODE_AXIS:
             finalValue = value / Gamepad.MAX_AXIS
             self.axisMap[index] = finalValue
-            for callback in self.movedEventMap[index]:
-                callback(finalValue)
+            if self.dispatcher is None:
+                self._runCallbacks(self.movedEventMap[index], (finalValue,))
+            else:
+                self.dispatcher.submitAll(self.movedEventMap[index], (finalValue,), Gamepad.EVENT_AXIS, index)
         elif eventType == Gamepad.EVENT_CODE_INIT_BUTTON:
             if value == 0:
                 finalValue = False
@@ -277,27 +501,70 @@ class Gamepad:
             self.pressedMap[index] = finalValue
             self.wasPressedMap[index] = False
             self.wasReleasedMap[index] = False
-            self.pressedEventMap[index] = []
-            self.releasedEventMap[index] = []
-            self.changedEventMap[index] = []
+            # Keep any handlers already there, such as those carried over by Hotplug.reconnect
+            self.pressedEventMap.setdefault(index, [])
+            self.releasedEventMap.setdefault(index, [])
+            self.changedEventMap.setdefault(index, [])
         elif eventType == Gamepad.EVENT_CODE_INIT_AXIS:
             finalValue = value / Gamepad.MAX_AXIS
             self.axisMap[index] = finalValue
-            self.movedEventMap[index] = []
+            self.movedEventMap.setdefault(index, [])
+
+    def updateState(self):
+        """Updates the internal button and axis states with the next pending event.
 
-    def startBackgroundUpdates(self, waitForReady = True):
+        This call waits for a new event if there are not any waiting to be processed."""
+        event = self._getNextEventRaw()
+        self.lastTimestamp, value, eventType, index = event
+        self._storeEvents((event,))
+        self._applyEvent(value, eventType, index)
+
+    def updateStateBatch(self, coalesceAxes = False, block = True):
+        """Updates the internal button and axis states with every pending event in one go.
+
+        When coalesceAxes is True repeated movements of the same axis within the batch are
+        folded into the latest position, so axisMap and the moved callbacks only see the
+        final value. Button events are never folded.
+
+        When block is True this waits for at least one event, otherwise it returns straight away.
+        Returns the number of events read, including any folded away.
+
+        May be mixed with getNextEvent and updateState on the same gamepad, events
+        read ahead by one are returned by the next call of any of them"""
+        events = self._getPendingEventsRaw(block)
+        if events:
+            self._storeEvents(events)
+        if coalesceAxes and len(events) > 1:
+            latest = {}
+            for position, event in enumerate(events):
+                if event[2] == Gamepad.EVENT_CODE_AXIS:
+                    latest[event[3]] = position
+            for position, (timestamp, value, eventType, index) in enumerate(events):
+                if eventType == Gamepad.EVENT_CODE_AXIS and latest[index] != position:
+                    continue
+                self.lastTimestamp = timestamp
+                self._applyEvent(value, eventType, index)
+        else:
+            for timestamp, value, eventType, index in events:
+                self.lastTimestamp = timestamp
+                self._applyEvent(value, eventType, index)
+        return len(events)
+
+    def startBackgroundUpdates(self, waitForReady = True, batched = False, coalesceAxes = False):
         """Starts a background thread which keeps the gamepad state updated automatically.
         This allows for asynchronous gamepad updates and event callback code.
 
+        When batched is True the thread uses updateStateBatch, see that for coalesceAxes.
+
         Do not use with getNextEvent"""
         if self.updateThread is not None:
             if self.updateThread.running:
                 raise RuntimeError('Called startBackgroundUpdates when the update thread is already running')
-        self.updateThread = Gamepad.UpdateThread(self)
+        self.updateThread = Gamepad.UpdateThread(self, batched, coalesceAxes)
         self.updateThread.start()
         if waitForReady:
             while not self.isReady() and self.connected:
-                time.sleep(1.0)
+                time.sleep(0.01)
 
     def stopBackgroundUpdates(self):
         """Stops the background thread which keeps the gamepad state updated automatically.
@@ -307,6 +574,50 @@ class Gamepad:
         if self.updateThread is not None:
             self.updateThread.running = False
 
+    def snapshot(self, snapshot = None):
+        """Returns every axis and button state as one consistent GamepadSnapshot.
+
+        Unlike several axis / isPressed calls, all of the values come from the same
+        moment, even while a background thread is updating the state.
+        Pass a previous snapshot in to refill it rather than allocating a new one."""
+        if snapshot is None:
+            snapshot = GamepadSnapshot(self.axisIndex, self.buttonIndex)
+        while True:
+            sequence = self.stateSequence
+            if sequence & 1:
+                # Part way through an update, let the writer finish
+                time.sleep(0)
+                continue
+            snapshot.axes[:] = self.axisState
+            snapshot.buttons[:] = self.buttonState
+            snapshot.timestamp = self.stateTimestamp
+            snapshot.readTime = self.stateReadTime
+            if self.stateSequence == sequence:
+                snapshot.sequence = sequence
+                return snapshot
+
+    def setDispatcher(self, dispatcher):
+        """Runs the event callbacks through a Dispatcher.CallbackDispatcher instead of on the update thread.
+        The dispatcher is started if needed. Pass None to go back to running callbacks directly."""
+        if dispatcher is not None:
+            dispatcher.start()
+        self.dispatcher = dispatcher
+
+    def startRecording(self, logPath):
+        """Starts saving every raw event read from the gamepad to a session log.
+        The log can be played back later with Recording.ReplayGamepad."""
+        from Gamepad.Recording import SessionRecorder
+        self.stopRecording()
+        self.recorder = SessionRecorder(logPath)
+
+    def stopRecording(self):
+        """Stops saving events started by startRecording.
+        This may be called even if recording was never started."""
+        if self.recorder is not None:
+            recorder = self.recorder
+            self.recorder = None
+            recorder.close()
+
     def isReady(self):
         """Used with updateState to indicate that the gamepad is now ready for use.
 
@@ -327,27 +638,19 @@ class Gamepad:
         Status is updated by getNextEvent calls.
 
         Throws ValueError if the button name or index cannot be found."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             return self.pressedMap[buttonIndex]
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def beenPressed(self, buttonName):
         """Returns True if the button specified by name or index has been pressed since the last beenPressed call.
         Used in conjunction with updateState.
 
         Throws ValueError if the button name or index cannot be found."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if self.wasPressedMap[buttonIndex]:
                 self.wasPressedMap[buttonIndex] = False
                 return True
@@ -355,19 +658,14 @@ class Gamepad:
                 return False
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def beenReleased(self, buttonName):
         """Returns True if the button specified by name or index has been released since the last beenReleased call.
         Used in conjunction with updateState.
 
         Throws ValueError if the button name or index cannot be found."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if self.wasReleasedMap[buttonIndex]:
                 self.wasReleasedMap[buttonIndex] = False
                 return True
@@ -375,8 +673,6 @@ class Gamepad:
                 return False
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def axis(self, axisName):
         """Returns the last observed state of a gamepad axis specified by name or index.
@@ -385,16 +681,37 @@ class Gamepad:
         Status is updated by getNextEvent calls.
 
         Throws ValueError if the button name or index cannot be found."""
+        axisIndex = self._findAxisIndex(axisName)
         try:
-            if axisName in self.axisIndex:
-                axisIndex = self.axisIndex[axisName]
-            else:
-                axisIndex = int(axisName)
             return self.axisMap[axisIndex]
         except KeyError:
             raise ValueError('Axis %i was not found' % axisIndex)
-        except ValueError:
-            raise ValueError('Axis name %s was not found' % axisName)
+
+    def buttonHandle(self, buttonName):
+        """Resolves a button specified by name or index into a ButtonHandle.
+        Use this for buttons read every loop, the handle skips the lookups isPressed does per call.
+
+        Throws ValueError if the button name or index cannot be found."""
+        buttonIndex = self._findButtonIndex(buttonName)
+        if buttonIndex < 0 or (self.deviceButtonCount and buttonIndex >= self.deviceButtonCount):
+            raise ValueError('Button %i was not found' % buttonIndex)
+        if buttonIndex >= len(self.buttonState):
+            # Not reported yet, make room so the handle always has a state to read
+            self._storeEvents(((self.stateTimestamp, 0, Gamepad.EVENT_CODE_INIT_BUTTON, buttonIndex),))
+        return ButtonHandle(self, buttonName, buttonIndex)
+
+    def axisHandle(self, axisName):
+        """Resolves an axis specified by name or index into an AxisHandle.
+        Use this for axes read every loop, the handle skips the lookups axis does per call.
+
+        Throws ValueError if the axis name or index cannot be found."""
+        axisIndex = self._findAxisIndex(axisName)
+        if axisIndex < 0 or (self.deviceAxisCount and axisIndex >= self.deviceAxisCount):
+            raise ValueError('Axis %i was not found' % axisIndex)
+        if axisIndex >= len(self.axisState):
+            # Not reported yet, make room so the handle always has a state to read
+            self._storeEvents(((self.stateTimestamp, 0, Gamepad.EVENT_CODE_INIT_AXIS, axisIndex),))
+        return AxisHandle(self, axisName, axisIndex)
 
     def availableButtonNames(self):
         """Returns a list of available button names for this gamepad.
@@ -413,118 +730,78 @@ class Gamepad:
     def addButtonPressedHandler(self, buttonName, callback):
         """Adds a callback for when a specific button specified by name or index is pressed.
         This callback gets no parameters passed."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if callback not in self.pressedEventMap[buttonIndex]:
                 self.pressedEventMap[buttonIndex].append(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def removeButtonPressedHandler(self, buttonName, callback):
         """Removes a callback for when a specific button specified by name or index is pressed."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if callback in self.pressedEventMap[buttonIndex]:
                 self.pressedEventMap[buttonIndex].remove(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def addButtonReleasedHandler(self, buttonName, callback):
         """Adds a callback for when a specific button specified by name or index is released.
         This callback gets no parameters passed."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if callback not in self.releasedEventMap[buttonIndex]:
                 self.releasedEventMap[buttonIndex].append(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def removeButtonReleasedHandler(self, buttonName, callback):
         """Removes a callback for when a specific button specified by name or index is released."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if callback in self.releasedEventMap[buttonIndex]:
                 self.releasedEventMap[buttonIndex].remove(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def addButtonChangedHandler(self, buttonName, callback):
         """Adds a callback for when a specific button specified by name or index changes.
         This callback gets a boolean for the button pressed state."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if callback not in self.changedEventMap[buttonIndex]:
                 self.changedEventMap[buttonIndex].append(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def removeButtonChangedHandler(self, buttonName, callback):
         """Removes a callback for when a specific button specified by name or index changes."""
+        buttonIndex = self._findButtonIndex(buttonName)
         try:
-            if buttonName in self.buttonIndex:
-                buttonIndex = self.buttonIndex[buttonName]
-            else:
-                buttonIndex = int(buttonName)
             if callback in self.changedEventMap[buttonIndex]:
                 self.changedEventMap[buttonIndex].remove(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % buttonIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % buttonName)
 
     def addAxisMovedHandler(self, axisName, callback):
         """Adds a callback for when a specific axis specified by name or index changes.
         This callback gets the updated position of the axis."""
+        axisIndex = self._findAxisIndex(axisName)
         try:
-            if axisName in self.axisIndex:
-                axisIndex = self.axisIndex[axisName]
-            else:
-                axisIndex = int(axisName)
             if callback not in self.movedEventMap[axisIndex]:
                 self.movedEventMap[axisIndex].append(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % axisIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % axisName)
 
     def removeAxisMovedHandler(self, axisName, callback):
         """Removes a callback for when a specific axis specified by name or index changes."""
+        axisIndex = self._findAxisIndex(axisName)
         try:
-            if axisName in self.axisIndex:
-                axisIndex = self.axisIndex[axisName]
-            else:
-                axisIndex = int(axisName)
             if callback in self.movedEventMap[axisIndex]:
                 self.movedEventMap[axisIndex].remove(callback)
         except KeyError:
             raise ValueError('Button %i was not found' % axisIndex)
-        except ValueError:
-            raise ValueError('Button name %s was not found' % axisName)
 
     def removeAllEventHandlers(self):
         """Removes all event handlers from all axes and buttons."""
@@ -539,24 +816,89 @@ class Gamepad:
         self.connected = False
         self.removeAllEventHandlers()
         self.stopBackgroundUpdates()
+        self.stopRecording()
         del self.joystickFile
 
-###########################
-# Import gamepad mappings #
-###########################
-scriptDir = os.path.dirname(os.path.realpath(__file__))
-controllerScript = os.path.join(scriptDir, "Controllers.py")
-exec(open(controllerScript).read())
-
-# Generate a list of available gamepad types
-moduleDict = globals()
-classList = [moduleDict[a] for a in moduleDict.keys() if inspect.isclass(moduleDict[a])]
-controllerDict = {}
-deviceNames = []
-for gamepad in classList:
-    controllerDict[gamepad.__name__.upper()] = gamepad
-    deviceNames.append(gamepad.__name__)
-deviceNames.sort()
+###############################
+# Registry of gamepad mappings #
+###############################
+class ControllerMapping:
+    """The axis and button names for one type of gamepad, as registered with registerController."""
+    __slots__ = ('name', 'fullName', 'axisNames', 'buttonNames', 'gamepadClass')
+
+    def __init__(self, name, fullName, axisNames, buttonNames):
+        self.name = name
+        self.fullName = fullName
+        self.axisNames = axisNames
+        self.buttonNames = buttonNames
+        self.gamepadClass = None
+
+# Modules which register the standard mappings, only imported when a mapping is first asked for
+controllerModules = ['Gamepad.Controllers']
+controllerMappings = {}
+_controllerModulesLoaded = False
+
+def registerController(name, fullName, axisNames, buttonNames):
+    """Registers the axis and button names for a type of gamepad.
+
+    axisNames and buttonNames map the raw index numbers to capitalised names.
+    The Gamepad class for the mapping is built the first time controllerClass asks for it."""
+    controllerMappings[name.upper()] = ControllerMapping(name, fullName, axisNames, buttonNames)
+
+def _loadControllerModules():
+    global _controllerModulesLoaded
+    if not _controllerModulesLoaded:
+        _controllerModulesLoaded = True
+        for moduleName in controllerModules:
+            importlib.import_module(moduleName)
+
+def controllerMapping(name):
+    """Returns the registered ControllerMapping for a gamepad type name, in any case.
+
+    Throws ValueError if there is no mapping with that name."""
+    _loadControllerModules()
+    try:
+        return controllerMappings[name.upper()]
+    except KeyError:
+        raise ValueError('Gamepad type %s was not found' % name)
+
+def controllerClass(name):
+    """Returns the Gamepad class for a gamepad type name, in any case.
+    'Gamepad' gives the generic class with no names.
+
+    Throws ValueError if there is no mapping with that name."""
+    if name.upper() == 'GAMEPAD':
+        return Gamepad
+    mapping = controllerMapping(name)
+    if mapping.gamepadClass is None:
+        def __init__(self, joystickNumber = 0):
+            Gamepad.__init__(self, joystickNumber)
+            self.axisNames = dict(mapping.axisNames)
+            self.buttonNames = dict(mapping.buttonNames)
+            self._setupReverseMaps()
+        mapping.gamepadClass = type(mapping.name, (Gamepad,), {
+            '__init__': __init__,
+            '__module__': 'Gamepad.Controllers',
+            '__doc__': mapping.fullName,
+            'fullName': mapping.fullName,
+        })
+    return mapping.gamepadClass
+
+def controllerNames():
+    """Returns a sorted list of the available gamepad type names, without building their classes."""
+    _loadControllerModules()
+    return sorted(['Gamepad'] + [mapping.name for mapping in controllerMappings.values()])
+
+def __getattr__(name):
+    # Compatibility with the names this module used to fill in when it read Controllers.py itself
+    if name == 'deviceNames':
+        return controllerNames()
+    if name == 'controllerDict':
+        return dict((deviceName.upper(), controllerClass(deviceName)) for deviceName in controllerNames())
+    try:
+        return controllerClass(name)
+    except ValueError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 ##################################################################
 # When this script is run it provides testing code for a gamepad #
@@ -579,10 +921,13 @@ if __name__ == "__main__":
     print('Gamepad axis and button events...')
     print('Press CTRL+C to exit')
     print('')
+    # The mappings register with the importable copy of this module
+    import Gamepad.Gamepad as registry
+
     print('Available device names:')
     formatString = '    ' + GREEN + '%s' + RESET + ' - ' + CYAN + '%s' + RESET
-    for device in deviceNames:
-        print(formatString % (device, controllerDict[device.upper()].fullName))
+    for device in registry.controllerNames():
+        print(formatString % (device, registry.controllerClass(device).fullName))
     print('')
     print('What device name are you using (leave blank if not in the list)')
     device = input('? ' + GREEN).strip().upper()
@@ -591,14 +936,14 @@ if __name__ == "__main__":
     # Wait for a connection
     if not available():
         print('Please connect your gamepad...')
-        while not available():
-            time.sleep(1.0)
+        from Gamepad.Hotplug import HotplugWatcher
+        HotplugWatcher().waitForDevice('js0')
     print('Gamepad connected')
 
     # Pick the correct class
-    if device in controllerDict:
-        print(controllerDict[device].fullName)
-        gamepad = controllerDict[device]()
+    if device in [name.upper() for name in registry.controllerNames()]:
+        print(registry.controllerClass(device).fullName)
+        gamepad = registry.controllerClass(device)()
     elif device == '':
         print('Unspecified gamepad')
         print('')
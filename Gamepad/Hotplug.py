@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Watches /dev/input with inotify so gamepads can be picked up the moment they appear.
+
+Rather than polling Gamepad.available once a second, a HotplugWatcher sleeps
+until the kernel reports a change in the directory, so a device node is seen
+within milliseconds of udev creating it (and making it readable).
+
+Wait for a gamepad to be plugged in:
+    watcher = HotplugWatcher()
+    watcher.waitForDevice('js0')
+
+Carry on after a dropout with a fresh gamepad of the same type, keeping its event handlers:
+    if not gamepad.isConnected():
+        gamepad = watcher.reconnect(gamepad, idle = stopMotors)
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = 'iIII'
+EVENT_HEADER_SIZE = struct.calcsize(EVENT_HEADER)
+
+_libc = None
+
+def _loadLibc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return _libc
+
+
+class HotplugWatcher:
+    def __init__(self, directory = '/dev/input'):
+        libc = _loadLibc()
+        self.directory = directory
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, 'inotify_init1 failed: %s' % os.strerror(error))
+        mask = IN_CREATE | IN_ATTRIB | IN_DELETE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, directory.encode(), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            self.fd = None
+            raise OSError(error, 'Could not watch %s: %s' % (directory, os.strerror(error)))
+
+    def __del__(self):
+        self.close()
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if getattr(self, 'fd', None) is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def readChanges(self, timeout = None):
+        """Waits up to timeout seconds (None for ever) for changes in the directory.
+        Returns a list of (name, mask) tuples, empty if the timeout ran out."""
+        if timeout is not None and timeout < 0:
+            timeout = 0
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except InterruptedError:
+            ready = []
+        if not ready:
+            return []
+        changes = []
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return changes
+            offset = 0
+            while offset + EVENT_HEADER_SIZE <= len(data):
+                wd, mask, cookie, length = struct.unpack_from(EVENT_HEADER, data, offset)
+                offset += EVENT_HEADER_SIZE
+                name = data[offset:offset + length].split(b'\0', 1)[0].decode(errors = 'replace')
+                offset += length
+                changes.append((name, mask))
+
+    def isDeviceReady(self, name):
+        """Returns True if the device node exists and we are allowed to read it.
+        udev usually fixes the permissions just after creating the node."""
+        return os.access(os.path.join(self.directory, name), os.R_OK)
+
+    def waitForDevice(self, name, timeout = None, idle = None, idleInterval = 0.05):
+        """Waits for a device node such as 'js0' to be ready to open.
+
+        idle is called straight away and then every idleInterval seconds while waiting,
+        for example to keep sending stop commands to motors.
+        Returns True once the device is ready, False if timeout seconds pass first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        nextIdle = time.monotonic()
+        while True:
+            if self.isDeviceReady(name):
+                return True
+            now = time.monotonic()
+            if idle is not None and now >= nextIdle:
+                idle()
+                nextIdle = now + idleInterval
+            wait = None
+            if deadline is not None:
+                if now >= deadline:
+                    return False
+                wait = deadline - now
+            if idle is not None:
+                wait = max(0.0, nextIdle - now) if wait is None else min(wait, max(0.0, nextIdle - now))
+            self.readChanges(wait)
+
+    def reconnect(self, gamepad, timeout = None, idle = None, idleInterval = 0.05):
+        """Waits for a disconnected gamepad's device to come back, then returns a new gamepad for it.
+
+        The new gamepad is the same class, so it has the same names, and takes over the
+        event handlers, dispatcher and any recording from the old one. If the old gamepad
+        had background updates running they are started on the new one.
+        The old gamepad is disconnected. The class must be one made from just the
+        joystick number, such as Gamepad or the Controllers classes.
+
+        idle and idleInterval are as for waitForDevice.
+        Returns None if timeout seconds pass without the device coming back."""
+        if os.path.dirname(gamepad.joystickPath) != os.path.normpath(self.directory):
+            raise ValueError('Gamepad %s is not in the watched directory %s' % (gamepad.joystickPath, self.directory))
+        updateThread = gamepad.updateThread
+        gamepad.stopBackgroundUpdates()
+        name = os.path.basename(gamepad.joystickPath)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        gamepadClass = type(gamepad)
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not self.waitForDevice(name, remaining, idle, idleInterval):
+                return None
+            # A single attempt, the retries in Gamepad._openDevice would sleep without calling idle
+            replacement = gamepadClass.__new__(gamepadClass)
+            replacement.openAttempts = 1
+            try:
+                replacement.__init__(gamepad.joystickNumber)
+                break
+            except IOError:
+                # Vanished again, or there but not openable yet, so wait for the next change to it
+                if idle is not None:
+                    idle()
+                wait = idleInterval if idle is not None else 0.5
+                if deadline is not None:
+                    if time.monotonic() >= deadline:
+                        return None
+                    wait = min(wait, deadline - time.monotonic())
+                self.readChanges(wait)
+        del replacement.openAttempts
+        # Initial state events from the new device keep these, see Gamepad._applyEvent
+        for mapName in ('pressedEventMap', 'releasedEventMap', 'changedEventMap', 'movedEventMap'):
+            handlerMap = dict((index, list(callbacks)) for index, callbacks in getattr(gamepad, mapName).items())
+            setattr(replacement, mapName, handlerMap)
+        replacement.dispatcher = gamepad.dispatcher
+        replacement.recorder = gamepad.recorder
+        gamepad.recorder = None
+        gamepad.disconnect()
+        if updateThread is not None:
+            replacement.startBackgroundUpdates(True, updateThread.batched, updateThread.coalesceAxes)
+        return replacement
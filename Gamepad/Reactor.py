@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Keeps any number of gamepads updated from a single background thread.
+
+Rather than each gamepad running its own UpdateThread blocked in read, every
+registered gamepad is watched by one selectors (epoll on Linux) loop which
+drains whichever devices have events waiting with updateStateBatch.
+A wake-up pipe lets register, unregister and stop take effect immediately
+instead of on the next event from a device.
+
+An exception from an event callback of a registered gamepad is printed and
+counted against that gamepad (see callbackErrors), and its other callbacks still
+run, so one faulty callback cannot stop every gamepad being updated.
+
+Example:
+    driver = Controllers.Joystick(0)
+    safety = Controllers.PS4(1)
+    reactor = InputReactor()
+    reactor.register(driver)
+    reactor.register(safety)
+    reactor.start()
+    ...
+    reactor.stop()
+"""
+
+import os
+import selectors
+import sys
+import threading
+import time
+import traceback
+
+from Gamepad.Gamepad import Gamepad
+
+
+class InputReactor:
+    def __init__(self, coalesceAxes = False):
+        self.coalesceAxes = coalesceAxes
+        self.selector = selectors.DefaultSelector()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        os.set_blocking(self.wakeRead, False)
+        os.set_blocking(self.wakeWrite, False)
+        self.selector.register(self.wakeRead, selectors.EVENT_READ, None)
+        self.lock = threading.Lock()
+        self.pendingChanges = []
+        self.gamepads = []
+        self.disconnectedHandlers = []
+        self.callbackErrors = {}
+        self.thread = None
+        self.running = False
+
+    def __del__(self):
+        try:
+            os.close(self.wakeRead)
+            os.close(self.wakeWrite)
+        except (AttributeError, OSError):
+            pass
+
+    def _wake(self):
+        try:
+            os.write(self.wakeWrite, b'\0')
+        except BlockingIOError:
+            # The pipe is already full so the loop is due to wake anyway
+            pass
+
+    def _drainWake(self):
+        try:
+            while os.read(self.wakeRead, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _applyChanges(self):
+        with self.lock:
+            changes = self.pendingChanges
+            self.pendingChanges = []
+        for adding, gamepad in changes:
+            if adding:
+                if gamepad not in self.gamepads:
+                    self.selector.register(gamepad.joystickFile, selectors.EVENT_READ, gamepad)
+                    self.gamepads.append(gamepad)
+                    gamepad.callbackErrorHandler = self._callbackFailed
+            elif gamepad in self.gamepads:
+                self._remove(gamepad)
+
+    def _remove(self, gamepad):
+        self.selector.unregister(gamepad.joystickFile)
+        self.gamepads.remove(gamepad)
+        if gamepad.callbackErrorHandler == self._callbackFailed:
+            gamepad.callbackErrorHandler = None
+
+    def _callbackFailed(self, gamepad, callback, error):
+        """Reports an exception raised by a callback for a registered gamepad, then carries on."""
+        self.callbackErrors[gamepad] = self.callbackErrors.get(gamepad, 0) + 1
+        sys.stderr.write('Callback %r for gamepad %s raised:\n' % (callback, gamepad.joystickNumber))
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    def register(self, gamepad):
+        """Adds a gamepad to be kept updated by the reactor.
+        This may be called from any thread, before or after start.
+
+        Do not use with startBackgroundUpdates, getNextEvent or updateState on the same gamepad"""
+        if not isinstance(gamepad, Gamepad):
+            raise ValueError('Only Gamepad objects can be registered with the reactor')
+        if gamepad.updateThread is not None and gamepad.updateThread.running:
+            raise RuntimeError('Gamepad %s already has a background update thread running' % gamepad.joystickNumber)
+        with self.lock:
+            self.pendingChanges.append((True, gamepad))
+        if self.running:
+            self._wake()
+        else:
+            self._applyChanges()
+
+    def unregister(self, gamepad):
+        """Stops updating a gamepad.
+        This may be called from any thread, including from an event callback."""
+        with self.lock:
+            self.pendingChanges.append((False, gamepad))
+        if self.running:
+            self._wake()
+        else:
+            self._applyChanges()
+
+    def addDisconnectedHandler(self, callback):
+        """Adds a callback for when a registered gamepad stops responding.
+        The gamepad is unregistered first, then the callback is passed the gamepad object."""
+        if callback not in self.disconnectedHandlers:
+            self.disconnectedHandlers.append(callback)
+
+    def removeDisconnectedHandler(self, callback):
+        """Removes a callback added with addDisconnectedHandler."""
+        if callback in self.disconnectedHandlers:
+            self.disconnectedHandlers.remove(callback)
+
+    def isReady(self):
+        """Returns True once every registered gamepad is ready for use."""
+        with self.lock:
+            pending = [gamepad for adding, gamepad in self.pendingChanges if adding]
+        for gamepad in self.gamepads + pending:
+            if gamepad.connected and not gamepad.isReady():
+                return False
+        return True
+
+    def run(self):
+        """Runs the update loop on the calling thread until stop is called."""
+        self.running = True
+        self._loop()
+
+    def _loop(self):
+        try:
+            while self.running:
+                for key, mask in self.selector.select():
+                    gamepad = key.data
+                    if gamepad is None:
+                        self._drainWake()
+                        continue
+                    if gamepad not in self.gamepads:
+                        # Unregistered earlier in this pass
+                        continue
+                    try:
+                        gamepad.updateStateBatch(self.coalesceAxes, block = False)
+                    except IOError:
+                        self._remove(gamepad)
+                        for callback in list(self.disconnectedHandlers):
+                            try:
+                                callback(gamepad)
+                            except Exception as e:
+                                self._callbackFailed(gamepad, callback, e)
+                self._applyChanges()
+        finally:
+            self.running = False
+
+    def start(self, waitForReady = True):
+        """Starts a background thread which keeps every registered gamepad updated."""
+        if self.thread is not None and self.thread.is_alive():
+            raise RuntimeError('Called start when the reactor thread is already running')
+        self.running = True
+        self.thread = threading.Thread(target = self._loop, name = 'InputReactor', daemon = True)
+        self.thread.start()
+        if waitForReady:
+            while self.running and not self.isReady():
+                time.sleep(0.01)
+
+    def stop(self, timeout = None):
+        """Stops the background thread.
+        Unlike Gamepad.stopBackgroundUpdates this does not wait for another event to arrive.
+
+        Registered gamepads stay registered, so start may be called again later."""
+        self.running = False
+        self._wake()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.thread = None
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Records gamepad sessions to a compact log and plays them back.
+
+The log is the raw 'IhBB' event stream exactly as read from /dev/input/jsN,
+after an 8 byte header. Every ANCHOR_INTERVAL seconds an anchor is written
+before the events: an 'IhBB' record with the ANCHOR event type holding the js
+timestamp, followed by the wall clock time in nanoseconds as a 'q'.
+All records stay 8 bytes long.
+
+Record while using a gamepad normally:
+    gamepad.startRecording('session.jslog')
+
+Play a session back through any controller mapping, in real time or as fast as possible:
+    joystick = ReplayGamepad('session.jslog', 'Joystick', speed = None)
+    joystick.startBackgroundUpdates()
+
+When run directly this records a gamepad, or prints the events from a log:
+    python -m Gamepad.Recording record session.jslog [joystick number]
+    python -m Gamepad.Recording show session.jslog
+"""
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+from Gamepad.Gamepad import Gamepad, controllerMapping
+
+LOG_HEADER = b'GPJSLOG1'
+ANCHOR = 0x40
+ANCHOR_INTERVAL = 1.0
+EVENT_FORMAT = 'IhBB'
+WALL_CLOCK_FORMAT = 'q'
+
+
+class SessionRecorder:
+    """Appends raw js events to a session log, adding wall clock anchors as it goes."""
+
+    def __init__(self, logPath):
+        self.logPath = logPath
+        self.logFile = open(logPath, 'wb')
+        self.logFile.write(LOG_HEADER)
+        self.nextAnchor = 0
+        self.eventCount = 0
+
+    def write(self, rawEvents):
+        """Writes one or more whole raw events, as read from the device."""
+        now = time.monotonic_ns()
+        if now >= self.nextAnchor:
+            timestamp = struct.unpack_from('I', rawEvents, 0)[0]
+            self.logFile.write(struct.pack(EVENT_FORMAT, timestamp, 0, ANCHOR, 0))
+            self.logFile.write(struct.pack(WALL_CLOCK_FORMAT, time.time_ns()))
+            if self.nextAnchor:
+                # Make sure no more than one interval is lost if we stop unexpectedly
+                self.logFile.flush()
+            self.nextAnchor = now + int(ANCHOR_INTERVAL * 1e9)
+        self.logFile.write(rawEvents)
+        self.eventCount += len(rawEvents) // 8
+
+    def close(self):
+        if self.logFile is not None:
+            self.logFile.close()
+            self.logFile = None
+
+
+def writeSessionLog(logPath, events):
+    """Writes a complete session log from (timestamp, value, event type code, index) tuples.
+    Useful for building scripted sessions to replay."""
+    recorder = SessionRecorder(logPath)
+    try:
+        for event in events:
+            recorder.write(struct.pack(EVENT_FORMAT, *event))
+    finally:
+        recorder.close()
+
+
+class ReplayGamepad(Gamepad):
+    """A Gamepad which reads its events from a session log instead of a device.
+
+    The log is memory mapped rather than read. controller names a registered
+    mapping, such as 'Joystick', to get the same axis and button names as that
+    Controllers class. speed scales the playback rate, 1.0 being real time,
+    or None to play back as fast as possible. clock replaces time.monotonic for
+    pacing the playback, e.g. a simulation's virtual clock, in which case read
+    with updateStateBatch(block = False) as time only moves when the clock does.
+
+    Reaching the end of the log behaves like the device being unplugged.
+    Use with updateState, updateStateBatch, getNextEvent or startBackgroundUpdates,
+    a log file cannot be watched by InputReactor or AsyncGamepad."""
+    fullName = 'Recorded session'
+
+    def __init__(self, logPath, controller = None, speed = 1.0, clock = None):
+        self.logPath = logPath
+        self.speed = speed
+        self.clock = time.monotonic if clock is None else clock
+        Gamepad.__init__(self, os.path.basename(logPath))
+        if controller is not None:
+            mapping = controllerMapping(controller)
+            self.fullName = mapping.fullName
+            self.axisNames = dict(mapping.axisNames)
+            self.buttonNames = dict(mapping.buttonNames)
+            self._setupReverseMaps()
+
+    def _openDevice(self):
+        self.joystickPath = self.logPath
+        self.joystickFile = open(self.logPath, 'rb')
+        try:
+            self.log = mmap.mmap(self.joystickFile.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            raise IOError('Session log %s is empty' % self.logPath)
+        if self.log[:len(LOG_HEADER)] != LOG_HEADER:
+            raise IOError('%s is not a gamepad session log' % self.logPath)
+        self.logPosition = len(LOG_HEADER)
+        self.logEnd = len(self.log) - (len(self.log) - len(LOG_HEADER)) % 8
+        self.anchorTimestamp = None
+        self.anchorWallTime = None
+        self.replayStartTimestamp = None
+        self.replayStart = None
+
+    def _getDeviceSize(self):
+        return 0, 0
+
+    def __del__(self):
+        try:
+            self.log.close()
+        except (AttributeError, BufferError):
+            pass
+        Gamepad.__del__(self)
+
+    def _peekEvent(self):
+        """Returns the next event in the log without using it up, or None at the end.
+        Any anchors before it are read on the way."""
+        while self.logPosition < self.logEnd:
+            event = struct.unpack_from(EVENT_FORMAT, self.log, self.logPosition)
+            if event[2] != ANCHOR:
+                return event
+            if self.logPosition + 16 > self.logEnd:
+                # An anchor cut short by the recording stopping part way through writing it
+                return None
+            self.anchorTimestamp = event[0]
+            self.anchorWallTime = struct.unpack_from(WALL_CLOCK_FORMAT, self.log, self.logPosition + 8)[0]
+            self.logPosition += 16
+        return None
+
+    def _dueTime(self, timestamp):
+        """Returns the clock time an event should be played back at."""
+        if self.replayStart is None:
+            self.replayStartTimestamp = timestamp
+            self.replayStart = self.clock()
+        # js timestamps are milliseconds which wrap at 32 bits
+        elapsed = ((timestamp - self.replayStartTimestamp) & 0xFFFFFFFF) / 1000.0
+        return self.replayStart + elapsed / self.speed
+
+    def _endOfLog(self):
+        self.connected = False
+        raise IOError('Gamepad %s disconnected: end of recording' % self.joystickNumber)
+
+    def _getNextEventRaw(self):
+        """Returns the next raw event from the log, waiting until it is due when playing in real time.
+        Throws an IOError at the end of the log"""
+        if not self.connected:
+            raise IOError('Gamepad has been disconnected')
+        event = self._peekEvent()
+        if event is None:
+            self._endOfLog()
+        if self.speed:
+            delay = self._dueTime(event[0]) - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+        self.logPosition += 8
+        return event
+
+    def _getPendingEventsRaw(self, block = True):
+        """Returns a list of the events from the log which are due.
+        When playing as fast as possible this is the next MAX_BATCH_EVENTS events.
+        Throws an IOError at the end of the log"""
+        if not self.connected:
+            raise IOError('Gamepad has been disconnected')
+        events = []
+        while len(events) < Gamepad.MAX_BATCH_EVENTS:
+            event = self._peekEvent()
+            if event is None:
+                if events:
+                    break
+                self._endOfLog()
+            if self.speed:
+                delay = self._dueTime(event[0]) - self.clock()
+                if delay > 0:
+                    if events or not block:
+                        break
+                    time.sleep(delay)
+            events.append(event)
+            self.logPosition += 8
+        return events
+
+    def wallClockTime(self, timestamp = None):
+        """Returns the wall clock time (time.time style) a js timestamp was recorded at.
+        Defaults to the last event read, None if the log has no anchors yet."""
+        if self.anchorTimestamp is None:
+            return None
+        if timestamp is None:
+            timestamp = self.lastTimestamp
+        offset = (timestamp - self.anchorTimestamp) & 0xFFFFFFFF
+        if offset >= 0x80000000:
+            offset -= 0x100000000
+        return self.anchorWallTime / 1e9 + offset / 1000.0
+
+    def rewind(self):
+        """Starts playback again from the beginning of the log."""
+        self.logPosition = len(LOG_HEADER)
+        self.replayStart = None
+        self.connected = True
+
+
+##########################################################
+# When this script is run it records or shows a session #
+##########################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('record', 'show'):
+        print('Usage:')
+        print('    python -m Gamepad.Recording record <log file> [joystick number]')
+        print('    python -m Gamepad.Recording show <log file>')
+        sys.exit(1)
+    logPath = sys.argv[2]
+
+    if sys.argv[1] == 'record':
+        import Gamepad.Gamepad as GamepadModule
+        joystickNumber = sys.argv[3] if len(sys.argv) > 3 else 0
+        if not GamepadModule.available(joystickNumber):
+            print('Please connect your gamepad...')
+            from Gamepad.Hotplug import HotplugWatcher
+            HotplugWatcher().waitForDevice('js%s' % joystickNumber)
+        gamepad = Gamepad(joystickNumber)
+        gamepad.startRecording(logPath)
+        print('Recording to %s, press CTRL+C to stop' % logPath)
+        try:
+            while gamepad.isConnected():
+                gamepad.updateStateBatch()
+        except (KeyboardInterrupt, IOError):
+            pass
+        finally:
+            count = gamepad.recorder.eventCount
+            gamepad.stopRecording()
+        print('')
+        print('Recorded %d events' % count)
+    else:
+        replay = ReplayGamepad(logPath, speed = None)
+        while True:
+            try:
+                event = replay._getNextEventRaw()
+            except IOError:
+                break
+            print(replay._rawEventToDescription(event))
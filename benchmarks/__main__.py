@@ -0,0 +1,286 @@
+# coding: utf-8
+"""
+Runs the hardware-free benchmark suite and saves the results as JSON.
+
+Each suite times one layer of the stack: reading a fake joystick and a fake
+evdev device, directly and through the reactor, reading its inputs, the
+kinematics and their vectorized, table and pipeline versions, encoding and
+writing motor commands, decoding replies, writing through a stalled port,
+polling motor measurements, replaying a session log and the whole control loop.
+A suite whose dependencies are missing (e.g. pyvesc for the motor commands) is
+recorded as skipped. A suite that raises, including one whose output check
+fails, is recorded as failed and the run exits with status 1.
+
+Comparing against an earlier results file prints the change in every metric and
+exits with status 1 if any got worse by more than the threshold, so a run can
+be checked before deploying to the couch.
+
+Run from the repository root:
+    python -m benchmarks [--quick] [--output results.json] [--compare earlier.json] [--threshold 0.2]
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import traceback
+
+# Units where a bigger number is better, anything else is a cost
+RATE_UNITS = ('events/s', 'ticks/s', 'packets/s', 'frames/s', 'samples/s')
+
+
+def _metric(value, unit):
+    return {'value': value, 'unit': unit}
+
+
+def gamepadReaderSuite(quick):
+    from benchmarks import gamepad_reader
+    results = {}
+    for result in gamepad_reader.run(20000 if quick else 200000):
+        results['updateState %s events/s' % result['mode']] = _metric(result['events_per_sec'], 'events/s')
+        results['updateState %s cpu' % result['mode']] = _metric(result['cpu_us_per_event'], 'us/event')
+    return results
+
+
+def evdevFramesSuite(quick):
+    from benchmarks import evdev_frames
+    for name, wrong in evdev_frames.check():
+        if wrong:
+            raise AssertionError('EvdevGamepad got %d results wrong in the %s check' % (wrong, name))
+    return {'updateStateBatch frames/s': _metric(evdev_frames.run(5000 if quick else 50000), 'frames/s')}
+
+
+def reactorSuite(quick):
+    from benchmarks import reactor
+    for name, wrong in reactor.check(50 if quick else 200):
+        if wrong:
+            raise AssertionError('InputReactor got %d results wrong in the %s check' % (wrong, name))
+    return {'4 gamepads events/s': _metric(reactor.run(10000 if quick else 100000), 'events/s')}
+
+
+def gamepadReadsSuite(quick):
+    from benchmarks import gamepad_reads
+    return dict((name, _metric(cost, 'ns/call')) for name, cost in gamepad_reads.run(100000 if quick else 1000000))
+
+
+def kinematicsSuite(quick):
+    from benchmarks import kinematics
+    return dict((name, _metric(cost, 'ns/call')) for name, cost in kinematics.run(20000 if quick else 200000))
+
+
+def vectorizedSuite(quick):
+    from benchmarks import vectorized
+    mismatches = sum(count for _, count in vectorized.check(2000 if quick else 20000))
+    if mismatches:
+        raise AssertionError('%d vectorized results differ from the scalar functions' % mismatches)
+    return dict((name, _metric(rate, 'samples/s')) for name, rate in vectorized.run(100000 if quick else 1000000))
+
+
+def shapingSuite(quick):
+    import tempfile
+    from benchmarks import shaping
+    with tempfile.TemporaryDirectory() as directory:
+        # Built into the empty directory the first time, loaded from it the second
+        for ik, worst, _, _ in shaping.check(5000 if quick else 50000, directory) + shaping.check(500, directory):
+            if worst > shaping.ERROR_BOUND:
+                raise AssertionError('ShapingTable %s error %g is over the %g bound' % (ik, worst, shaping.ERROR_BOUND))
+    return dict((name, _metric(cost, 'ns/call')) for name, cost in shaping.run(20000 if quick else 200000))
+
+
+def pipelineSuite(quick):
+    from benchmarks import pipeline
+    mismatches = sum(count for _, count in pipeline.check(2000 if quick else 20000))
+    if mismatches:
+        raise AssertionError('%d compiled Pipeline results differ from the functions they replace' % mismatches)
+    return dict((name, _metric(cost, 'ns/call')) for name, cost in pipeline.run(20000 if quick else 200000))
+
+
+def motorsSuite(quick):
+    from benchmarks import motors
+    return dict((name, _metric(cost, 'us/call')) for name, cost in motors.run(2000 if quick else 20000))
+
+
+def framesSuite(quick):
+    from benchmarks import frames
+    mismatches = sum(count for _, count in frames.check(500 if quick else 5000))
+    if mismatches:
+        raise AssertionError('%d CommandFrame packets differ from pyvesc encode' % mismatches)
+    return dict((name, _metric(cost, 'ns/call')) for name, cost in frames.run(20000 if quick else 200000))
+
+
+def frameDecoderSuite(quick):
+    from benchmarks import frame_decoder
+    wrong = sum(count for _, count in frame_decoder.check(500 if quick else 2000))
+    if wrong:
+        raise AssertionError('FrameDecoder got %d fuzzed packets wrong' % wrong)
+    return dict((name, _metric(packets, 'packets/s'))
+                for name, packets, _ in frame_decoder.run(1000 if quick else 5000))
+
+
+def serialWriterSuite(quick):
+    from benchmarks import serial_writer
+    results = {}
+    for result in serial_writer.run(0.5 if quick else 1.0):
+        if not result['newest_delivered']:
+            raise AssertionError('%s did not deliver the newest command last' % result['mode'])
+        results['%s longest tick in a stall' % result['mode']] = _metric(result['longest_tick_ms'], 'ms')
+    if not serial_writer.checkFailedWrite():
+        raise AssertionError('MotorGroup did not re-send a command the SerialWriter failed to write')
+    return results
+
+
+def vescTransportSuite(quick):
+    from benchmarks import vesc_transport
+    results = {}
+    for result in vesc_transport.run(50 if quick else 200):
+        if result['wrong']:
+            raise AssertionError('%d %s polls of %d motors had missing or misrouted replies'
+                                 % (result['wrong'], result['mode'], result['motors']))
+        results['%d motors %s' % (result['motors'], result['mode'])] = _metric(result['ms_per_poll'], 'ms/poll')
+    late = vesc_transport.checkLateReplies(50 if quick else 200)
+    if late['misrouted']:
+        raise AssertionError('%d late replies went to the wrong motor' % late['misrouted'])
+    wrong = vesc_transport.checkHighIds()
+    if wrong:
+        raise AssertionError('Polling controller IDs of 128 and over went wrong %d times' % wrong)
+    return results
+
+
+def replaySuite(quick):
+    from benchmarks import replay
+    wrong = replay.checkTruncated()
+    if wrong:
+        raise AssertionError('Replaying a truncated session log went wrong at %d cut points' % wrong)
+    results = {}
+    for result in replay.run(20000 if quick else 200000):
+        results['%s events/s' % result['case']] = _metric(result['events_per_sec'], 'events/s')
+    return results
+
+
+def loopSuite(quick):
+    from benchmarks import loop
+    result = loop.run(0.5 if quick else 3.0)
+    return {
+        'drive_loop ticks/s': _metric(result['ticks_per_sec'], 'ticks/s'),
+        'drive_loop ik p50': _metric(result['ik_p50_us'], 'us'),
+        'drive_loop command p50': _metric(result['command_p50_us'], 'us'),
+    }
+
+
+SUITES = [
+    ('gamepad_reader', gamepadReaderSuite),
+    ('evdev_frames', evdevFramesSuite),
+    ('reactor', reactorSuite),
+    ('gamepad_reads', gamepadReadsSuite),
+    ('kinematics', kinematicsSuite),
+    ('vectorized', vectorizedSuite),
+    ('shaping', shapingSuite),
+    ('pipeline', pipelineSuite),
+    ('motors', motorsSuite),
+    ('frames', framesSuite),
+    ('frame_decoder', frameDecoderSuite),
+    ('serial_writer', serialWriterSuite),
+    ('vesc_transport', vescTransportSuite),
+    ('replay', replaySuite),
+    ('loop', loopSuite),
+]
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runSuites(names, quick):
+    """Runs the named suites, returns the results document saved as JSON."""
+    document = {
+        'created': datetime.datetime.now().isoformat(timespec = 'seconds'),
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'results': {},
+        'skipped': {},
+        'failed': {},
+    }
+    for name, suite in SUITES:
+        if names and name not in names:
+            continue
+        print('Running %s...' % name, file = sys.stderr)
+        try:
+            document['results'][name] = suite(quick)
+        except ImportError as e:
+            document['skipped'][name] = 'missing dependency: %s' % e
+        except Exception:
+            document['failed'][name] = traceback.format_exc()
+    return document
+
+
+def printResults(document):
+    for suite, results in document['results'].items():
+        print('[%s]' % suite)
+        for name, metric in results.items():
+            print('  %-40s %14.2f %s' % (name, metric['value'], metric['unit']))
+    for suite, reason in document['skipped'].items():
+        print('[%s] skipped, %s' % (suite, reason.splitlines()[0]))
+    for suite, error in document['failed'].items():
+        print('[%s] FAILED' % suite)
+        print(error)
+
+
+def compare(earlier, later, threshold):
+    """Prints the change in every metric both documents have, returns the names of the regressions."""
+    regressions = []
+    print('')
+    print('Compared with %s (%s):' % (earlier.get('commit'), earlier.get('created')))
+    for suite, results in later['results'].items():
+        for name, metric in results.items():
+            before = earlier['results'].get(suite, {}).get(name)
+            if before is None or before['unit'] != metric['unit'] or before['value'] == 0:
+                continue
+            change = (metric['value'] - before['value']) / before['value']
+            worse = -change if metric['unit'] in RATE_UNITS else change
+            flag = ''
+            if worse > threshold:
+                flag = '  REGRESSION'
+                regressions.append('%s: %s' % (suite, name))
+            print('  %-50s %+7.1f%%%s' % ('%s: %s' % (suite, name), change * 100, flag))
+    return regressions
+
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks', description = __doc__.strip().splitlines()[0])
+    parser.add_argument('suites', nargs = '*', help = 'suites to run, all by default: %s' % ', '.join(name for name, _ in SUITES))
+    parser.add_argument('--quick', action = 'store_true', help = 'shorter runs, noisier results')
+    parser.add_argument('--output', default = 'benchmark-results.json', help = 'where to save the results')
+    parser.add_argument('--compare', help = 'an earlier results file to compare against')
+    parser.add_argument('--threshold', type = float, default = 0.2,
+                        help = 'fraction a metric may get worse by before it counts as a regression')
+    options = parser.parse_args(arguments)
+    unknown = set(options.suites) - set(name for name, _ in SUITES)
+    if unknown:
+        parser.error('unknown suites: %s' % ', '.join(sorted(unknown)))
+
+    document = runSuites(options.suites, options.quick)
+    printResults(document)
+    with open(options.output, 'w') as resultsFile:
+        json.dump(document, resultsFile, indent = 2, sort_keys = True)
+    print('Saved to %s' % options.output)
+    status = 1 if document['failed'] else 0
+
+    if options.compare:
+        with open(options.compare) as earlierFile:
+            earlier = json.load(earlierFile)
+        regressions = compare(earlier, document, options.threshold)
+        if regressions:
+            print('%d regressions over %.0f%%' % (len(regressions), options.threshold * 100))
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# coding: utf-8
+"""
+Feeds recorded evdev input_event bytes through a pipe to EvdevGamepad, checks
+how it handles frames and SYN_DROPPED, then measures how fast it reads them.
+
+The checks are:
+    whole frames   - a frame written in two halves is not returned until its
+                     SYN_REPORT arrives, and then all of it is
+    SYN_DROPPED    - nothing from the frame the kernel dropped events from, nor
+                     anything after the SYN_DROPPED up to and including the next
+                     SYN_REPORT, reaches the state, and the frame after that does
+    resync last    - when a batch ends on the SYN_REPORT after a SYN_DROPPED, the
+                     state read back from the device is what is left, not the
+                     frames read before the overflow in the same batch
+
+Run from the repository root:
+    python -m benchmarks.evdev_frames [frames]
+"""
+import struct
+import sys
+import threading
+import time
+
+from Gamepad.Evdev import EV_ABS, EV_KEY, EV_SYN, EVENT_FORMAT, SYN_DROPPED, SYN_REPORT, EvdevGamepad
+from benchmarks.fake_devices import FakeJoystick
+
+ABS_X = 0x00
+ABS_Y = 0x01
+BTN_TRIGGER = 0x120
+BTN_THUMB = 0x121
+AXIS_CODES = [ABS_X, ABS_Y]
+BUTTON_CODES = [BTN_TRIGGER, BTN_THUMB]
+ABS_INFO = {ABS_X: (-32767, 32767), ABS_Y: (-32767, 32767)}
+
+
+def inputEvent(microseconds, eventType, code, value):
+    return struct.pack(EVENT_FORMAT, microseconds // 1000000, microseconds % 1000000, eventType, code, value)
+
+
+def frame(microseconds, x, y, trigger):
+    """The input_events of one SYN_REPORT frame moving the stick and setting the trigger."""
+    return (inputEvent(microseconds, EV_ABS, ABS_X, x) + inputEvent(microseconds, EV_ABS, ABS_Y, y) +
+            inputEvent(microseconds, EV_KEY, BTN_TRIGGER, trigger) + inputEvent(microseconds, EV_SYN, SYN_REPORT, 0))
+
+
+# A stick moving with the trigger held, where the kernel buffer overflowed part way through
+# the third frame: the events it kept, SYN_DROPPED, the rest of that frame and its SYN_REPORT
+DROPPED_RECORDING = (
+    frame(1000, 1000, -1000, 1) +
+    frame(2000, 2000, -2000, 1) +
+    inputEvent(3000, EV_ABS, ABS_X, 31000) +
+    inputEvent(3000, EV_SYN, SYN_DROPPED, 0) +
+    inputEvent(5000, EV_ABS, ABS_Y, -31000) +
+    inputEvent(5000, EV_KEY, BTN_THUMB, 1) +
+    inputEvent(5000, EV_SYN, SYN_REPORT, 0) +
+    frame(6000, 4000, -4000, 1)
+)
+
+# DROPPED_RECORDING up to the SYN_REPORT ending the damaged frame, with nothing after it
+RESYNC_RECORDING = DROPPED_RECORDING[:-len(frame(6000, 4000, -4000, 1))]
+
+
+def openGamepad(fake):
+    return fake.gamepadClass(EvdevGamepad)(fake.joystickNumber, None, AXIS_CODES, BUTTON_CODES, ABS_INFO)
+
+
+def checkWholeFrames():
+    """Returns the number of wrong results reading a frame written in two halves."""
+    with FakeJoystick() as fake:
+        gamepad = openGamepad(fake)
+        data = frame(1000, 8000, -8000, 1)
+        half = len(data) // 2 // struct.calcsize(EVENT_FORMAT) * struct.calcsize(EVENT_FORMAT)
+        fake.write(data[:half])
+        wrong = len(gamepad._getPendingEventsRaw(block = False))
+        fake.write(data[half:])
+        events = gamepad._getPendingEventsRaw(block = False)
+        wrong += abs(len(events) - 3)
+        gamepad._storeEvents(events)
+        for _, value, eventType, index in events:
+            gamepad._applyEvent(value, eventType, index)
+        wrong += gamepad.axis(0) != 8000 / 32767.0
+        wrong += gamepad.axis(1) != -8000 / 32767.0
+        wrong += not gamepad.isPressed(0)
+        gamepad.disconnect()
+        return wrong
+
+
+def checkDropped():
+    """Returns the number of wrong results reading DROPPED_RECORDING."""
+    with FakeJoystick() as fake:
+        gamepad = openGamepad(fake)
+        seen = []
+        gamepad.addAxisMovedHandler(0, lambda position: seen.append(('X', position)))
+        gamepad.addAxisMovedHandler(1, lambda position: seen.append(('Y', position)))
+        gamepad.addButtonChangedHandler(1, lambda pressed: seen.append(('THUMB', pressed)))
+        fake.write(DROPPED_RECORDING)
+        while gamepad.lastTimestampUs < 6000:
+            gamepad.updateStateBatch()
+        # Neither the kept half of the dropped frame nor what followed the SYN_DROPPED
+        wrong = sum(1 for event in seen if event in (('X', 31000 / 32767.0), ('Y', -31000 / 32767.0), ('THUMB', True)))
+        wrong += gamepad.axis(0) != 4000 / 32767.0
+        wrong += gamepad.axis(1) != -4000 / 32767.0
+        wrong += not gamepad.isPressed(0)
+        wrong += gamepad.isPressed(1)
+        wrong += gamepad.dropping
+        gamepad.disconnect()
+        return wrong
+
+
+def checkResyncLast():
+    """Returns the number of wrong results reading RESYNC_RECORDING in one batch.
+    A pipe has no state to read back, so the resync finds the stick centred and the buttons released."""
+    with FakeJoystick() as fake:
+        gamepad = openGamepad(fake)
+        fake.write(RESYNC_RECORDING)
+        while gamepad.lastTimestampUs < 5000:
+            gamepad.updateStateBatch()
+        snapshot = gamepad.snapshot()
+        wrong = gamepad.axis(0) != 0.0
+        wrong += gamepad.axis(1) != 0.0
+        wrong += gamepad.isPressed(0)
+        wrong += gamepad.isPressed(1)
+        wrong += snapshot.axes[0] != 0.0
+        wrong += snapshot.buttons[0]
+        wrong += gamepad.dropping
+        gamepad.disconnect()
+        return wrong
+
+
+def check():
+    """Returns a list of (case, number of wrong results) results."""
+    return [('whole frames', checkWholeFrames()), ('SYN_DROPPED', checkDropped()), ('resync last', checkResyncLast())]
+
+
+def run(frames = 50000):
+    """Returns frames per second read with updateStateBatch while a writer streams a sweep."""
+    data = b''.join(frame(1000 * (number + 1), (number * 257) % 65535 - 32767, 0, number & 1)
+                    for number in range(frames))
+    with FakeJoystick() as fake:
+        gamepad = openGamepad(fake)
+
+        def stream():
+            chunk = 64 * 4 * struct.calcsize(EVENT_FORMAT)
+            for start in range(0, len(data), chunk):
+                fake.write(data[start:start + chunk])
+
+        writer = threading.Thread(target = stream)
+        start = time.perf_counter()
+        writer.start()
+        last = 1000 * frames
+        while gamepad.lastTimestampUs < last:
+            gamepad.updateStateBatch()
+        elapsed = time.perf_counter() - start
+        writer.join()
+        gamepad.disconnect()
+    return frames / elapsed
+
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    failed = False
+    for name, wrong in check():
+        print('%-14s %s' % (name, 'ok' if wrong == 0 else '%d WRONG' % wrong))
+        failed = failed or wrong != 0
+    print('updateStateBatch: %.0f frames/s' % run(frames))
+    sys.exit(1 if failed else 0)
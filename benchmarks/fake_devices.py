@@ -0,0 +1,275 @@
+# coding: utf-8
+"""
+Stand-in device nodes so the gamepad and motor code can be exercised without hardware.
+
+A FakeJoystick creates a FIFO that behaves like /dev/input/jsN: anything written to it
+is read back by a Gamepad in the same 'IhBB' event format the joystick driver uses.
+A PtyLoopback is a serial port on a pseudo terminal, standing in for a VESC's USB port,
+and a FakeVESC answers GetValues requests on one like a VESC and its CAN bus would.
+"""
+import heapq
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import tty
+
+from Gamepad.Gamepad import Gamepad
+
+EVENT_FORMAT = 'IhBB'
+
+
+def packEvents(events):
+    """Packs (timestamp, value, event type code, index) tuples into raw js event bytes."""
+    return b''.join(struct.pack(EVENT_FORMAT, *event) for event in events)
+
+
+def initEvents(axisCount, buttonCount, timestamp = 0):
+    """The events the joystick driver sends when a device is first opened."""
+    events = []
+    for index in range(buttonCount):
+        events.append((timestamp, 0, Gamepad.EVENT_CODE_INIT_BUTTON, index))
+    for index in range(axisCount):
+        events.append((timestamp, 0, Gamepad.EVENT_CODE_INIT_AXIS, index))
+    return events
+
+
+def axisSweep(count, axisCount = 2, start = 1):
+    """A stick sweep: count axis events cycling through the axes over the full range."""
+    events = []
+    for step in range(count):
+        value = (step * 257) % 65535 - 32767
+        events.append((start + step, value, Gamepad.EVENT_CODE_AXIS, step % axisCount))
+    return events
+
+
+class FakeJoystick:
+    """A FIFO standing in for a joystick device node.
+
+    Use gamepadClass to get a version of any Gamepad class which opens the FIFO
+    instead of /dev/input/jsN, then write events with write or writeEvents."""
+
+    def __init__(self, joystickNumber = 0):
+        self.directory = tempfile.mkdtemp(prefix = 'fake-js-')
+        self.joystickNumber = joystickNumber
+        self.path = os.path.join(self.directory, 'js%d' % joystickNumber)
+        os.mkfifo(self.path)
+        # Opening read / write means neither end blocks waiting for the other
+        self.writeFd = os.open(self.path, os.O_RDWR)
+
+    def gamepadClass(self, baseClass = Gamepad):
+        """Returns a subclass of baseClass which opens this FIFO."""
+        prefix = os.path.join(self.directory, 'js')
+        return type('Fake' + baseClass.__name__, (baseClass,), {'devicePrefix': prefix})
+
+    def open(self, baseClass = Gamepad):
+        """Creates a baseClass gamepad reading from this FIFO."""
+        return self.gamepadClass(baseClass)(self.joystickNumber)
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.writeFd, view)
+            view = view[written:]
+
+    def writeEvents(self, events):
+        self.write(packEvents(events))
+
+    def close(self):
+        if self.writeFd is not None:
+            os.close(self.writeFd)
+            self.writeFd = None
+        try:
+            os.unlink(self.path)
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PtyLoopback:
+    """A pyserial port on a pseudo terminal, with everything written to it read back and counted.
+
+    While stalled is set nothing is read back, so writes back up in the pty like
+    they would behind a stuck USB serial adapter. The last bytes read are kept in tail."""
+
+    TAIL_SIZE = 4096
+
+    def __init__(self):
+        import serial
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = serial.Serial(os.ttyname(self.slave), baudrate = 115200, timeout = 0.1)
+        self.received = 0
+        self.tail = b''
+        self.stalled = threading.Event()
+        self.reader = threading.Thread(target = self._drain, daemon = True)
+        self.reader.start()
+
+    def _drain(self):
+        while True:
+            if self.stalled.is_set():
+                time.sleep(0.001)
+                continue
+            try:
+                data = os.read(self.master, 65536)
+            except OSError:
+                return
+            if not data:
+                return
+            self.received += len(data)
+            self.tail = (self.tail + data)[-self.TAIL_SIZE:]
+
+    def close(self):
+        self.stalled.clear()
+        self.port.close()
+        os.close(self.slave)
+        os.close(self.master)
+        self.reader.join()
+
+
+class FakeVESC:
+    """A VESC and the VESCs CAN forwarded from it, answering GetValues on a pseudo terminal.
+
+    port is a pyserial port standing in for the USB port of the VESC with localId.
+    Each GetValues request, for it or forwarded to one of canIds, is answered after
+    latency seconds plus up to jitter more, so requests in flight together can be
+    answered out of order. A reply carries the ID of the controller it came from
+    and an RPM of rpmFor(that ID). Any other packet is counted as a command."""
+
+    COMM_FORWARD_CAN = 34
+
+    def __init__(self, localId, canIds, latency = 0.001, jitter = 0.0, seed = 1):
+        import serial
+        from pyvesc import encode
+        from pyvesc.VESC.messages import GetValues
+        self.localId = localId
+        self.canIds = set(canIds)
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.getValuesId = GetValues.id
+        self.replies = dict((controllerId, encode(self.valuesReply(GetValues, controllerId)))
+                            for controllerId in self.canIds | set([localId]))
+        self.requests = 0
+        self.commands = 0
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = serial.Serial(os.ttyname(self.slave), baudrate = 115200, timeout = 0.1)
+        self.due = []
+        self.condition = threading.Condition()
+        self.closing = False
+        self.reader = threading.Thread(target = self._serve, daemon = True)
+        self.responder = threading.Thread(target = self._respond, daemon = True)
+        self.reader.start()
+        self.responder.start()
+
+    @staticmethod
+    def rpmFor(controllerId):
+        return controllerId * 100
+
+    @classmethod
+    def valuesReply(cls, messageClass, controllerId):
+        values = []
+        for field in messageClass.fields:
+            name, fieldFormat = field[0], field[1]
+            if name == 'rpm':
+                values.append(cls.rpmFor(controllerId))
+            elif name == 'app_controller_id':
+                values.append(struct.pack('>B', controllerId))
+            elif fieldFormat == 'c':
+                values.append(b'\x00')
+            else:
+                values.append(0)
+        return messageClass(*values)
+
+    def _serve(self):
+        buffer = b''
+        while True:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            # Requests and commands are all short packets: 2, length, payload, CRC and 3
+            while len(buffer) >= 2:
+                if buffer[0] != 2:
+                    buffer = buffer[1:]
+                    continue
+                end = 2 + buffer[1] + 3
+                if len(buffer) < end:
+                    break
+                self._handle(buffer[2:end - 3])
+                buffer = buffer[end:]
+
+    def _handle(self, payload):
+        canId = None
+        if payload[0] == self.COMM_FORWARD_CAN:
+            canId, payload = payload[1], payload[2:]
+        if payload[0] != self.getValuesId:
+            self.commands += 1
+            return
+        self.requests += 1
+        controllerId = self.localId if canId is None else canId
+        if controllerId not in self.replies:
+            # Nothing on the bus with that ID, so no reply
+            return
+        due = time.monotonic() + self.latency + self.random.random() * self.jitter
+        with self.condition:
+            heapq.heappush(self.due, (due, self.requests, self.replies[controllerId]))
+            self.condition.notify()
+
+    def _respond(self):
+        while True:
+            with self.condition:
+                while not self.closing and (not self.due or self.due[0][0] > time.monotonic()):
+                    self.condition.wait(self.due[0][0] - time.monotonic() if self.due else None)
+                if self.closing:
+                    return
+                _, _, reply = heapq.heappop(self.due)
+            try:
+                os.write(self.master, reply)
+            except OSError:
+                return
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.port.close()
+        os.close(self.slave)
+        self.reader.join()
+        self.responder.join()
+        os.close(self.master)
+
+
+class NullMotor:
+    """A motor controller which accepts every command and does nothing.
+
+    Counts the commands so benchmarks can check the loop really ran."""
+
+    def __init__(self):
+        self.commands = 0
+
+    def set_rpm(self, speed):
+        self.commands += 1
+
+    def set_current(self, speed):
+        self.commands += 1
+
+    def get_rpm(self):
+        return 0
+
+    def get_measurements(self):
+        return None
@@ -0,0 +1,205 @@
+# coding: utf-8
+"""
+Fuzzes FrameDecoder with damaged and fragmented streams, then measures its throughput.
+
+The fuzz stream mixes valid packets of every size, short and long headers, with
+random garbage, truncated packets, packets with a flipped bit and stray start
+bytes, and is fed in pieces of one byte, a few bytes, random sizes and whole
+reads, both copied in with feed and read straight into writable. Every valid
+packet must come out, in order, and nothing else. A damaged packet is followed
+by a zero byte: without one, a packet cut just before its end byte can take the
+next packet's start byte 3 as its own and really be a valid packet.
+
+Throughput is decoding a stream of GetValues replies, to payloads and to
+messages as the transport does, compared with the pyvesc decode loop it used
+before.
+
+Run from the repository root:
+    python -m benchmarks.frame_decoder [packets]
+"""
+import random
+import struct
+import sys
+import time
+
+from pyvesc import decode, encode
+from pyvesc.VESC.messages import GetValues
+from pyvesc.protocol.base import VESCMessage
+
+from benchmarks.fake_devices import FakeVESC
+from motor_controller import FrameDecoder, crc16
+
+PAYLOAD_SIZES = [1, 5, 60, 255, 256, 512]
+
+
+def packet(payload):
+    if len(payload) < 256:
+        header = struct.pack('>BB', 2, len(payload))
+    else:
+        header = struct.pack('>BH', 3, len(payload))
+    return header + payload + struct.pack('>HB', crc16(payload), 3)
+
+
+def randomBytes(generator, count):
+    return bytes(generator.randrange(256) for _ in range(count))
+
+
+def fuzzStream(count, seed = 1):
+    """Returns (stream, the payloads of the valid packets in it)."""
+    generator = random.Random(seed)
+    stream = bytearray()
+    payloads = []
+    while len(payloads) < count:
+        kind = generator.random()
+        if kind < 0.6:
+            payload = randomBytes(generator, generator.choice(PAYLOAD_SIZES))
+            payloads.append(payload)
+            stream += packet(payload)
+        elif kind < 0.75:
+            stream += randomBytes(generator, generator.randrange(1, 40))
+        elif kind < 0.85:
+            damaged = packet(randomBytes(generator, generator.randrange(1, 80)))
+            stream += damaged[:generator.randrange(1, len(damaged))] + b'\x00'
+        elif kind < 0.95:
+            damaged = bytearray(packet(randomBytes(generator, generator.randrange(1, 80))))
+            damaged[generator.randrange(len(damaged))] ^= 1 << generator.randrange(8)
+            stream += damaged + b'\x00'
+        else:
+            # Start bytes with lengths that are too long, or too short for a long header
+            stream += generator.choice([b'\x02\x00', b'\x03\xff\xff', b'\x03\x00\x10']) + b'\x00'
+    return bytes(stream), payloads
+
+
+def pieces(stream, sizes, generator):
+    start = 0
+    while start < len(stream):
+        size = generator.choice(sizes)
+        yield stream[start:start + size]
+        start += size
+
+
+def decodeFed(stream, sizes, generator):
+    decoder = FrameDecoder()
+    payloads = []
+    for piece in pieces(stream, sizes, generator):
+        payloads.extend(bytes(payload) for payload in decoder.feed(piece))
+    return payloads
+
+
+def decodeReadInto(stream, sizes, generator):
+    decoder = FrameDecoder()
+    payloads = []
+    start = 0
+    while start < len(stream):
+        space = decoder.writable()
+        count = min(len(space), generator.choice(sizes), len(stream) - start)
+        space[:count] = stream[start:start + count]
+        decoder.written(count)
+        start += count
+        payloads.extend(bytes(payload) for payload in decoder)
+    return payloads
+
+
+def check(count = 2000):
+    """Returns a list of (case, number of payloads missing, extra or out of order) results."""
+    stream, expected = fuzzStream(count)
+    results = []
+    for name, sizes in (('1 byte', [1]), ('7 bytes', [7]), ('4096 bytes', [4096]), ('random', list(range(1, 100)))):
+        for method, decodeStream in (('feed', decodeFed), ('writable', decodeReadInto)):
+            payloads = decodeStream(stream, sizes, random.Random(2))
+            wrong = sum(1 for got, wanted in zip(payloads, expected) if got != wanted)
+            wrong += abs(len(payloads) - len(expected))
+            results.append(('%s, %s pieces' % (method, name), wrong))
+    return results
+
+
+def replyStream(count):
+    replies = [encode(FakeVESC.valuesReply(GetValues, controllerId)) for controllerId in range(256)]
+    return b''.join(replies[index % 256] for index in range(count))
+
+
+def timeDecoding(decodeStream, stream, count):
+    """Returns (packets per second, megabytes per second), best of three."""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        decoded = decodeStream(stream)
+        elapsed = time.perf_counter() - start
+        if decoded != count:
+            raise AssertionError('Decoded %d of %d packets' % (decoded, count))
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best, len(stream) / best / 1e6
+
+
+def readIntoDecoder(readSize, unpack = False):
+    def decodeStream(stream):
+        decoder = FrameDecoder()
+        decoded = 0
+        start = 0
+        while start < len(stream):
+            # As a read into the free space would, reading no more than fits
+            space = decoder.writable()
+            count = min(len(space), readSize, len(stream) - start)
+            space[:count] = stream[start:start + count]
+            decoder.written(count)
+            start += count
+            for payload in decoder:
+                if unpack:
+                    VESCMessage.unpack(payload)
+                decoded += 1
+        return decoded
+    return decodeStream
+
+
+def feedDecoder(readSize):
+    def decodeStream(stream):
+        decoder = FrameDecoder()
+        decoded = 0
+        for start in range(0, len(stream), readSize):
+            for _ in decoder.feed(stream[start:start + readSize]):
+                decoded += 1
+        return decoded
+    return decodeStream
+
+
+def pyvescDecoder(readSize):
+    def decodeStream(stream):
+        buffer = bytearray()
+        decoded = 0
+        for start in range(0, len(stream), readSize):
+            buffer += stream[start:start + readSize]
+            while buffer:
+                message, consumed = decode(bytes(buffer))
+                del buffer[:consumed]
+                if message is not None:
+                    decoded += 1
+                elif not consumed:
+                    break
+        return decoded
+    return decodeStream
+
+
+def run(count = 5000):
+    """Returns a list of (case, packets per second, megabytes per second) results."""
+    stream = replyStream(count)
+    cases = [
+        ('FrameDecoder.writable, 4096 byte reads', readIntoDecoder(4096)),
+        ('FrameDecoder.writable + unpack, 4096 byte reads', readIntoDecoder(4096, unpack = True)),
+        ('FrameDecoder.feed, 4096 byte reads', feedDecoder(4096)),
+        ('FrameDecoder.feed, 16 byte reads', feedDecoder(16)),
+        ('FrameDecoder.feed, 1 byte reads', feedDecoder(1)),
+        ('pyvesc decode, 4096 byte reads', pyvescDecoder(4096)),
+    ]
+    return [(name,) + timeDecoding(decodeStream, stream, count) for name, decodeStream in cases]
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    failed = False
+    for name, wrong in check():
+        print('%-28s %s' % (name, 'all packets' if wrong == 0 else '%d WRONG' % wrong))
+        failed = failed or wrong != 0
+    print('')
+    for name, packets, megabytes in run(count):
+        print('%-49s %10.0f packets/s %7.2f MB/s' % (name, packets, megabytes))
+    sys.exit(1 if failed else 0)
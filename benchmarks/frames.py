@@ -0,0 +1,78 @@
+# coding: utf-8
+"""
+Checks CommandFrame packets against pyvesc's encode byte for byte, then compares their cost.
+
+The check covers SetRPM and SetCurrent for the local VESC and over CAN, at every
+value the couch can send (speed_to_rpm / speed_to_current of the whole stick
+range), the int field limits and random values, with and without the cache.
+
+Run from the repository root:
+    python -m benchmarks.frames [calls]
+"""
+import random
+import sys
+import timeit
+
+from pyvesc import encode
+from pyvesc.VESC.messages import SetCurrent, SetRPM
+
+from motor_controller import CommandFrame, VESCMotorController, crc16
+
+CAN_IDS = [None, 0, 78, 255]
+
+
+def values(count, seed = 1):
+    generator = random.Random(seed)
+    limit = VESCMotorController.MAX_RPM
+    points = list(range(-limit, limit + 1, 7)) + [0, 1, -1, 2 ** 31 // 1000 - 1, -(2 ** 31 // 1000)]
+    points += [generator.randint(-2 ** 31 // 1000, 2 ** 31 // 1000 - 1) for _ in range(count)]
+    return points
+
+
+def reference(messageClass, value, canId):
+    if canId is None:
+        return encode(messageClass(value))
+    return encode(messageClass(value, can_id = canId))
+
+
+def check(count = 5000):
+    """Returns a list of (case, number of mismatching packets) results."""
+    results = []
+    # The table CRC against the bitwise definition, on the standard check string
+    results.append(('crc16 check value', 0 if crc16(b'123456789') == 0x31C3 else 1))
+    points = values(count)
+    for messageClass in (SetRPM, SetCurrent):
+        for canId in CAN_IDS:
+            for cacheSize in (0, 8):
+                frame = CommandFrame(messageClass, canId, cacheSize)
+                mismatches = 0
+                # Twice round, so the second pass is served from the cache where it can be
+                for value in points + points[:64]:
+                    if bytes(frame.encode(value)) != reference(messageClass, value, canId):
+                        mismatches += 1
+                results.append(('%s can_id %s cache %d' % (messageClass.__name__, canId, cacheSize), mismatches))
+    return results
+
+
+def run(calls = 200000):
+    """Returns a list of (case, nanoseconds per call) results."""
+    uncached = CommandFrame(SetRPM, 78, cache_size = 0)
+    cached = CommandFrame(SetRPM, 78)
+    cases = [
+        ('pyvesc encode SetRPM CAN', lambda: encode(SetRPM(8400, can_id = 78))),
+        ('CommandFrame.encode', lambda: uncached.encode(8400)),
+        ('CommandFrame.encode cached', lambda: cached.encode(0)),
+    ]
+    return [(name, min(timeit.repeat(call, number = calls, repeat = 5)) * 1e9 / calls) for name, call in cases]
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    failed = False
+    for name, mismatches in check():
+        print('%-32s %s' % (name, 'equal' if mismatches == 0 else '%d MISMATCHES' % mismatches))
+        failed = failed or mismatches != 0
+    print('')
+    for name, cost in run(calls):
+        print('%-28s %8.1f ns/call' % (name, cost))
+    sys.exit(1 if failed else 0)
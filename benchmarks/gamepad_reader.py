@@ -0,0 +1,89 @@
+# coding: utf-8
+"""
+Compares the per-event Gamepad reader with the batched reader.
+
+A writer thread streams a stick sweep into a fake /dev/input/js FIFO while the
+reader drains it, first with updateState and then with updateStateBatch.
+Reports events per second and the reader's CPU time per event.
+
+Run from the repository root:
+    python -m benchmarks.gamepad_reader [event count]
+"""
+import sys
+import threading
+import time
+
+from benchmarks.fake_devices import FakeJoystick, axisSweep, initEvents, packEvents
+
+AXIS_COUNT = 7
+BUTTON_COUNT = 14
+CHUNK_EVENTS = 64
+
+
+def _streamEvents(fake, data):
+    chunk = CHUNK_EVENTS * 8
+    for start in range(0, len(data), chunk):
+        fake.write(data[start:start + chunk])
+
+
+def measureReader(mode, eventCount):
+    """Reads eventCount axis events with the given mode ('single', 'batched' or 'coalesced').
+
+    Returns a dictionary of the results."""
+    with FakeJoystick() as fake:
+        fake.writeEvents(initEvents(AXIS_COUNT, BUTTON_COUNT))
+        gamepad = fake.open()
+        moved = [0]
+
+        def onMove(position):
+            moved[0] += 1
+
+        if mode == 'single':
+            for _ in range(AXIS_COUNT + BUTTON_COUNT):
+                gamepad.updateState()
+        else:
+            initCount = 0
+            while initCount < AXIS_COUNT + BUTTON_COUNT:
+                initCount += gamepad.updateStateBatch()
+        for index in range(AXIS_COUNT):
+            gamepad.addAxisMovedHandler(index, onMove)
+
+        data = packEvents(axisSweep(eventCount, AXIS_COUNT))
+        writer = threading.Thread(target = _streamEvents, args = (fake, data))
+        startWall = time.perf_counter()
+        startCpu = time.thread_time()
+        writer.start()
+        read = 0
+        if mode == 'single':
+            while read < eventCount:
+                gamepad.updateState()
+                read += 1
+        else:
+            coalesceAxes = mode == 'coalesced'
+            while read < eventCount:
+                read += gamepad.updateStateBatch(coalesceAxes)
+        cpu = time.thread_time() - startCpu
+        wall = time.perf_counter() - startWall
+        writer.join()
+        gamepad.disconnect()
+    return {
+        'mode': mode,
+        'events': read,
+        'callbacks': moved[0],
+        'events_per_sec': read / wall,
+        'cpu_us_per_event': cpu * 1e6 / read,
+        'cpu_fraction': cpu / wall,
+    }
+
+
+def run(eventCount = 200000):
+    return [measureReader(mode, eventCount) for mode in ('single', 'batched', 'coalesced')]
+
+
+if __name__ == '__main__':
+    eventCount = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print('%-10s %12s %12s %14s %8s' % ('mode', 'events/s', 'callbacks', 'cpu us/event', 'cpu %'))
+    for result in run(eventCount):
+        print('%-10s %12.0f %12u %14.2f %7.1f%%' % (result['mode'], result['events_per_sec'],
+                                                   result['callbacks'], result['cpu_us_per_event'],
+                                                   result['cpu_fraction'] * 100))
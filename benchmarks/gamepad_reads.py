@@ -0,0 +1,52 @@
+# coding: utf-8
+"""
+Per-read cost of the different ways of reading Controllers.Joystick inputs.
+
+Compares isPressed / axis by name against snapshots and pre-resolved handles,
+using a fake /dev/input/js FIFO so no joystick is needed.
+
+Run from the repository root:
+    python -m benchmarks.gamepad_reads [reads per case]
+"""
+import sys
+import timeit
+
+import Gamepad.Controllers as Controllers
+from benchmarks.fake_devices import FakeJoystick, initEvents
+
+
+def run(reads = 1000000):
+    """Returns a list of (case, nanoseconds per read) results."""
+    with FakeJoystick() as fake:
+        fake.writeEvents(initEvents(7, 14))
+        joystick = fake.open(Controllers.Joystick)
+        while not joystick.isReady():
+            joystick.updateStateBatch()
+        snapshot = joystick.snapshot()
+        modeA = joystick.buttonHandle('MODEA')
+        y = joystick.axisHandle('Y')
+        cases = [
+            ('isPressed(MODEA)', lambda: joystick.isPressed('MODEA')),
+            ('axis(Y)', lambda: joystick.axis('Y')),
+            ('snapshot.isPressed(MODEA)', lambda: snapshot.isPressed('MODEA')),
+            ('snapshot.axis(Y)', lambda: snapshot.axis('Y')),
+            ('buttonHandle.pressed', lambda: modeA.pressed),
+            ('axisHandle.position', lambda: y.position),
+            ('buttonHandle.read(snapshot)', lambda: modeA.read(snapshot)),
+            ('axisHandle.read(snapshot)', lambda: y.read(snapshot)),
+            ('snapshot()', lambda: joystick.snapshot(snapshot)),
+        ]
+        # The cost of calling an empty lambda is taken off every case
+        overhead = min(timeit.repeat(lambda: None, number = reads, repeat = 5))
+        results = []
+        for name, read in cases:
+            best = min(timeit.repeat(read, number = reads, repeat = 5))
+            results.append((name, (best - overhead) * 1e9 / reads))
+        joystick.disconnect()
+    return results
+
+
+if __name__ == '__main__':
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for name, cost in run(reads):
+        print('%-30s %8.1f ns/read' % (name, cost))
@@ -0,0 +1,42 @@
+# coding: utf-8
+"""
+Per-call cost of the mathutils functions and both drive IK functions.
+
+Run from the repository root:
+    python -m benchmarks.kinematics [calls per case]
+"""
+import sys
+import timeit
+
+import drive
+import mathutils
+
+
+def run(calls = 200000):
+    """Returns a list of (case, nanoseconds per call) results."""
+    cases = [
+        ('map_range', lambda: mathutils.map_range(0.42, -1, 1, -20000, 20000)),
+        ('deadzone', lambda: mathutils.deadzone(0.42, 0.05)),
+        ('apply_deadband', lambda: mathutils.apply_deadband(0.42, 0.05, 1.0)),
+        ('clamp', lambda: mathutils.clamp(0.42, -1.0, 1.0)),
+        ('square', lambda: mathutils.square(0.42)),
+        ('scale_and_deadzone_inputs', lambda: mathutils.scale_and_deadzone_inputs(0.42, -0.31)),
+        ('desaturate_wheel_speeds', lambda: mathutils.desaturate_wheel_speeds(0.9, -0.6)),
+        ('desaturate_wheel_speeds sum', lambda: mathutils.desaturate_wheel_speeds(0.9, -0.6, use_max = False)),
+        ('arcade_drive_ik', lambda: drive.arcade_drive_ik(0.42, -0.31)),
+        ('curvture_drive_ik', lambda: drive.curvture_drive_ik(0.42, -0.31)),
+        ('get_speed_multiplier', lambda: drive.get_speed_multiplier(True, False)),
+    ]
+    # The cost of calling an empty lambda is taken off every case
+    overhead = min(timeit.repeat(lambda: None, number = calls, repeat = 5))
+    results = []
+    for name, call in cases:
+        best = min(timeit.repeat(call, number = calls, repeat = 5))
+        results.append((name, (best - overhead) * 1e9 / calls))
+    return results
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for name, cost in run(calls):
+        print('%-30s %8.1f ns/call' % (name, cost))
@@ -0,0 +1,94 @@
+# coding: utf-8
+"""
+Iterations per second of the control loop, set up the way __main__.py runs it.
+
+A Controllers.Joystick reads a fake /dev/input/js FIFO with batched background
+updates while a writer thread streams stick sweeps into it. drive_loop runs
+with latency tracking, telemetry and measurement polling, but no scheduler, so
+it goes as fast as it can, against motors that do nothing. They are wrapped in
+KeepaliveMotorController when motor_controller can be imported (it needs
+pyvesc). Closing the FIFO unplugs the fake joystick, which ends the loop.
+
+Run from the repository root:
+    python -m benchmarks.loop [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import Gamepad.Controllers as Controllers
+from benchmarks.fake_devices import FakeJoystick, NullMotor, axisSweep, initEvents, packEvents
+import drive
+from latency import LatencyTracker
+from measurements import MeasurementPoller
+from telemetry import TelemetryLogger
+
+AXIS_COUNT = 7
+BUTTON_COUNT = 14
+
+
+def run(seconds = 3.0):
+    """Returns a dictionary of the results."""
+    try:
+        from motor_controller import KeepaliveMotorController
+    except ImportError:
+        KeepaliveMotorController = None
+    left, right = NullMotor(), NullMotor()
+    if KeepaliveMotorController is not None:
+        left, right = KeepaliveMotorController(left), KeepaliveMotorController(right)
+    latency = LatencyTracker(drive.LATENCY_STAGES)
+    measurements = MeasurementPoller((left, right))
+    logPath = os.path.join(tempfile.mkdtemp(prefix = 'loop-'), 'telemetry.bin')
+    telemetry = TelemetryLogger(logPath, capacity = 1 << 16, summary_interval = None)
+    sweep = packEvents(axisSweep(4096, 2))
+
+    fake = FakeJoystick()
+    fake.writeEvents(initEvents(AXIS_COUNT, BUTTON_COUNT))
+    joystick = fake.open(Controllers.Joystick)
+
+    def stream():
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            fake.write(sweep)
+        # Closing the only writer makes the gamepad read end of file, as if it was unplugged
+        fake.close()
+
+    # The update thread ends with an IOError when the FIFO closes, just like an unplugged pad
+    excepthook = threading.excepthook
+    threading.excepthook = lambda args: None
+    writer = threading.Thread(target = stream)
+    try:
+        joystick.startBackgroundUpdates(batched = True, coalesceAxes = True)
+        telemetry.start()
+        measurements.start()
+        writer.start()
+        start = time.perf_counter()
+        drive.drive_loop(joystick, left, right, latency, telemetry = telemetry, measurements = measurements)
+        elapsed = time.perf_counter() - start
+        writer.join()
+        joystick.updateThread.join()
+    finally:
+        threading.excepthook = excepthook
+        measurements.stop()
+        telemetry.close()
+        os.unlink(logPath)
+        os.rmdir(os.path.dirname(logPath))
+    # Every tick is offered to the telemetry, whether or not it had room
+    ticks = telemetry.recorded + telemetry.dropped
+    return {
+        'ticks': ticks,
+        'ticks_per_sec': ticks / elapsed,
+        'us_per_tick': elapsed * 1e6 / ticks,
+        'ik_p50_us': latency.histograms['ik'].percentile(50) / 1e3,
+        'command_p50_us': latency.histograms['command'].percentile(50) / 1e3,
+        'telemetry_dropped': telemetry.dropped,
+        'keepalive': KeepaliveMotorController is not None,
+    }
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    for name, value in run(seconds).items():
+        print('%-18s %s' % (name, value))
@@ -0,0 +1,83 @@
+# coding: utf-8
+"""
+Cost of encoding and writing VESC commands, through a pty standing in for the serial port.
+
+The commands go through the real VESCMotorController and CanVESC code and pyvesc
+encode into a pyserial port opened on a pseudo terminal, whose other end is
+drained by a thread, so the cost includes the write system call the couch makes
+every tick without needing a VESC attached. Commanding both motors with two
+writes is compared with a MotorGroup's single write. Needs pyvesc and pyserial.
+
+Run from the repository root:
+    python -m benchmarks.motors [calls per case]
+"""
+import sys
+import timeit
+
+from pyvesc import encode
+from pyvesc.VESC.messages import SetCurrent, SetRPM
+
+from benchmarks.fake_devices import PtyLoopback
+from motor_controller import CanVESC, MotorGroup, VESCMotorController
+
+RIGHT_MOTOR_ID = 78
+
+
+class LoopbackVESC:
+    """The parts of pyvesc's VESC the motor controllers use, writing to a PtyLoopback."""
+
+    def __init__(self, loopback):
+        self.serial_port = loopback.port
+
+    def set_rpm(self, new_rpm):
+        self.write(encode(SetRPM(new_rpm)))
+
+    def set_current(self, new_current):
+        self.write(encode(SetCurrent(new_current)))
+
+    def write(self, data, num_read_bytes = None):
+        self.serial_port.write(data)
+
+    def stop_heartbeat(self):
+        pass
+
+
+def run(calls = 20000):
+    """Returns a list of (case, microseconds per call) results."""
+    loopback = PtyLoopback()
+    vesc = LoopbackVESC(loopback)
+    left = VESCMotorController(vesc)
+    right = CanVESC(vesc, RIGHT_MOTOR_ID)
+    # A zero interval writes every command, as the separate motors do
+    group = MotorGroup((left, right), keepalive_interval = 0)
+
+    def separate():
+        left.set_rpm(0.42)
+        right.set_rpm(-0.42)
+
+    cases = [
+        ('encode SetRPM', lambda: encode(SetRPM(8400))),
+        ('encode SetRPM CAN', lambda: encode(SetRPM(8400, can_id = RIGHT_MOTOR_ID))),
+        ('encode SetCurrent', lambda: encode(SetCurrent(8))),
+        ('VESCMotorController.set_rpm', lambda: left.set_rpm(0.42)),
+        ('VESCMotorController.set_current', lambda: left.set_current(0.42)),
+        ('CanVESC.set_rpm', lambda: right.set_rpm(0.42)),
+        ('CanVESC.set_current', lambda: right.set_current(0.42)),
+        ('both motors, separate writes', separate),
+        ('both motors, MotorGroup.set_rpm', lambda: group.set_rpm((0.42, -0.42))),
+    ]
+    try:
+        results = []
+        for name, call in cases:
+            best = min(timeit.repeat(call, number = calls, repeat = 3))
+            results.append((name, best * 1e6 / calls))
+    finally:
+        del left, right, group
+        loopback.close()
+    return results
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, cost in run(calls):
+        print('%-34s %8.2f us/call' % (name, cost))
@@ -0,0 +1,107 @@
+# coding: utf-8
+"""
+Checks compiled Pipelines against the functions they replace and compares their cost.
+
+arcade_pipeline must give exactly arcade_drive_ik times get_speed_multiplier for
+every mode, and the single stages must match the mathutils functions they are
+named after. The cost comparison shows what extra stages add to a compiled
+pipeline against calling the equivalent functions one after another.
+
+Run from the repository root:
+    python -m benchmarks.pipeline [calls]
+"""
+import random
+import sys
+import timeit
+
+import drive
+import mathutils
+from pipeline import Clamp, Deadband, Deadzone, Desaturate, Mix, Pipeline, SlewRateLimit, Square
+
+EDGE_CASES = [0.0, 0.05, -0.05, 0.0499999, 1.0, -1.0, 0.5, 1.5, -2.0]
+
+
+def samples(count, seed = 1):
+    generator = random.Random(seed)
+    points = [(speed, rotation) for speed in EDGE_CASES for rotation in EDGE_CASES]
+    points += [(generator.uniform(-1.5, 1.5), generator.uniform(-1.5, 1.5)) for _ in range(count)]
+    return points
+
+
+def check(count = 20000):
+    """Returns a list of (case, number of mismatching samples) results."""
+    points = samples(count)
+    results = []
+    arcade = drive.arcade_pipeline().compile()
+    mismatches = 0
+    for mode_a, mode_b in ((False, False), (True, False), (False, True), (True, True)):
+        multiplier = drive.get_speed_multiplier(mode_a, mode_b)
+        for speed, rotation in points:
+            left, right = drive.arcade_drive_ik(speed, rotation)
+            if arcade(speed, rotation, mode_a, mode_b) != [left * multiplier, right * multiplier]:
+                mismatches += 1
+    results.append(('arcade_pipeline', mismatches))
+
+    curvature = Pipeline([Deadzone(0.05), Square((True, False)), Mix('curvature'), Desaturate()]).compile()
+    results.append(('curvature pipeline', sum(curvature(s, r) != list(drive.curvture_drive_ik(s, r)) for s, r in points)))
+
+    for name, stage, scalar in [
+            ('Deadband', Deadband(0.05, 1.0), lambda x: mathutils.apply_deadband(x, 0.05, 1.0)),
+            ('Deadband inf', Deadband(0.05, float('inf')), lambda x: mathutils.apply_deadband(x, 0.05, float('inf'))),
+            ('Clamp', Clamp(-1.0, 1.0), lambda x: mathutils.clamp(x, -1.0, 1.0)),
+            ('Square', Square(), mathutils.square),
+            ('Deadzone', Deadzone(0.05), lambda x: mathutils.deadzone(x, 0.05))]:
+        single = Pipeline([stage]).compile()
+        results.append((name, sum(single(s, r) != [scalar(s), scalar(r)] for s, r in points)))
+
+    # A full step ramps by rate times the time since the last tick, however uneven the ticks are,
+    # and never overshoots. The first tick has no last tick, so it holds.
+    periods = [0.01, 0.005, 0.02, 0.01, 0.5] * 12
+    now = [0.0]
+    limited = Pipeline([SlewRateLimit(2.0, clock = lambda: now[0])]).compile()
+    outputs = []
+    expected = []
+    ramp = 0.0
+    for tick, period in enumerate(periods):
+        if tick:
+            ramp = min(1.0, ramp + 2.0 * min(period, 0.1))
+        now[0] += period
+        outputs.append(limited(1.0, -1.0)[0])
+        expected.append(ramp)
+    results.append(('SlewRateLimit', sum(abs(a - b) > 1e-12 for a, b in zip(outputs, expected))))
+    return results
+
+
+def run(calls = 200000):
+    """Returns a list of (case, nanoseconds per call) results."""
+    arcade = drive.arcade_pipeline().compile()
+    ramped = drive.arcade_pipeline(SlewRateLimit(2.0), Clamp()).compile()
+
+    def functions():
+        left, right = drive.arcade_drive_ik(0.42, -0.31)
+        multiplier = drive.get_speed_multiplier(True, False)
+        return left * multiplier, right * multiplier
+
+    def functionsRamped():
+        left, right = functions()
+        return mathutils.clamp(left, -1.0, 1.0), mathutils.clamp(right, -1.0, 1.0)
+
+    cases = [
+        ('arcade_drive_ik + multiplier', functions),
+        ('arcade_pipeline', lambda: arcade(0.42, -0.31, True, False)),
+        ('functions + 2 clamps', functionsRamped),
+        ('arcade_pipeline + slew + clamp', lambda: ramped(0.42, -0.31, True, False)),
+    ]
+    return [(name, min(timeit.repeat(call, number = calls, repeat = 5)) * 1e9 / calls) for name, call in cases]
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    failed = False
+    for name, mismatches in check():
+        print('%-22s %s' % (name, 'equal' if mismatches == 0 else '%d MISMATCHES' % mismatches))
+        failed = failed or mismatches != 0
+    print('')
+    for name, cost in run(calls):
+        print('%-32s %8.1f ns/call' % (name, cost))
+    sys.exit(1 if failed else 0)
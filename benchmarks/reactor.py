@@ -0,0 +1,147 @@
+# coding: utf-8
+"""
+Drives InputReactor with fake /dev/input/js FIFOs, checks it survives faulty
+callbacks and disconnects, then measures how fast it reads several gamepads.
+
+The check registers two gamepads. One has callbacks which raise, including an
+IOError, and a disconnected handler which raises too; the other is well behaved.
+Every event on both must still reach the state and the other callbacks, each
+exception must be counted against the faulty gamepad, and once the faulty
+gamepad's FIFO is closed the reactor must carry on updating the other.
+
+Run from the repository root:
+    python -m benchmarks.reactor [events per gamepad]
+"""
+import contextlib
+import io
+import sys
+import threading
+import time
+
+from Gamepad.Gamepad import Gamepad
+from Gamepad.Reactor import InputReactor
+from benchmarks.fake_devices import FakeJoystick, axisSweep, initEvents, packEvents
+
+AXIS_COUNT = 2
+BUTTON_COUNT = 2
+
+
+def waitFor(condition, timeout = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def buttonPresses(count):
+    events = []
+    for press in range(count):
+        events.append((2 * press + 1, 1, Gamepad.EVENT_CODE_BUTTON, 0))
+        events.append((2 * press + 2, 0, Gamepad.EVENT_CODE_BUTTON, 0))
+    return events
+
+
+def check(presses = 200):
+    """Returns a list of (case, number of wrong results) results."""
+    faultyFake = FakeJoystick(0)
+    goodFake = FakeJoystick(1)
+    reactor = InputReactor()
+    counts = {'pressed': 0, 'moved': 0, 'disconnected': 0}
+
+    def raiseError(*args):
+        raise RuntimeError('faulty callback')
+
+    def raiseIOError(*args):
+        raise IOError('not a disconnect')
+
+    def pressed():
+        counts['pressed'] += 1
+
+    def moved(position):
+        counts['moved'] += 1
+
+    def disconnected(gamepad):
+        counts['disconnected'] += 1
+        raise RuntimeError('faulty disconnected handler')
+
+    results = []
+    try:
+        faultyFake.writeEvents(initEvents(AXIS_COUNT, BUTTON_COUNT))
+        goodFake.writeEvents(initEvents(AXIS_COUNT, BUTTON_COUNT))
+        faulty = faultyFake.open()
+        good = goodFake.open()
+        reactor.register(faulty)
+        reactor.register(good)
+        reactor.addDisconnectedHandler(disconnected)
+        with contextlib.redirect_stderr(io.StringIO()):
+            reactor.start()
+            faulty.addButtonPressedHandler(0, raiseError)
+            faulty.addButtonPressedHandler(0, pressed)
+            faulty.addAxisMovedHandler(0, raiseIOError)
+            good.addAxisMovedHandler(0, moved)
+            faultyFake.writeEvents(buttonPresses(presses) + [(0, 1000, Gamepad.EVENT_CODE_AXIS, 0)])
+            goodFake.writeEvents(axisSweep(presses, 1))
+            waitFor(lambda: counts['pressed'] >= presses and counts['moved'] >= presses)
+            results.append(('callbacks after a raising one', presses - counts['pressed']))
+            results.append(('other gamepad', presses - counts['moved']))
+            results.append(('state after a raising one', int(faulty.axis(0) != 1000 / Gamepad.MAX_AXIS)))
+            results.append(('errors counted', abs(reactor.callbackErrors.get(faulty, 0) - (presses + 1))))
+
+            faultyFake.close()
+            waitFor(lambda: counts['disconnected'] > 0)
+            goodFake.writeEvents(axisSweep(presses, 1))
+            waitFor(lambda: counts['moved'] >= 2 * presses)
+            results.append(('after a disconnect', (1 - counts['disconnected']) + (2 * presses - counts['moved']) +
+                            int(faulty in reactor.gamepads) + int(not reactor.thread.is_alive())))
+    finally:
+        reactor.stop(1.0)
+        faultyFake.close()
+        goodFake.close()
+    return results
+
+
+def run(eventCount = 100000, gamepadCount = 4):
+    """Returns events per second read by one reactor from gamepadCount gamepads streaming at once."""
+    fakes = [FakeJoystick(number) for number in range(gamepadCount)]
+    reactor = InputReactor(coalesceAxes = False)
+    moved = [0] * gamepadCount
+    try:
+        for fake in fakes:
+            fake.writeEvents(initEvents(AXIS_COUNT, BUTTON_COUNT))
+            reactor.register(fake.open())
+        # Handlers can only be added once the initial state events have been read
+        reactor.start()
+        for number, gamepad in enumerate(reactor.gamepads):
+
+            def onMove(position, number = number):
+                moved[number] += 1
+
+            for index in range(AXIS_COUNT):
+                gamepad.addAxisMovedHandler(index, onMove)
+        data = packEvents(axisSweep(eventCount, AXIS_COUNT))
+        writers = [threading.Thread(target = fake.write, args = (data,)) for fake in fakes]
+        start = time.perf_counter()
+        for writer in writers:
+            writer.start()
+        if not waitFor(lambda: sum(moved) >= eventCount * gamepadCount, 60.0):
+            raise AssertionError('The reactor read %d of %d events' % (sum(moved), eventCount * gamepadCount))
+        elapsed = time.perf_counter() - start
+        for writer in writers:
+            writer.join()
+    finally:
+        reactor.stop(1.0)
+        for fake in fakes:
+            fake.close()
+    return eventCount * gamepadCount / elapsed
+
+
+if __name__ == '__main__':
+    eventCount = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    failed = False
+    for name, wrong in check():
+        print('%-30s %s' % (name, 'ok' if wrong == 0 else '%d WRONG' % wrong))
+        failed = failed or wrong != 0
+    print('4 gamepads: %.0f events/s' % run(eventCount))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,143 @@
+# coding: utf-8
+"""
+Replays a scripted gamepad session as fast as possible.
+
+Writes a session log of stick sweeps and mode button presses for the
+Controllers.Joystick mapping, then times replaying it through updateState,
+updateStateBatch and the drive loop from drive.py (against motors that do
+nothing). Speeds are also given as a multiple of real time.
+
+First it checks that a log cut short at any byte, as a recording is when the
+program stops part way through a write, replays every whole event before the
+cut and then ends like an unplugged device.
+
+Run from the repository root:
+    python -m benchmarks.replay [event count]
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from Gamepad.Gamepad import Gamepad
+from Gamepad.Recording import LOG_HEADER, ReplayGamepad, writeSessionLog
+from benchmarks.fake_devices import NullMotor, axisSweep, initEvents
+import drive
+
+AXIS_COUNT = 7
+BUTTON_COUNT = 14
+MODEA = 12
+
+
+def scriptedSession(eventCount):
+    """A stick sweep with MODEA toggled every 500 events, one event every 5 ms."""
+    events = initEvents(AXIS_COUNT, BUTTON_COUNT)
+    for timestamp, value, eventType, index in axisSweep(eventCount, 2):
+        timestamp *= 5
+        if timestamp % 2500 == 0:
+            events.append((timestamp, (timestamp // 2500) % 2, Gamepad.EVENT_CODE_BUTTON, MODEA))
+        events.append((timestamp, value, eventType, index))
+    return events
+
+
+def checkTruncated(eventCount = 20):
+    """Returns the number of cut points at which replaying a truncated log went wrong."""
+    events = scriptedSession(eventCount)
+    directory = tempfile.mkdtemp(prefix = 'replay-')
+    logPath = os.path.join(directory, 'session.jslog')
+    writeSessionLog(logPath, events)
+    with open(logPath, 'rb') as logFile:
+        data = logFile.read()
+    # The anchor writeSessionLog starts with takes 16 bytes, every event after it 8
+    eventEnds = [len(LOG_HEADER) + 16 + 8 * (number + 1) for number in range(len(events))]
+    cutPath = os.path.join(directory, 'cut.jslog')
+    wrong = 0
+    for cut in range(len(LOG_HEADER) + 1, len(data)):
+        with open(cutPath, 'wb') as cutFile:
+            cutFile.write(data[:cut])
+        replay = ReplayGamepad(cutPath, speed = None)
+        read = 0
+        try:
+            while True:
+                read += len(replay._getPendingEventsRaw())
+        except IOError:
+            pass
+        except Exception:
+            wrong += 1
+            continue
+        finally:
+            del replay
+        if read != sum(1 for end in eventEnds if end <= cut):
+            wrong += 1
+    os.unlink(cutPath)
+    os.unlink(logPath)
+    os.rmdir(directory)
+    return wrong
+
+
+def run(eventCount = 200000):
+    events = scriptedSession(eventCount)
+    duration = (events[-1][0] - events[0][0]) / 1000.0
+    logPath = os.path.join(tempfile.mkdtemp(prefix = 'replay-'), 'session.jslog')
+    writeSessionLog(logPath, events)
+    results = []
+
+    def replay(name, body):
+        gamepad = ReplayGamepad(logPath, 'Joystick', speed = None)
+        start = time.perf_counter()
+        ticks = body(gamepad)
+        elapsed = time.perf_counter() - start
+        results.append({
+            'case': name,
+            'events_per_sec': len(events) / elapsed,
+            'ticks': ticks,
+            'times_real_time': duration / elapsed,
+        })
+
+    def updateState(gamepad):
+        try:
+            while True:
+                gamepad.updateState()
+        except IOError:
+            return 0
+
+    def updateStateBatch(gamepad):
+        try:
+            while True:
+                gamepad.updateStateBatch()
+        except IOError:
+            return 0
+
+    def driveLoop(gamepad):
+        left, right = NullMotor(), NullMotor()
+        # The update thread ends with an IOError at the end of the log, just like an unplugged pad
+        excepthook = threading.excepthook
+        threading.excepthook = lambda args: None
+        try:
+            gamepad.startBackgroundUpdates(batched = True, coalesceAxes = True)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                drive.drive_loop(gamepad, left, right)
+            gamepad.updateThread.join()
+        finally:
+            threading.excepthook = excepthook
+        return left.commands
+
+    replay('updateState', updateState)
+    replay('updateStateBatch', updateStateBatch)
+    replay('drive_loop', driveLoop)
+    os.unlink(logPath)
+    os.rmdir(os.path.dirname(logPath))
+    return results
+
+
+if __name__ == '__main__':
+    eventCount = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    wrong = checkTruncated()
+    print('truncated logs: %s' % ('ok' if wrong == 0 else '%d cut points WRONG' % wrong))
+    print('%-18s %12s %10s %14s' % ('case', 'events/s', 'loop ticks', 'x real time'))
+    for result in run(eventCount):
+        print('%-18s %12.0f %10u %14.0f' % (result['case'], result['events_per_sec'],
+                                            result['ticks'], result['times_real_time']))
+    sys.exit(1 if wrong else 0)
@@ -0,0 +1,159 @@
+# coding: utf-8
+"""
+How the control loop fares when the serial port stalls, writing directly and through a SerialWriter.
+
+A loop ticking at RATE_HZ sends a numbered command every tick into a pty
+standing in for the VESC's USB port. Part way through, the far end stops reading
+for STALL seconds, as a stuck USB serial adapter would, then recovers. Reports
+the longest tick, how many commands were superseded and whether the newest
+command was the last one to arrive once the port recovered.
+
+It also checks that a MotorGroup whose command the writer failed to write sends
+it again on the next tick, rather than suppressing it as unchanged until its
+keepalive is due.
+
+A pty always reports out_waiting as 0, so here the writer only sees the stall as
+its own write blocking. A real USB serial adapter also reports its queued bytes,
+which lets the writer hold off before it gets that far.
+
+Run from the repository root:
+    python -m benchmarks.serial_writer [stall seconds]
+"""
+import struct
+import sys
+import threading
+import time
+
+from benchmarks.fake_devices import PtyLoopback
+from serial_writer import SerialWriter
+
+RATE_HZ = 1000
+# Big enough to fill the pty's buffer during the stall
+COMMAND_SIZE = 64
+COMMAND_FORMAT = '>I%dx' % (COMMAND_SIZE - 4)
+
+
+def runLoop(send, loopback, seconds, stall):
+    """Ticks for seconds, with the port stalled from a third of the way in. Returns (ticks, longest tick in seconds)."""
+    # Stalled and recovered from another thread, as a blocked write would hold up this one
+    stallStart = threading.Timer(seconds / 3, loopback.stalled.set)
+    stallEnd = threading.Timer(seconds / 3 + stall, loopback.stalled.clear)
+    period = 1.0 / RATE_HZ
+    longest = 0.0
+    tick = 0
+    start = time.perf_counter()
+    stallStart.start()
+    stallEnd.start()
+    while True:
+        now = time.perf_counter()
+        if now - start >= seconds:
+            break
+        send(struct.pack(COMMAND_FORMAT, tick))
+        tick += 1
+        longest = max(longest, time.perf_counter() - now)
+        delay = start + tick * period - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    stallEnd.join()
+    return tick, longest
+
+
+def lastCommand(loopback, timeout = 2.0):
+    """Waits for the port to go quiet, returns the number of the last whole command received."""
+    end = time.monotonic() + timeout
+    received = -1
+    while time.monotonic() < end:
+        if loopback.received == received:
+            break
+        received = loopback.received
+        time.sleep(0.05)
+    tail = loopback.tail[-(len(loopback.tail) // COMMAND_SIZE) * COMMAND_SIZE:]
+    return struct.unpack_from('>I', tail, len(tail) - COMMAND_SIZE)[0]
+
+
+class FlakyPort:
+    """A port whose first writes raise error, by default the OSError a USB serial adapter's do while it resets."""
+
+    def __init__(self, failures, error = None):
+        self.failures = failures
+        self.error = error if error is not None else OSError(5, 'Input/output error')
+        self.written = []
+
+    def write(self, data):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.written.append(bytes(data))
+        return len(data)
+
+    def stop_heartbeat(self):
+        # Called when the VESCMotorController writing through it is deleted
+        pass
+
+
+def checkFailedWrite(timeout = 2.0):
+    """Returns True if a MotorGroup re-sends an unchanged command the writer failed to write,
+    both for an OSError and for an exception which is not one."""
+    return (checkFailedWriteWith(OSError(5, 'Input/output error'), timeout) and
+            checkFailedWriteWith(TypeError('a bytes-like object is required'), timeout))
+
+
+def checkFailedWriteWith(error, timeout):
+    from motor_controller import MotorGroup, VESCMotorController
+
+    port = FlakyPort(1, error)
+    writer = SerialWriter(port, max_waiting = None)
+    group = MotorGroup([VESCMotorController(port)], keepalive_interval = 60.0, writer = writer)
+    writer.start()
+    try:
+        group.set_rpm([0.5])
+        end = time.monotonic() + timeout
+        while writer.errors == 0 and time.monotonic() < end:
+            time.sleep(0.001)
+        group.set_rpm([0.5])
+    finally:
+        writer.stop()
+    return writer.errors == 1 and len(port.written) == 1
+
+
+def run(stall = 0.5):
+    """Returns a list of result dictionaries, one for direct writes and one for a SerialWriter."""
+    seconds = stall * 3
+    results = []
+
+    loopback = PtyLoopback()
+    try:
+        ticks, longest = runLoop(loopback.port.write, loopback, seconds, stall)
+        results.append({'mode': 'direct', 'ticks': ticks, 'longest_tick_ms': longest * 1e3,
+                        'superseded': 0, 'newest_delivered': lastCommand(loopback) == ticks - 1})
+    finally:
+        loopback.close()
+
+    loopback = PtyLoopback()
+    writer = SerialWriter(loopback.port, max_waiting = 4 * COMMAND_SIZE)
+    writer.start()
+    try:
+        ticks, longest = runLoop(lambda command: writer.submit('motors', command), loopback, seconds, stall)
+        writer.stop()
+        stats = writer.stats()
+        results.append({'mode': 'SerialWriter', 'ticks': ticks, 'longest_tick_ms': longest * 1e3,
+                        'superseded': stats['superseded'], 'newest_delivered': lastCommand(loopback) == ticks - 1,
+                        'backpressure_waits': stats['backpressure_waits'],
+                        'queued_p99_ms': writer.latency.histograms['queued'].percentile(99) / 1e6})
+    finally:
+        writer.stop()
+        loopback.close()
+    return results
+
+
+if __name__ == '__main__':
+    stall = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    failed = False
+    for result in run(stall):
+        print(', '.join('%s %s' % (name, round(value, 3) if isinstance(value, float) else value)
+                        for name, value in result.items()))
+        failed = failed or not result['newest_delivered']
+    resent = checkFailedWrite()
+    print('failed write resent: %s' % resent)
+    failed = failed or not resent
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,84 @@
+# coding: utf-8
+"""
+Checks ShapingTable lookups against the analytic kinematics and compares their cost.
+
+Every lookup must be within ERROR_BOUND of the analytic wheel speeds. The deadzone
+step is handled exactly, so the bound is set by bilinear interpolation across the
+kinks where desaturation starts, which shrinks in proportion to the grid step.
+
+Run from the repository root:
+    python -m benchmarks.shaping [samples]
+"""
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+from shaping import IK_FUNCTIONS, ShapingTable
+
+ERROR_BOUND = 0.01
+
+
+def samples(count, seed = 1):
+    """Random stick positions, plus positions packed around the deadband edges and the range ends."""
+    generator = random.Random(seed)
+    points = [(generator.uniform(-1.0, 1.0), generator.uniform(-1.0, 1.0)) for _ in range(count)]
+    edges = [-1.0, -0.05, 0.0, 0.05, 1.0]
+    for edge in edges:
+        for _ in range(count // 20):
+            near = min(1.0, max(-1.0, edge + generator.uniform(-0.01, 0.01)))
+            points.append((near, generator.uniform(-1.0, 1.0)))
+            points.append((generator.uniform(-1.0, 1.0), near))
+    # Raw js axis values, as the loop sees them
+    for _ in range(count // 10):
+        points.append((generator.randint(-32767, 32767) / 32767.0, generator.randint(-32767, 32767) / 32767.0))
+    return points
+
+
+def check(count = 50000, directory = None):
+    """Returns a list of (kinematics, max error, mean error, build or load seconds) results."""
+    points = samples(count)
+    results = []
+    for ik, ik_function in IK_FUNCTIONS.items():
+        start = time.perf_counter()
+        table = ShapingTable.cached(ik, directory = directory)
+        elapsed = time.perf_counter() - start
+        worst = 0.0
+        total = 0.0
+        for speed, rotation in points:
+            expected_left, expected_right = ik_function(speed, rotation)
+            left, right = table.lookup(speed, rotation)
+            error = max(abs(left - expected_left), abs(right - expected_right))
+            total += error
+            worst = max(worst, error)
+        results.append((ik, worst, total / len(points), elapsed))
+    return results
+
+
+def run(calls = 200000):
+    """Returns a list of (case, nanoseconds per call) results."""
+    with tempfile.TemporaryDirectory() as directory:
+        table = ShapingTable.cached('arcade', directory = directory)
+    arcade = IK_FUNCTIONS['arcade']
+    results = []
+    for name, call in [('arcade_drive_ik', lambda: arcade(0.42, -0.31)),
+                       ('ShapingTable.lookup', lambda: table.lookup(0.42, -0.31))]:
+        best = min(timeit.repeat(call, number = calls, repeat = 5))
+        results.append((name, best * 1e9 / calls))
+    return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for label in ('build', 'load'):
+            for ik, worst, mean, elapsed in check(count, directory):
+                status = 'ok' if worst <= ERROR_BOUND else 'OVER BOUND %g' % ERROR_BOUND
+                print('%-10s %-5s max error %.6f mean %.2e  %6.3f s  %s' % (ik, label, worst, mean, elapsed, status))
+                failed = failed or worst > ERROR_BOUND
+    print('')
+    for name, cost in run():
+        print('%-22s %8.1f ns/call' % (name, cost))
+    sys.exit(1 if failed else 0)
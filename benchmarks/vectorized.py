@@ -0,0 +1,108 @@
+# coding: utf-8
+"""
+Checks the NumPy versions in vectorized.py against the scalar mathutils / drive
+functions, then compares their throughput.
+
+The check runs every function over random inputs, across and beyond the stick
+range, plus the edge cases where the scalar code branches (zero, the deadband
+edges, exactly +/-1 and both wheels stopped), and requires the results to be equal.
+
+Run from the repository root:
+    python -m benchmarks.vectorized [samples]
+"""
+import sys
+import time
+
+import numpy as np
+
+import drive
+import mathutils
+import vectorized
+
+EDGE_CASES = [0.0, -0.0, 0.05, -0.05, 0.0499999, -0.0500001, 1.0, -1.0, 0.5, -0.5, 1.5, -2.0, 1e-12]
+MAX_RPM = 20000
+
+
+def samples(count, seed = 1):
+    """Returns (speed, rotation) arrays: edge case pairs followed by random values in [-1.5, 1.5]."""
+    edges = np.array(EDGE_CASES)
+    speed = np.repeat(edges, len(edges))
+    rotation = np.tile(edges, len(edges))
+    generator = np.random.default_rng(seed)
+    randomSpeed = generator.uniform(-1.5, 1.5, count)
+    randomRotation = generator.uniform(-1.5, 1.5, count)
+    # Some exact grid points as seen from a quantized stick
+    randomSpeed[::7] = np.round(randomSpeed[::7] * 32767) / 32767
+    return np.concatenate([speed, randomSpeed]), np.concatenate([rotation, randomRotation])
+
+
+def _pairCheck(name, scalar, vector, speed, rotation):
+    expected = np.array([scalar(s, r) for s, r in zip(speed.tolist(), rotation.tolist())], dtype = float)
+    left, right = vector(speed, rotation)
+    mismatches = np.count_nonzero((expected[:, 0] != left) | (expected[:, 1] != right))
+    return name, mismatches
+
+
+def _singleCheck(name, scalar, vector, values):
+    expected = np.array([scalar(value) for value in values.tolist()], dtype = float)
+    mismatches = np.count_nonzero(expected != vector(values))
+    return name, mismatches
+
+
+def check(count = 20000):
+    """Returns a list of (function, number of mismatching samples) results."""
+    speed, rotation = samples(count)
+    return [
+        _singleCheck('map_range', lambda x: mathutils.map_range(x, -1, 1, -MAX_RPM, MAX_RPM),
+                     lambda x: vectorized.map_range(x, -1, 1, -MAX_RPM, MAX_RPM), speed),
+        _singleCheck('speed_to_command', lambda x: int(mathutils.map_range(x, -1, 1, -MAX_RPM, MAX_RPM)),
+                     lambda x: vectorized.speed_to_command(x, MAX_RPM), speed),
+        _singleCheck('deadzone', lambda x: mathutils.deadzone(x, 0.05), lambda x: vectorized.deadzone(x, 0.05), speed),
+        _singleCheck('square', mathutils.square, vectorized.square, speed),
+        _singleCheck('clamp', lambda x: mathutils.clamp(x, -1, 1), lambda x: vectorized.clamp(x, -1, 1), speed),
+        _singleCheck('apply_deadband', lambda x: mathutils.apply_deadband(x, 0.05, 1.0),
+                     lambda x: vectorized.apply_deadband(x, 0.05, 1.0), speed),
+        _singleCheck('apply_deadband inf', lambda x: mathutils.apply_deadband(x, 0.05, float('inf')),
+                     lambda x: vectorized.apply_deadband(x, 0.05, float('inf')), speed),
+        _pairCheck('scale_and_deadzone', mathutils.scale_and_deadzone_inputs,
+                   vectorized.scale_and_deadzone_inputs, speed, rotation),
+        _pairCheck('scale_and_deadzone no sq', lambda s, r: mathutils.scale_and_deadzone_inputs(s, r, False),
+                   lambda s, r: vectorized.scale_and_deadzone_inputs(s, r, False), speed, rotation),
+        _pairCheck('desaturate', mathutils.desaturate_wheel_speeds,
+                   vectorized.desaturate_wheel_speeds, speed, rotation),
+        _pairCheck('desaturate use_max=False', lambda l, r: mathutils.desaturate_wheel_speeds(l, r, False),
+                   lambda l, r: vectorized.desaturate_wheel_speeds(l, r, False), speed, rotation),
+        _pairCheck('arcade_drive_ik', drive.arcade_drive_ik, vectorized.arcade_drive_ik, speed, rotation),
+        _pairCheck('curvture_drive_ik', drive.curvture_drive_ik, vectorized.curvture_drive_ik, speed, rotation),
+    ]
+
+
+def run(count = 1000000):
+    """Returns a list of (case, samples per second) results for arcade_drive_ik."""
+    speed, rotation = samples(count)
+    speedList = speed.tolist()
+    rotationList = rotation.tolist()
+    results = []
+    start = time.perf_counter()
+    for s, r in zip(speedList, rotationList):
+        drive.arcade_drive_ik(s, r)
+    results.append(('scalar arcade_drive_ik', len(speedList) / (time.perf_counter() - start)))
+    start = time.perf_counter()
+    vectorized.arcade_drive_ik(speed, rotation)
+    results.append(('vectorized arcade_drive_ik', len(speedList) / (time.perf_counter() - start)))
+    start = time.perf_counter()
+    vectorized.speed_to_command(vectorized.arcade_drive_ik(speed, rotation)[0], MAX_RPM)
+    results.append(('vectorized ik + speed_to_command', len(speedList) / (time.perf_counter() - start)))
+    return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    failed = False
+    for name, mismatches in check():
+        print('%-28s %s' % (name, 'equal' if mismatches == 0 else '%d MISMATCHES' % mismatches))
+        failed = failed or mismatches != 0
+    print('')
+    for name, rate in run(count):
+        print('%-34s %14.0f samples/s' % (name, rate))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,140 @@
+# coding: utf-8
+"""
+Polling every motor's measurements in turn compared with pipelined through a VESCTransport.
+
+A FakeVESC on a pty answers GetValues for the local VESC and the CAN forwarded
+ones after a simulated round trip, with jitter so replies come back out of
+order. Polling in turn is a blocking write then read for each motor, as with
+pyvesc's VESC. Pipelined, a MeasurementPoller given the transport sends every
+request at once and awaits the replies together. Every reply is checked against
+the RPM of the controller it should have come from. Needs pyvesc and pyserial.
+
+checkLateReplies then polls with a timeout shorter than many of the replies
+take, so replies keep arriving after their requests gave up. Each must be
+dropped, never handed to the next request for another controller.
+
+checkHighIds polls controllers whose IDs do not fit a signed byte, which must
+still be matched, and asks a controller that never replies for its RPM, which
+must raise TimeoutError.
+
+Run from the repository root:
+    python -m benchmarks.vesc_transport [polls]
+"""
+import sys
+import time
+
+from benchmarks.fake_devices import FakeVESC
+from measurements import MeasurementPoller
+from motor_controller import CanVESC, VESCMotorController
+from vesc_transport import VESCTransport
+
+LOCAL_ID = 42
+CAN_IDS = [78, 79, 80]
+LATENCY = 0.001
+JITTER = 0.001
+
+
+def timePolls(poller, motorIds, polls):
+    """Returns (milliseconds per poll, polls with a missing or misrouted reply)."""
+    expected = [FakeVESC.rpmFor(motorId) for motorId in motorIds]
+    wrong = 0
+    start = time.perf_counter()
+    for _ in range(polls):
+        poller.latest = [None] * len(motorIds)
+        poller.poll()
+        if [poller.rpm(index, None) for index in range(len(motorIds))] != expected:
+            wrong += 1
+    return (time.perf_counter() - start) * 1e3 / polls, wrong
+
+
+def checkLateReplies(polls = 200):
+    """Returns a dictionary of the replies delivered, how many went to the wrong motor and how many came late."""
+    fake = FakeVESC(LOCAL_ID, CAN_IDS, LATENCY, 4 * JITTER)
+    transport = VESCTransport(fake.port, local_id = LOCAL_ID, timeout = LATENCY + 2 * JITTER)
+    transport.start()
+    try:
+        motors = [VESCMotorController(transport)] + [CanVESC(transport, canId) for canId in CAN_IDS]
+        expected = [FakeVESC.rpmFor(motorId) for motorId in [LOCAL_ID] + CAN_IDS]
+        poller = MeasurementPoller(motors, transport = transport)
+        delivered = 0
+        misrouted = 0
+        for _ in range(polls):
+            poller.latest = [None] * len(motors)
+            poller.poll()
+            for index, rpm in enumerate(expected):
+                if poller.rpm(index, None) is not None:
+                    delivered += 1
+                    misrouted += poller.rpm(index) != rpm
+        # The last late replies still on their way
+        time.sleep(LATENCY + 4 * JITTER)
+        stats = transport.stats()
+        del motors, poller
+    finally:
+        transport.stop()
+        fake.close()
+    return {'delivered': delivered, 'misrouted': misrouted, 'timeouts': stats['timeouts'],
+            'unmatched': stats['unmatched']}
+
+
+def checkHighIds(polls = 20):
+    """Returns the number of wrong results polling controller IDs of 128 and over and one which never replies."""
+    localId = 200
+    canIds = [130, 255]
+    fake = FakeVESC(localId, canIds, LATENCY, JITTER)
+    transport = VESCTransport(fake.port, local_id = localId, timeout = 0.05)
+    transport.start()
+    try:
+        motors = [VESCMotorController(transport)] + [CanVESC(transport, canId) for canId in canIds]
+        wrong = 0
+        for poller in (MeasurementPoller(motors), MeasurementPoller(motors, transport = transport)):
+            wrong += timePolls(poller, [localId] + canIds, polls)[1]
+        try:
+            CanVESC(transport, 99).get_rpm()
+            wrong += 1
+        except TimeoutError:
+            pass
+        del motors, poller
+    finally:
+        transport.stop()
+        fake.close()
+    return wrong
+
+
+def run(polls = 200):
+    """Returns a list of result dictionaries, one for each number of motors and way of polling."""
+    fake = FakeVESC(LOCAL_ID, CAN_IDS, LATENCY, JITTER)
+    transport = VESCTransport(fake.port, local_id = LOCAL_ID)
+    transport.start()
+    try:
+        local = VESCMotorController(transport)
+        forwarded = [CanVESC(transport, canId) for canId in CAN_IDS]
+        results = []
+        for count in (2, 4):
+            motors = [local] + forwarded[:count - 1]
+            motorIds = [LOCAL_ID] + CAN_IDS[:count - 1]
+            for mode, poller in (('in turn', MeasurementPoller(motors)),
+                                 ('pipelined', MeasurementPoller(motors, transport = transport))):
+                milliseconds, wrong = timePolls(poller, motorIds, polls)
+                results.append({'mode': mode, 'motors': count, 'ms_per_poll': milliseconds, 'wrong': wrong})
+        del local, forwarded, motors, poller
+    finally:
+        transport.stop()
+        fake.close()
+    return results
+
+
+if __name__ == '__main__':
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    failed = False
+    for result in run(polls):
+        print('%d motors %-10s %6.2f ms/poll  %d wrong' % (result['motors'], result['mode'], result['ms_per_poll'],
+                                                       result['wrong']))
+        failed = failed or result['wrong'] != 0
+    late = checkLateReplies(polls)
+    print('late replies: %d delivered, %d misrouted, %d timeouts, %d unmatched'
+          % (late['delivered'], late['misrouted'], late['timeouts'], late['unmatched']))
+    failed = failed or late['misrouted'] != 0
+    highIds = checkHighIds()
+    print('high IDs: %s' % ('ok' if highIds == 0 else '%d WRONG' % highIds))
+    failed = failed or highIds != 0
+    sys.exit(1 if failed else 0)
@@ -4,7 +4,7 @@ from typing import Tuple
 import serial
 from pyvesc import VESC
 import time
-from motor_controller import VESCMotorController, CanVESC, MotorController
+from motor_controller import VESCMotorController, CanVESC, MotorController, reply_controller_id
 
 LEFT_MOTOR_ID = 42
 RIGHT_MOTOR_ID = 78
@@ -46,10 +46,9 @@ def get_motor_controllers() -> Tuple[MotorController, MotorController]:
                 print(f"Connecting to {port}")
                 try:
                     vesc = VESC(serial_port=port)
-                    byte = vesc.get_measurements().__dict__['app_controller_id']
-                    vesc_id = int.from_bytes(byte, byteorder='big', signed=True)
+                    vesc_id = reply_controller_id(vesc.get_measurements())
                     if vesc_id == LEFT_MOTOR_ID:
-                        left_vesc = VESCMotorController(vesc)
+                        left_vesc = VESCMotorController(vesc, vesc_id)
                 except:
                     print("Error connecting to VESC, retrying")
         print("No VESCs found, retrying")
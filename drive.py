@@ -0,0 +1,196 @@
+"""Drive kinematics and the main control loop for the couch."""
+import time
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import Gamepad.Gamepad as Gamepad
+import mathutils
+from latency import JsClock, LatencyTracker
+from measurements import MeasurementPoller
+from pipeline import Deadzone, Desaturate, Mix, ModeScale, Pipeline, Square, Stage
+from scheduler import FixedRateScheduler
+from telemetry import TelemetryLogger
+
+if TYPE_CHECKING:
+    from motor_controller import MotorController, MotorGroup
+
+SLOW_SPEED = 0.3
+MEDIUM_SPEED = 0.5
+MAX_SPEED = 1
+
+# Stages recorded by drive_loop, in the order they happen
+LATENCY_STAGES = ('event_to_read', 'read_to_tick', 'ik', 'command', 'event_to_command')
+
+
+def curvture_drive_ik(speed: float, rotation: float) -> Tuple[float, float]:
+    """Curvature drive inverse kinematics for a differential drive platform.
+
+    Args:
+      speed: The speed along the X axis [-1.0..1.0]. Forward is positive.
+      rotation: The normalized curvature [-1.0..1.0]. Counterclockwise is positive.
+
+    Returns:
+      Wheel speeds [-1.0..1.0].
+    """
+    speed, rotation = mathutils.scale_and_deadzone_inputs(speed, rotation, square_rotation=False)
+    left_speed = speed + abs(speed) * rotation
+    right_speed = speed - abs(speed) * rotation
+    return mathutils.desaturate_wheel_speeds(left_speed, right_speed)
+
+
+def arcade_drive_ik(speed: float, rotation: float) -> Tuple[float, float]:
+    """Arcade drive inverse kinematics for a differential drive platform.
+
+    Args:
+      speed: The speed along the X axis [-1.0..1.0]. Forward is positive.
+      rotation: The normalized curvature [-1.0..1.0]. Counterclockwise is positive.
+
+    Returns:
+      Wheel speeds [-1.0..1.0].
+    """
+    speed, rotation = mathutils.scale_and_deadzone_inputs(speed, rotation)
+    left_speed = speed + rotation
+    right_speed = speed - rotation
+    return mathutils.desaturate_wheel_speeds(left_speed, right_speed)
+
+
+def get_speed_multiplier(mode_a: bool, mode_b: bool) -> float:
+    if mode_a:
+        return MEDIUM_SPEED
+    elif mode_b:
+        return MAX_SPEED
+    else:
+        return SLOW_SPEED
+
+
+def arcade_pipeline(*extra_stages: Stage) -> Pipeline:
+    """Returns a Pipeline doing arcade_drive_ik then get_speed_multiplier, followed by any extra stages.
+
+    Args:
+      extra_stages: Stages applied to the final wheel speeds, e.g. SlewRateLimit and Clamp.
+    """
+    return Pipeline([Deadzone(0.05), Square(), Mix('arcade'), Desaturate(),
+                     ModeScale(SLOW_SPEED, MEDIUM_SPEED, MAX_SPEED), *extra_stages])
+
+
+def stop_motors(left_motor: 'MotorController', right_motor: 'MotorController') -> None:
+    """Commands both motors to zero RPM, holding the couch still."""
+    left_motor.set_rpm(0)
+    right_motor.set_rpm(0)
+
+
+def drive_loop(joystick: Gamepad.Gamepad, left_motor: 'MotorController', right_motor: 'MotorController',
+               latency: Optional[LatencyTracker] = None, scheduler: Optional[FixedRateScheduler] = None,
+               pipeline: Optional[Pipeline] = None,
+               telemetry: Optional[TelemetryLogger] = None, measurements: Optional[MeasurementPoller] = None,
+               motors: Optional['MotorGroup'] = None) -> None:
+    """Drives the motors from the joystick until it disconnects.
+
+    The joystick must already be kept up to date, e.g. by startBackgroundUpdates.
+
+    Args:
+      joystick: The joystick to read.
+      left_motor: The left motor controller.
+      right_motor: The right motor controller.
+      latency: If given, each tick with new input records the time from the event
+        being stamped by the kernel through to the motor commands being written,
+        split into the stages in LATENCY_STAGES.
+      scheduler: If given, paces the loop at its fixed rate. Without one the loop
+        runs as fast as the motor controllers allow.
+      pipeline: If given, replaces arcade_drive_ik and get_speed_multiplier. A
+        pipeline with state, such as a slew rate limit, runs every tick.
+      telemetry: If given, records the inputs, wheel speeds and RPMs of every tick.
+      measurements: A poller for (left_motor, right_motor) to take the RPMs from.
+        The loop never asks the motors itself, without one the RPMs are 0.
+      motors: A MotorGroup of (left_motor, right_motor). If given, both commands
+        go out through it in a single write instead of one write per motor.
+    """
+    # Resolve the controls once so each tick only indexes the snapshot
+    x_axis = joystick.axisHandle('X')
+    y_axis = joystick.axisHandle('Y')
+    trigger = joystick.buttonHandle('TRIGGER')
+    mode_a = joystick.buttonHandle('MODEA')
+    mode_b = joystick.buttonHandle('MODEB')
+
+    shape = None if pipeline is None else pipeline.compile()
+    shape_every_tick = pipeline is not None and pipeline.stateful
+    js_clock = JsClock()
+    inputs = joystick.snapshot()
+    last_sequence = inputs.sequence
+    ik_sequence = None
+    last_controls = None
+    left_rpm = right_rpm = 0
+    if scheduler is not None:
+        scheduler.reset()
+    while joystick.isConnected():
+        if scheduler is not None:
+            scheduler.wait()
+        # Read every input from the same moment, reusing the snapshot each tick
+        joystick.snapshot(inputs)
+        if latency is not None:
+            tick_start = time.monotonic_ns()
+        # Only redo the kinematics when a control we use has changed
+        if inputs.sequence != ik_sequence or shape_every_tick:
+            ik_sequence = inputs.sequence
+            controls = (x_axis.read(inputs), y_axis.read(inputs), trigger.read(inputs),
+                        mode_a.read(inputs), mode_b.read(inputs))
+            if controls != last_controls or shape_every_tick:
+                last_controls = controls
+                joystick_horizontal, joystick_vertical, use_current, mode_a_pressed, mode_b_pressed = controls
+                mode = 1 if mode_a_pressed else (2 if mode_b_pressed else 0)
+                if shape is not None:
+                    ik_left, ik_right = shape(-joystick_vertical, joystick_horizontal, mode_a_pressed, mode_b_pressed)
+                else:
+                    ik_left, ik_right = arcade_drive_ik(-joystick_vertical, joystick_horizontal)
+                    speed_multiplier = get_speed_multiplier(mode_a_pressed, mode_b_pressed)
+                    ik_left *= speed_multiplier
+                    ik_right *= speed_multiplier
+        if latency is not None:
+            ik_end = time.monotonic_ns()
+
+        # Cached values, however slow or failing the motors are to reply
+        if measurements is not None:
+            left_rpm = measurements.rpm(0)
+            right_rpm = measurements.rpm(1)
+
+        if telemetry is not None:
+            telemetry.record(time.monotonic_ns(), -joystick_vertical, joystick_horizontal, ik_left, ik_right,
+                             left_rpm, right_rpm, mode, use_current)
+
+        if latency is not None:
+            command_start = time.monotonic_ns()
+        # Sent every tick, a KeepaliveMotorController or MotorGroup drops the ones that have not changed
+        if motors is not None:
+            if use_current:
+                motors.set_current((ik_left, ik_right))
+            else:
+                motors.set_rpm((ik_left, ik_right))
+        elif use_current:
+            left_motor.set_current(ik_left)
+            right_motor.set_current(ik_right)
+        else:
+            left_motor.set_rpm(ik_left)
+            right_motor.set_rpm(ik_right)
+
+        if latency is not None:
+            command_end = time.monotonic_ns()
+            latency.record('ik', tick_start, ik_end)
+            latency.record('command', command_start, command_end)
+            # Only ticks acting on new input say anything about input latency
+            if inputs.sequence != last_sequence and inputs.readTime:
+                last_sequence = inputs.sequence
+                latency.record('read_to_tick', inputs.readTime, tick_start)
+                if inputs.timestamp:
+                    js_clock.observe(inputs.timestamp, inputs.readTime)
+                    stamped = js_clock.to_monotonic_ns(inputs.timestamp)
+                    latency.record('event_to_read', stamped, inputs.readTime)
+                    latency.record('event_to_command', stamped, command_end)
+
+        # if left_rpm >= 0 or ik_left >= 0:
+        #     left_motor.set_current(ik_left)
+        # else:
+        #     left_motor.set_rpm(0)
+        #
+        # if right_rpm >= 0 or ik_right >= 0:
+        #     right_motor.set_current(ik_right)
+        # else:
+        #     right_motor.set_rpm(0)
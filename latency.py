@@ -0,0 +1,199 @@
+"""Input-to-motor latency measurement.
+
+Joystick events carry a wrapping millisecond timestamp from the kernel, while
+the rest of the loop runs on time.monotonic_ns. JsClock maps one onto the
+other, and LatencyTracker keeps an HDR-style histogram per stage of the loop
+so percentiles can be dumped on demand, e.g. with `kill -USR1 <pid>`.
+"""
+import signal
+import sys
+import threading
+from typing import Dict, Iterable, Optional, TextIO
+
+JS_CLOCK_WRAP = 1 << 32
+NS_PER_MS = 1_000_000
+
+
+class JsClock:
+    """Maps js event timestamps (uint32 milliseconds) to time.monotonic_ns.
+
+    The two clocks run at the same rate but from unknown origins. Every event is
+    read some time after the kernel stamped it, so the smallest (read time - stamp)
+    seen so far is the best estimate of the offset between them. Latencies from
+    this clock are therefore measured relative to the fastest read observed, and
+    are exact to within that read's delay plus the 1 ms stamp resolution.
+    """
+
+    def __init__(self) -> None:
+        self.offset_ns: Optional[int] = None
+        self._last_stamp = None
+        self._wraps = 0
+
+    def _unwrap(self, stamp_ms: int) -> int:
+        if self._last_stamp is not None and stamp_ms < self._last_stamp and self._last_stamp - stamp_ms > JS_CLOCK_WRAP // 2:
+            self._wraps += 1
+        self._last_stamp = stamp_ms
+        return stamp_ms + self._wraps * JS_CLOCK_WRAP
+
+    def observe(self, stamp_ms: int, read_ns: int) -> None:
+        """Feeds in an event timestamp and the monotonic time it was read at.
+
+        Args:
+          stamp_ms: The js timestamp of the event.
+          read_ns: time.monotonic_ns when the event was read from the device.
+        """
+        offset = read_ns - self._unwrap(stamp_ms) * NS_PER_MS
+        if self.offset_ns is None or offset < self.offset_ns:
+            self.offset_ns = offset
+
+    def to_monotonic_ns(self, stamp_ms: int) -> Optional[int]:
+        """Returns the time.monotonic_ns an event was stamped at, None before anything is observed."""
+        if self.offset_ns is None:
+            return None
+        unwrapped = stamp_ms + self._wraps * JS_CLOCK_WRAP
+        if self._last_stamp is not None:
+            if stamp_ms - self._last_stamp > JS_CLOCK_WRAP // 2:
+                # Stamped just before the last wrap
+                unwrapped -= JS_CLOCK_WRAP
+            elif self._last_stamp - stamp_ms > JS_CLOCK_WRAP // 2:
+                # Stamped after a wrap not observed yet
+                unwrapped += JS_CLOCK_WRAP
+        return unwrapped * NS_PER_MS + self.offset_ns
+
+
+class LatencyHistogram:
+    """A log-linear histogram of nanosecond durations, in the style of HdrHistogram.
+
+    Values below 2**significant_bits are counted exactly, above that each power of
+    two is split into 2**(significant_bits - 1) equal buckets, so any value is
+    recorded to within 1 part in 2**(significant_bits - 1). Recording is a couple of
+    integer operations and a list increment, with no allocation.
+
+    Args:
+      significant_bits: Precision of each bucket, 7 gives better than 1.6%.
+      highest_ns: Largest value tracked, anything above is counted in the top bucket.
+    """
+
+    def __init__(self, significant_bits: int = 7, highest_ns: int = 60 * 1_000_000_000) -> None:
+        self.significant_bits = significant_bits
+        self._half = 1 << (significant_bits - 1)
+        self.highest_ns = highest_ns
+        self.counts = [0] * (self._index(highest_ns) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.significant_bits
+        if shift <= 0:
+            return value
+        return shift * self._half + (value >> shift)
+
+    def _bucket_value(self, index: int) -> int:
+        """Returns the middle of the range of values counted in a bucket."""
+        if index < (self._half << 1):
+            return index
+        shift = index // self._half - 1
+        mantissa = index - shift * self._half
+        return (mantissa << shift) + (1 << (shift - 1))
+
+    def record(self, value_ns: int) -> None:
+        """Counts one duration, negative values are counted as zero."""
+        if value_ns < 0:
+            value_ns = 0
+        elif value_ns > self.highest_ns:
+            value_ns = self.highest_ns
+        self.counts[self._index(value_ns)] += 1
+        self.count += 1
+        self.total += value_ns
+        if self.min is None or value_ns < self.min:
+            self.min = value_ns
+        if self.max is None or value_ns > self.max:
+            self.max = value_ns
+
+    def percentile(self, percent: float) -> int:
+        """Returns the duration at or below which percent of the recorded values fall, 0 when empty."""
+        if not self.count:
+            return 0
+        target = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        """Adds the counts of a histogram with the same settings into this one."""
+        if other.significant_bits != self.significant_bits or len(other.counts) != len(self.counts):
+            raise ValueError('Histograms with different settings cannot be merged')
+        for index, bucket_count in enumerate(other.counts):
+            if bucket_count:
+                self.counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def reset(self) -> None:
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+
+class LatencyTracker:
+    """A LatencyHistogram per named stage of the control loop.
+
+    Args:
+      stages: Stage names to report in order, others are added as they are recorded.
+      percentiles: Percentiles shown by report.
+    """
+
+    def __init__(self, stages: Iterable[str] = (), percentiles: Iterable[float] = (50, 90, 99, 99.9)) -> None:
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.percentiles = tuple(percentiles)
+        self.lock = threading.Lock()
+        for stage in stages:
+            self.histograms[stage] = LatencyHistogram()
+
+    def record(self, stage: str, start_ns: int, end_ns: int) -> None:
+        """Records the time between start_ns and end_ns for a stage."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        histogram.record(end_ns - start_ns)
+
+    def report(self) -> str:
+        """Returns a table of the count, percentiles and max of every stage, in milliseconds."""
+        header = f"{'stage':<16}{'count':>9}" + ''.join(f"{'p' + format(p, 'g'):>10}" for p in self.percentiles) + f"{'max':>10}"
+        lines = [header]
+        for stage, histogram in list(self.histograms.items()):
+            row = f"{stage:<16}{histogram.count:>9}"
+            for percent in self.percentiles:
+                row += f"{histogram.percentile(percent) / NS_PER_MS:>10.3f}"
+            row += f"{(histogram.max or 0) / NS_PER_MS:>10.3f}"
+            lines.append(row)
+        return '\n'.join(lines)
+
+    def dump(self, stream: Optional[TextIO] = None) -> None:
+        """Writes the report to stream, stderr by default."""
+        stream = sys.stderr if stream is None else stream
+        stream.write(self.report() + '\n')
+        stream.flush()
+
+    def reset(self) -> None:
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+
+    def install_signal_handler(self, signum: int = signal.SIGUSR1) -> None:
+        """Dumps the report whenever the process receives signum. Must be called from the main thread."""
+        signal.signal(signum, lambda received, frame: self.dump())
@@ -68,7 +68,6 @@ def desaturate_wheel_speeds(left_speed: float, right_speed: float, use_max: bool
 
 def apply_deadband(value: float, deadband: float, max_magnitude: float) -> float:
     """
-    Currently unused.
     Returns 0.0 if the given value is within the specified range around zero. The remaining range
     between the deadband and the maximum magnitude is scaled from 0.0 to the maximum magnitude.
 
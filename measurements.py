@@ -0,0 +1,132 @@
+"""Motor measurements polled off the control thread.
+
+Asking a VESC for its measurements is a GetValues round trip, forwarded over CAN
+for a CanVESC, which can take milliseconds or time out. MeasurementPoller makes
+those requests from its own thread at its own rate and publishes the latest reply
+for each motor, so the control loop only ever reads a cached value and keeps
+sending commands however slow or broken the replies are.
+
+Given a VESCTransport, every motor's GetValues is requested at once and the
+replies are awaited together, so a poll takes one round trip instead of one per
+motor.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, TYPE_CHECKING
+
+from scheduler import FixedRateScheduler
+
+if TYPE_CHECKING:
+    from motor_controller import MotorController
+    from vesc_transport import VESCTransport
+
+NS_PER_S = 1_000_000_000
+
+
+class Measurement(NamedTuple):
+    """One GetValues reply and when it arrived."""
+    values: Any
+    rpm: float
+    time_ns: int
+
+
+class MeasurementPoller:
+    """Polls get_measurements on each motor in turn, keeping the latest reply.
+
+    A failed poll, either an exception or no reply at all, is counted and the
+    previous measurement is kept, so its age shows how stale it is.
+
+    Args:
+      motors: The motor controllers to poll, measurements are read back by index.
+      rate_hz: Polls of every motor per second.
+      clock: Returns the time in nanoseconds, time.monotonic_ns by default.
+      transport: The VESCTransport the motors are on, to request all their
+        measurements at once with get_measurements_async rather than in turn.
+    """
+
+    def __init__(self, motors: Sequence['MotorController'], rate_hz: float = 20.0,
+                 clock: Callable[[], int] = time.monotonic_ns,
+                 transport: Optional['VESCTransport'] = None) -> None:
+        self.motors = list(motors)
+        self.clock = clock
+        self.transport = transport
+        self._stopping = threading.Event()
+        self.scheduler = FixedRateScheduler(rate_hz, clock=clock, sleep=self._stopping.wait)
+        self._thread: Optional[threading.Thread] = None
+        count = len(self.motors)
+        # Each slot is only replaced whole, so a reader never sees half an update
+        self.latest: List[Optional[Measurement]] = [None] * count
+        self.polls = [0] * count
+        self.errors = [0] * count
+        self.consecutive_errors = [0] * count
+        self.last_error: List[Optional[str]] = [None] * count
+
+    def start(self) -> None:
+        """Starts polling in a background thread."""
+        if self._thread is not None:
+            raise RuntimeError('Measurement poller is already running')
+        self._stopping.clear()
+        self.scheduler.reset()
+        self._thread = threading.Thread(target=self._run, name='MeasurementPoller', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the polling thread, waiting for any poll in progress to finish."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            self.scheduler.wait()
+            if self._stopping.is_set():
+                return
+            self.poll()
+
+    def poll(self) -> None:
+        """Polls every motor once, called by the background thread or directly when there is none."""
+        replies = None if self.transport is None else self.transport.run(self._request_all())
+        for index, motor in enumerate(self.motors):
+            self.polls[index] += 1
+            try:
+                if replies is None:
+                    values = motor.get_measurements()
+                elif isinstance(replies[index], BaseException):
+                    raise replies[index]
+                else:
+                    values = replies[index]
+                if values is None:
+                    raise IOError('No reply')
+                measurement = Measurement(values, values.rpm, self.clock())
+            except Exception as e:
+                self.errors[index] += 1
+                self.consecutive_errors[index] += 1
+                self.last_error[index] = f"{type(e).__name__}: {e}"
+                continue
+            self.latest[index] = measurement
+            self.consecutive_errors[index] = 0
+
+    async def _request_all(self) -> List[Any]:
+        return await asyncio.gather(*[motor.get_measurements_async() for motor in self.motors],
+                                    return_exceptions=True)
+
+    def rpm(self, index: int, default: float = 0) -> float:
+        """Returns the latest RPM of a motor without blocking, default if it has never replied."""
+        measurement = self.latest[index]
+        return default if measurement is None else measurement.rpm
+
+    def age(self, index: int) -> Optional[float]:
+        """Returns the seconds since the latest measurement of a motor, None if it has never replied."""
+        measurement = self.latest[index]
+        if measurement is None:
+            return None
+        return (self.clock() - measurement.time_ns) / NS_PER_S
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Returns the poll and error counters and measurement age of each motor."""
+        return [{'polls': self.polls[index], 'errors': self.errors[index],
+                 'consecutive_errors': self.consecutive_errors[index], 'age': self.age(index),
+                 'last_error': self.last_error[index]}
+                for index in range(len(self.motors))]
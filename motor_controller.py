@@ -1,7 +1,223 @@
+import struct
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional, Sequence, Union, TYPE_CHECKING
+
 from pyvesc import VESC, encode, encode_request, decode
 from pyvesc.VESC.messages import SetCurrent, SetRPM, GetValues, SetDutyCycle
+from pyvesc.protocol.base import VESCMessage
 from mathutils import map_range
 
+if TYPE_CHECKING:
+    from serial_writer import SerialWriter
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return tuple(table)
+
+
+# CRC-16/XMODEM, the checksum VESC packets end with
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, crc: int = 0) -> int:
+    """Returns the CRC-16/XMODEM of data, continuing from crc."""
+    table = CRC16_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+class FrameDecoder:
+    """Splits a stream of bytes from a VESC into packet payloads, however the bytes are fragmented.
+
+    Bytes are read into, or copied into, one bytearray allocated up front. A
+    packet is a start byte (2, or 3 for a two byte length), the payload length,
+    the payload, its CRC and an end byte 3. Anything that does not check out is
+    skipped one byte at a time until the next packet that does, so garbage, lost
+    bytes and truncated packets only cost the packets they touched.
+
+    Payloads are memoryviews into the buffer, not copies. One is only valid until
+    more bytes are added, so unpack it before reading again. Unconsumed bytes are
+    moved back to the start of the buffer when more are added, rather than
+    wrapped around its end, so a payload is always one contiguous view.
+
+    Args:
+      capacity: Size of the buffer, at least max_payload + 6 so the longest packet fits.
+      max_payload: Longest payload accepted, longer lengths are taken as garbage
+        rather than waited for. The VESC firmware sends at most 512 bytes, which
+        also rejects a stray end byte 3 just before a packet's start byte 2.
+    """
+
+    def __init__(self, capacity: int = 4096, max_payload: int = 512):
+        if capacity < max_payload + 6:
+            raise ValueError(f"A capacity of {capacity} bytes cannot hold a {max_payload} byte payload")
+        self.capacity = capacity
+        self.max_payload = max_payload
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.frames = 0
+        self.crc_errors = 0
+        self.length_errors = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        """Returns the number of bytes buffered but not yet decoded."""
+        return self._end - self._start
+
+    def writable(self) -> memoryview:
+        """Returns the free space at the end of the buffer, to read into before calling written."""
+        if self._start:
+            remaining = self._end - self._start
+            # Sliced from the bytearray, a copy, as the two ranges can overlap
+            self._buffer[:remaining] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = remaining
+        return self._view[self._end:]
+
+    def written(self, count: int) -> None:
+        """Adds count bytes read into the view from writable."""
+        self._end += count
+
+    def next_payload(self) -> Optional[memoryview]:
+        """Returns the payload of the next whole packet buffered, None until more bytes arrive."""
+        buffer = self._buffer
+        start = self._start
+        end = self._end
+        while start < end:
+            header = buffer[start]
+            if header == 2 or header == 3:
+                # The start byte is also the number of bytes up to the payload
+                if end - start < header:
+                    break
+                if header == 2:
+                    length = buffer[start + 1]
+                    valid = length != 0
+                else:
+                    length = (buffer[start + 1] << 8) | buffer[start + 2]
+                    # Shorter payloads always have the one byte length
+                    valid = length > 255
+                if not valid or length > self.max_payload:
+                    self.length_errors += 1
+                elif end - start < header + length + 3:
+                    # The rest of the packet has not arrived yet
+                    break
+                else:
+                    payload_end = start + header + length
+                    crc = (buffer[payload_end] << 8) | buffer[payload_end + 1]
+                    payload = self._view[start + header:payload_end]
+                    if buffer[payload_end + 2] == 3 and crc16(payload) == crc:
+                        self._start = payload_end + 3
+                        self.frames += 1
+                        return payload
+                    self.crc_errors += 1
+                # Not a packet after all, so look for one from the next byte
+                start += 1
+                self.skipped += 1
+            else:
+                # Jump to whichever start byte comes first
+                found = [index for index in (buffer.find(2, start, end), buffer.find(3, start, end)) if index >= 0]
+                next_start = min(found) if found else end
+                self.skipped += next_start - start
+                start = next_start
+        self._start = start
+        return None
+
+    def __iter__(self) -> Iterator[memoryview]:
+        """Yields the payload of every whole packet buffered."""
+        while True:
+            payload = self.next_payload()
+            if payload is None:
+                return
+            yield payload
+
+    def feed(self, data) -> Iterator[memoryview]:
+        """Copies data into the buffer, yielding the payload of every packet it completes."""
+        data = memoryview(data)
+        while data:
+            space = self.writable()
+            count = min(len(space), len(data))
+            space[:count] = data[:count]
+            self.written(count)
+            data = data[count:]
+            yield from self
+
+    def stats(self) -> Dict[str, int]:
+        """Returns how many packets were decoded, how many were rejected and why, and the bytes skipped."""
+        return {'frames': self.frames, 'crc_errors': self.crc_errors, 'length_errors': self.length_errors,
+                'skipped': self.skipped}
+
+
+class CommandFrame:
+    """A pyvesc command packet with one int field, encoded once and then patched for each new value.
+
+    The template comes from pyvesc's own encode, so the framing, CAN forwarding
+    header and field scaling are whatever pyvesc produces. Encoding a value only
+    packs it into the template's value bytes and finishes the CRC from the state
+    after the constant bytes before it, in a reused bytearray. Recently used
+    values, such as zero, are kept as finished bytes in a small LRU cache.
+
+    The returned bytearray is overwritten by the next encode, so write it before
+    encoding again.
+
+    Args:
+      message_class: A pyvesc message class with a single int field, e.g. SetRPM or SetCurrent.
+      can_id: The CAN ID to forward the command to, None for the VESC on the serial port.
+      cache_size: Finished frames to keep, 0 for none.
+    """
+
+    def __init__(self, message_class, can_id: Optional[int] = None, cache_size: int = 8):
+        self.message_class = message_class
+        self.can_id = can_id
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.frame = bytearray(self._reference(0))
+        # Frames end with the payload's last field, the CRC and the end byte
+        self._value_offset = len(self.frame) - 7
+        self._crc_offset = len(self.frame) - 3
+        self.scale = struct.unpack_from('>i', self._reference(1), self._value_offset)[0]
+        # The payload starts after the start byte and one length byte, or two for long packets
+        payload_start = 2 if self.frame[0] == 2 else 3
+        self._prefix_crc = crc16(self.frame[payload_start:self._value_offset])
+        for value in (1, -1, 12345, -12345):
+            if self.encode(value) != self._reference(value):
+                raise ValueError(f"{message_class.__name__} does not encode as a single int field")
+        self._cache.clear()
+
+    def _reference(self, value):
+        if self.can_id is None:
+            return encode(self.message_class(value))
+        return encode(self.message_class(value, can_id=self.can_id))
+
+    def encode(self, value: Union[int, float]) -> Union[bytes, bytearray]:
+        """Returns the packet for value, byte for byte what pyvesc's encode would give."""
+        cache = self._cache
+        if value in cache:
+            cache.move_to_end(value)
+            return cache[value]
+        frame = self.frame
+        struct.pack_into('>i', frame, self._value_offset, int(value * self.scale))
+        table = CRC16_TABLE
+        crc = self._prefix_crc
+        for byte in frame[self._value_offset:self._crc_offset]:
+            crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+        frame[self._crc_offset] = crc >> 8
+        frame[self._crc_offset + 1] = crc & 0xFF
+        if self.cache_size:
+            cache[value] = bytes(frame)
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return frame
+
 
 class MotorController:
     """Sets the speed of the motor, from -1 to 1."""
@@ -24,27 +240,171 @@ class MotorController:
     def get_measurements(self):
         raise NotImplementedError
 
+    async def get_measurements_async(self):
+        raise NotImplementedError
+
+
+class _Keepalive:
+    """Decides which commands to write: changed ones, and unchanged ones once keepalive_interval has passed."""
+
+    def __init__(self, keepalive_interval: float, clock: Callable[[], float]):
+        self.keepalive_interval = keepalive_interval
+        self.clock = clock
+        self._last_command = None
+        self._last_write = 0.0
+        self.writes = 0
+        self.keepalives = 0
+        self.suppressed = 0
+
+    def _should_write(self, command) -> bool:
+        if command != self._last_command or self.clock() - self._last_write >= self.keepalive_interval:
+            return True
+        self.suppressed += 1
+        return False
+
+    def _written(self, command) -> None:
+        if command == self._last_command:
+            self.keepalives += 1
+        self._last_command = command
+        self._last_write = self.clock()
+        self.writes += 1
+
+    def _write_failed(self) -> None:
+        """Forgets the last command after writing it failed, so the next one is written even if unchanged."""
+        self._last_command = None
+
+    def stats(self) -> Dict[str, int]:
+        """Returns how many commands were written, and of those how many were only keepalives, and how many were suppressed."""
+        return {'writes': self.writes, 'keepalives': self.keepalives, 'suppressed': self.suppressed}
+
+
+class KeepaliveMotorController(_Keepalive, MotorController):
+    """Wraps another MotorController, only passing commands on when they change.
+
+    A command is compared after it is converted to the integer RPM / current the VESC
+    receives, so stick noise below one unit does not cause writes. An unchanged
+    command is still re-sent once keepalive_interval has passed since the last write,
+    so the VESC's command timeout never stops the motor while it should be running.
+    """
+
+    def __init__(self, motor: MotorController, keepalive_interval: float = 0.25,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__(keepalive_interval, clock)
+        self.motor = motor
+
+    def set_rpm(self, speed: float):
+        command = ('rpm', self.speed_to_rpm(speed))
+        if self._should_write(command):
+            self.motor.set_rpm(speed)
+            self._written(command)
+
+    def set_current(self, speed: float):
+        command = ('current', self.speed_to_current(speed))
+        if self._should_write(command):
+            self.motor.set_current(speed)
+            self._written(command)
+
+    def get_rpm(self):
+        return self.motor.get_rpm()
+
+    def get_measurements(self):
+        return self.motor.get_measurements()
+
+    async def get_measurements_async(self):
+        return await self.motor.get_measurements_async()
+
+
+def reply_controller_id(message) -> Optional[int]:
+    """Returns the controller ID a decoded reply says it came from, None if it does not say.
+
+    The firmware sends app_controller_id as a uint8, so it is read unsigned, 0 to 255,
+    everywhere IDs are compared.
+    """
+    controller_id = getattr(message, 'app_controller_id', None)
+    if isinstance(controller_id, (bytes, bytearray)):
+        return int.from_bytes(controller_id, byteorder='big', signed=False)
+    return controller_id
+
+
+def reply_rpm(values, source: str) -> int:
+    """Returns the RPM from a GetValues reply.
+
+    Raises:
+      TimeoutError: values is None, as no reply came from source in time.
+    """
+    if values is None:
+        raise TimeoutError(f"No GetValues reply from {source}")
+    return values.rpm
+
+
+# One decoder per pyvesc VESC, shared by everything reading its port, so a reply
+# or the rest of one read while waiting for another VESC's is kept, not lost
+_port_decoders = weakref.WeakKeyDictionary()
+
+
+def _read_values(vesc: VESC, controller_id: int, timeout: float):
+    """Reads a VESC's port until the GetValues reply from controller_id is decoded, or returns None after timeout.
+
+    Any other packet, including a late reply to an earlier request, is skipped.
+    Replies forwarded over CAN only say where they came from in their values.
+    """
+    decoder = _port_decoders.get(vesc)
+    if decoder is None:
+        decoder = _port_decoders[vesc] = FrameDecoder()
+    port = vesc.serial_port
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for payload in decoder.feed(port.read(max(1, port.in_waiting))):
+            if payload[0] != GetValues.id:
+                continue
+            values = VESCMessage.unpack(payload)
+            if reply_controller_id(values) == controller_id:
+                return values
+    return None
+
 
 class VESCMotorController(MotorController):
+    """The VESC on the serial port.
+
+    Args:
+      motor: A pyvesc VESC, or a VESCTransport.
+      controller_id: The VESC's app_controller_id, which its replies are matched by on pyvesc's VESC.
+      timeout: Seconds to wait for a reply on pyvesc's VESC.
+    """
     MAX_RPM = 20000
     MAX_CURRENT = 20
 
-    def __init__(self, motor: VESC):
+    def __init__(self, motor: VESC, controller_id: Optional[int] = None, timeout: float = 0.1):
         self.motor = motor
+        self.controller_id = controller_id
+        self.timeout = timeout
+        self._get_values_msg = encode_request(GetValues())
+        self._rpm_frame = CommandFrame(SetRPM)
+        self._current_frame = CommandFrame(SetCurrent)
 
     def set_rpm(self, speed: float):
         rpm = self.speed_to_rpm(speed)
-        self.motor.set_rpm(rpm)
+        self.motor.write(self._rpm_frame.encode(rpm))
 
     def set_current(self, speed: float):
         current = self.speed_to_current(speed)
-        self.motor.set_current(current)
+        self.motor.write(self._current_frame.encode(current))
 
     def get_measurements(self):
-        return self.motor.get_measurements()
+        if not isinstance(self.motor, VESC):
+            # A VESCTransport matches the reply to the request itself
+            return self.motor.get_measurements()
+        if self.controller_id is None:
+            raise ValueError('Reading measurements needs the VESC\'s controller_id')
+        self.motor.write(self._get_values_msg)
+        return _read_values(self.motor, self.controller_id, self.timeout)
+
+    async def get_measurements_async(self):
+        # Needs the motor to be a VESCTransport, pyvesc's VESC can only block
+        return await self.motor.get_values()
     
     def get_rpm(self):
-        return self.motor.get_rpm()
+        return reply_rpm(self.get_measurements(), f"the VESC with controller ID {self.controller_id}")
 
     def __del__(self):
         # Stop the heartbeat to prevent the motor from spinning
@@ -52,29 +412,100 @@ class VESCMotorController(MotorController):
 
 
 class CanVESC(MotorController):
-    def __init__(self, parent_vesc: VESC, can_id: int):
+    def __init__(self, parent_vesc: VESC, can_id: int, timeout: float = 0.1):
         self.parent_vesc = parent_vesc
         self.can_id = can_id
+        self.timeout = timeout
         msg = GetValues(can_id=can_id)
         self._get_values_msg = encode_request(msg)
         self._get_values_msg_expected_length = msg._full_msg_size
+        self._rpm_frame = CommandFrame(SetRPM, can_id)
+        self._current_frame = CommandFrame(SetCurrent, can_id)
 
     def set_rpm(self, speed: float):
         rpm = self.speed_to_rpm(speed)
-        packet = encode(SetRPM(rpm, can_id=self.can_id))
-        self.parent_vesc.write(packet)
+        self.parent_vesc.write(self._rpm_frame.encode(rpm))
 
     def set_current(self, speed: float):
         current = self.speed_to_current(speed)
-        packet = encode(SetCurrent(current, can_id=self.can_id))
-        self.parent_vesc.write(packet)
+        self.parent_vesc.write(self._current_frame.encode(current))
 
     def get_measurements(self):
-        return self.parent_vesc.write(self._get_values_msg, num_read_bytes=self._get_values_msg_expected_length)
+        if not isinstance(self.parent_vesc, VESC):
+            # A VESCTransport matches the reply to the request itself
+            return self.parent_vesc.write(self._get_values_msg, num_read_bytes=self._get_values_msg_expected_length)
+        self.parent_vesc.write(self._get_values_msg)
+        return _read_values(self.parent_vesc, self.can_id, self.timeout)
+
+    async def get_measurements_async(self):
+        # Needs the parent to be a VESCTransport, pyvesc's VESC can only block
+        return await self.parent_vesc.get_values(self.can_id)
 
     def get_rpm(self):
-        return self.get_measurements().rpm
+        return reply_rpm(self.get_measurements(), f"the VESC with CAN ID {self.can_id}")
 
     def __del__(self):
         # Stop the heartbeat to prevent the motor from spinning
         self.parent_vesc.stop_heartbeat()
+
+
+class MotorGroup(_Keepalive):
+    """Every motor behind one serial port, commanded together in a single write.
+
+    The packets for the VESC on the port and each CAN forwarded VESC are put in
+    one buffer and written at once, so a tick costs one system call and one USB
+    transfer and the wheels get their setpoints at the same moment. As with
+    KeepaliveMotorController, an unchanged set of commands is only re-sent once
+    keepalive_interval has passed.
+
+    Args:
+      motors: VESCMotorControllers and CanVESCs all on the same port, in the order setpoints are given.
+      keepalive_interval: Seconds before unchanged commands are sent again.
+      clock: Returns the time in seconds, time.monotonic by default.
+      writer: If given, commands are handed to this SerialWriter for the port
+        instead of being written by the caller, so setting them never blocks.
+        If the writer fails to write them, the next command is sent even if unchanged.
+    """
+
+    def __init__(self, motors, keepalive_interval: float = 0.25, clock: Callable[[], float] = time.monotonic,
+                 writer: Optional['SerialWriter'] = None):
+        super().__init__(keepalive_interval, clock)
+        self.motors = list(motors)
+        self.writer = writer
+        connections = [self._connection(motor) for motor in self.motors]
+        self.port = connections[0][0]
+        if any(port is not self.port for port, _ in connections):
+            raise ValueError('Every motor in a MotorGroup must be on the same serial port')
+        self._rpm_frames = [CommandFrame(SetRPM, can_id) for _, can_id in connections]
+        self._current_frames = [CommandFrame(SetCurrent, can_id) for _, can_id in connections]
+
+    @staticmethod
+    def _connection(motor):
+        """Returns the VESC whose port a motor is written through and the CAN ID it is forwarded to."""
+        if isinstance(motor, VESCMotorController):
+            return motor.motor, None
+        if isinstance(motor, CanVESC):
+            return motor.parent_vesc, motor.can_id
+        raise TypeError(f"Cannot group a {type(motor).__name__}, only VESCMotorController and CanVESC")
+
+    def set_rpm(self, speeds: Sequence[float]):
+        """Sets the speed of every motor, from -1 to 1, by RPM."""
+        self._send('rpm', self._rpm_frames, tuple([self.motors[0].speed_to_rpm(speed) for speed in speeds]))
+
+    def set_current(self, speeds: Sequence[float]):
+        """Sets the speed of every motor, from -1 to 1, by current."""
+        self._send('current', self._current_frames, tuple([self.motors[0].speed_to_current(speed) for speed in speeds]))
+
+    def _send(self, mode: str, frames, values) -> None:
+        if len(values) != len(frames):
+            raise ValueError(f"Expected {len(frames)} setpoints, got {len(values)}")
+        command = (mode, values)
+        if self._should_write(command):
+            packets = b''.join([frame.encode(value) for frame, value in zip(frames, values)])
+            if self.writer is not None:
+                # Recorded first, the writer thread can report a failure before submit returns
+                self._written(command)
+                self.writer.submit(self, packets, self._write_failed)
+            else:
+                self.port.write(packets)
+                self._written(command)
@@ -0,0 +1,276 @@
+"""Composable stick to wheel speed shaping, compiled into a single function.
+
+A pipeline is a list of stages working on two channels: (speed, rotation) until a
+Mix stage turns them into (left, right) wheel speeds. Compiling the pipeline
+generates the source of one function with every stage written out inline, so
+adding a stage costs its own arithmetic but no extra calls, and the result is
+written into a preallocated list rather than a new one each tick. Stages that
+remember something between ticks, such as SlewRateLimit, keep it in slots of a
+state list allocated when the pipeline is compiled. The generated source is
+registered with linecache, so tracebacks the traceback module prints show the
+failing line of it.
+
+Example, the same shaping as arcade_drive_ik followed by get_speed_multiplier:
+    shape = Pipeline([Deadzone(0.05), Square(), Mix('arcade'), Desaturate(),
+                      ModeScale(SLOW_SPEED, MEDIUM_SPEED, MAX_SPEED)]).compile()
+    left, right = shape(speed, rotation, mode_a, mode_b)
+"""
+import itertools
+import linecache
+import math
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import mathutils
+
+# The two channels every stage reads and writes in the generated code
+CHANNELS = ('a', 'b')
+
+# Turns a value a stage uses into an expression for it in the generated code
+Bind = Callable[[Any], str]
+
+_compiled_count = itertools.count()
+
+
+class Stage:
+    """One step of a Pipeline.
+
+    Args:
+      channels: Which of the two channels the stage applies to, e.g. (True, False)
+        for only speed / left.
+    """
+    # True if the output depends on earlier ticks
+    stateful = False
+
+    def __init__(self, channels: Tuple[bool, bool] = (True, True)) -> None:
+        self.channels = channels
+
+    def lines(self, channel: str, bind: Bind) -> List[str]:
+        """Returns the source lines applying the stage to one channel variable.
+
+        Args:
+          channel: The variable holding the channel, 'a' or 'b'.
+          bind: Returns the expression to use in the source for a parameter value.
+        """
+        raise NotImplementedError
+
+    def source(self, bind: Bind, state: List[Optional[float]]) -> List[str]:
+        """Returns the source lines for the whole stage.
+
+        Args:
+          bind: Returns the expression to use in the source for a parameter value.
+          state: The pipeline's state list, named state in the source, which the stage may add slots of its own to.
+        """
+        source = []
+        for number, channel in enumerate(CHANNELS):
+            if self.channels[number]:
+                source += self.lines(channel, bind)
+        return source
+
+
+class Deadzone(Stage):
+    """mathutils.deadzone: zero inside the deadband, unchanged outside."""
+
+    def __init__(self, deadband: float = 0.05, channels: Tuple[bool, bool] = (True, True)) -> None:
+        super().__init__(channels)
+        self.deadband = deadband
+
+    def lines(self, channel, bind):
+        return [f"if abs({channel}) < {bind(self.deadband)}: {channel} = 0"]
+
+
+class Deadband(Stage):
+    """mathutils.apply_deadband: zero inside the deadband, the rest rescaled to reach max_magnitude."""
+
+    def __init__(self, deadband: float = 0.05, max_magnitude: float = 1.0,
+                 channels: Tuple[bool, bool] = (True, True)) -> None:
+        super().__init__(channels)
+        self.deadband = deadband
+        self.max_magnitude = max_magnitude
+
+    def lines(self, channel, bind):
+        return [f"{channel} = {bind(mathutils.apply_deadband)}({channel}, {bind(self.deadband)}, "
+                f"{bind(self.max_magnitude)})"]
+
+
+class Square(Stage):
+    """mathutils.square: squares the magnitude, keeping the sign."""
+
+    def lines(self, channel, bind):
+        return [f"{channel} = abs({channel}) * {channel}"]
+
+
+class Expo(Stage):
+    """Blends linear and cubic response, amount 0 is linear and 1 fully cubic."""
+
+    def __init__(self, amount: float, channels: Tuple[bool, bool] = (True, True)) -> None:
+        super().__init__(channels)
+        if not 0.0 <= amount <= 1.0:
+            raise ValueError(f"Expo amount must be between 0 and 1, not {amount}")
+        self.amount = amount
+
+    def lines(self, channel, bind):
+        return [f"{channel} = {bind(1.0 - self.amount)} * {channel} + "
+                f"{bind(self.amount)} * {channel} * {channel} * {channel}"]
+
+
+class Clamp(Stage):
+    """mathutils.clamp."""
+
+    def __init__(self, min_value: float = -1.0, max_value: float = 1.0,
+                 channels: Tuple[bool, bool] = (True, True)) -> None:
+        super().__init__(channels)
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def lines(self, channel, bind):
+        min_value = bind(self.min_value)
+        max_value = bind(self.max_value)
+        return [f"if {channel} > {max_value}: {channel} = {max_value}",
+                f"elif {channel} < {min_value}: {channel} = {min_value}"]
+
+
+class SlewRateLimit(Stage):
+    """Limits how fast a channel may change, in units per second of the time between ticks.
+
+    The time since the last tick is read from clock, so a late or early tick moves
+    the output by as much as the time that really passed allows. The first tick
+    after compiling or resetting has no last tick, so it holds the output where it was.
+
+    Args:
+      rate: Largest change per second, e.g. 2.0 goes from stopped to full in half a second.
+      clock: Returns the time in seconds, time.monotonic by default.
+      max_period: Longest gap between ticks counted, so the first tick after a pause still ramps.
+    """
+    stateful = True
+
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic, max_period: float = 0.1,
+                 channels: Tuple[bool, bool] = (True, True)) -> None:
+        super().__init__(channels)
+        self.rate = rate
+        self.clock = clock
+        self.max_period = max_period
+
+    def source(self, bind, state):
+        # The last output of each channel, then the time of the last tick
+        slot = len(state)
+        state += [0.0, 0.0, None]
+        max_period = bind(self.max_period)
+        source = [f"now = {bind(self.clock)}()",
+                  f"last = state[{slot + 2}]",
+                  f"state[{slot + 2}] = now",
+                  "if last is None:",
+                  "    change = 0.0",
+                  "else:",
+                  "    elapsed = now - last",
+                  f"    change = {bind(self.rate)} * (elapsed if elapsed < {max_period} else {max_period})"]
+        for number, channel in enumerate(CHANNELS):
+            if self.channels[number]:
+                source += [f"previous = state[{slot + number}]",
+                           f"if {channel} > previous + change: {channel} = previous + change",
+                           f"elif {channel} < previous - change: {channel} = previous - change",
+                           f"state[{slot + number}] = {channel}"]
+        return source
+
+
+class Mix(Stage):
+    """Turns (speed, rotation) into (left, right) wheel speeds, 'arcade' or 'curvature'."""
+
+    def __init__(self, kind: str = 'arcade') -> None:
+        super().__init__((True, True))
+        if kind not in ('arcade', 'curvature'):
+            raise ValueError(f"Unknown mix {kind}")
+        self.kind = kind
+
+    def source(self, bind, state):
+        if self.kind == 'arcade':
+            return ["a, b = a + b, a - b"]
+        return ["turn = abs(a) * b", "a, b = a + turn, a - turn"]
+
+
+class Desaturate(Stage):
+    """mathutils.desaturate_wheel_speeds."""
+
+    def __init__(self, use_max: bool = True) -> None:
+        super().__init__((True, True))
+        self.use_max = use_max
+
+    def source(self, bind, state):
+        if self.use_max:
+            return ["magnitude = max(abs(a), abs(b))",
+                    "if magnitude > 1:",
+                    "    a /= magnitude",
+                    "    b /= magnitude"]
+        return ["greater = max(abs(a), abs(b))",
+                "if greater == 0:",
+                "    a = b = 0",
+                "else:",
+                "    saturated = (greater + min(abs(a), abs(b))) / greater",
+                "    a /= saturated",
+                "    b /= saturated"]
+
+
+class ModeScale(Stage):
+    """get_speed_multiplier: scales both channels by the speed of the selected mode."""
+
+    def __init__(self, slow: float, medium: float, fast: float) -> None:
+        super().__init__((True, True))
+        self.slow = slow
+        self.medium = medium
+        self.fast = fast
+
+    def source(self, bind, state):
+        return [f"multiplier = {bind(self.medium)} if mode_a else ({bind(self.fast)} if mode_b else {bind(self.slow)})",
+                "a *= multiplier",
+                "b *= multiplier"]
+
+
+class Pipeline:
+    """An ordered list of stages, see compile."""
+
+    def __init__(self, stages: Sequence[Stage]) -> None:
+        self.stages = list(stages)
+        self.state: List[Optional[float]] = []
+        self._initial_state: List[Optional[float]] = []
+
+    @property
+    def stateful(self) -> bool:
+        """True if the output depends on earlier ticks, so it must run every tick and not only on input changes."""
+        return any(stage.stateful for stage in self.stages)
+
+    def compile(self) -> Callable[[float, float, bool, bool], List[float]]:
+        """Returns one function running every stage.
+
+        The function takes (speed, rotation, mode_a, mode_b) and returns a two item
+        list of the left and right outputs. The same list is returned every call, so
+        copy the values out before calling again. Its source is in its source attribute.
+        """
+        state: List[Optional[float]] = []
+        namespace = {'state': state, 'output': [0.0, 0.0]}
+
+        def bind(value):
+            # Finite numbers are written in as constants, anything else is looked up by name
+            if type(value) in (int, float) and math.isfinite(value):
+                return repr(value)
+            name = f"value_{len(namespace)}"
+            namespace[name] = value
+            return name
+
+        lines = ["def shape(a, b, mode_a=False, mode_b=False):"]
+        for stage in self.stages:
+            lines += ["    " + line for line in stage.source(bind, state)]
+        lines += ["    output[0] = a", "    output[1] = b", "    return output"]
+        source = '\n'.join(lines) + '\n'
+        filename = f"<pipeline {next(_compiled_count)}>"
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        exec(compile(source, filename, 'exec'), namespace)
+        self.state = state
+        self._initial_state = list(state)
+        shape = namespace['shape']
+        shape.source = source
+        return shape
+
+    def reset(self) -> None:
+        """Clears remembered state, e.g. slew limits start again from zero."""
+        # In place, the compiled function holds on to the list
+        self.state[:] = self._initial_state
@@ -0,0 +1,100 @@
+"""Fixed-rate scheduling for the control loop.
+
+Each tick is due at an absolute monotonic deadline, start + n * period, rather
+than a sleep after the work is done, so the loop rate does not drift with how
+long the work takes and the thread sleeps instead of spinning between ticks.
+"""
+import sys
+import time
+from typing import Callable, Dict, Optional, TextIO
+
+from latency import LatencyHistogram, NS_PER_MS
+
+NS_PER_S = 1_000_000_000
+
+# What to do when a tick starts a whole period or more late
+OVERRUN_SKIP = 'skip'
+OVERRUN_CATCH_UP = 'catch_up'
+
+
+class FixedRateScheduler:
+    """Paces a loop at a fixed rate on absolute deadlines.
+
+    Call wait() at the top of each iteration. When work overruns a deadline:
+      skip: the missed ticks are dropped and the next deadline is the next one
+        still in the future, keeping ticks on the original grid.
+      catch_up: every missed tick still runs, back to back without sleeping,
+        until the loop is back on schedule.
+
+    Args:
+      rate_hz: Ticks per second.
+      overrun: OVERRUN_SKIP or OVERRUN_CATCH_UP.
+      clock: Returns the time in nanoseconds, time.monotonic_ns by default.
+      sleep: Sleeps for a number of seconds, time.sleep by default.
+    """
+
+    def __init__(self, rate_hz: float, overrun: str = OVERRUN_SKIP,
+                 clock: Callable[[], int] = time.monotonic_ns, sleep: Callable[[float], None] = time.sleep) -> None:
+        if rate_hz <= 0:
+            raise ValueError(f"rate_hz must be positive, not {rate_hz}")
+        if overrun not in (OVERRUN_SKIP, OVERRUN_CATCH_UP):
+            raise ValueError(f"Unknown overrun policy {overrun}")
+        self.period_ns = int(round(NS_PER_S / rate_hz))
+        self.overrun = overrun
+        self.clock = clock
+        self.sleep = sleep
+        self.jitter = LatencyHistogram()
+        self.next_deadline: Optional[int] = None
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+
+    @property
+    def rate_hz(self) -> float:
+        return NS_PER_S / self.period_ns
+
+    def reset(self) -> None:
+        """Starts the schedule again from the next wait(), e.g. after the loop was paused."""
+        self.next_deadline = None
+
+    def wait(self) -> int:
+        """Sleeps until the next tick is due.
+
+        Returns:
+          The number of ticks skipped because the loop overran, always 0 when catching up.
+        """
+        now = self.clock()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        elif now < self.next_deadline:
+            self.sleep((self.next_deadline - now) / NS_PER_S)
+            now = self.clock()
+        lateness = now - self.next_deadline
+        self.jitter.record(lateness)
+        self.ticks += 1
+        missed = 0
+        if lateness >= self.period_ns:
+            self.overruns += 1
+            if self.overrun == OVERRUN_SKIP:
+                missed = lateness // self.period_ns
+                self.skipped += missed
+        self.next_deadline += (missed + 1) * self.period_ns
+        return missed
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the tick and overrun counters and the jitter (lateness of each tick) in milliseconds."""
+        return {
+            'rate_hz': self.rate_hz,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'jitter_p50_ms': self.jitter.percentile(50) / NS_PER_MS,
+            'jitter_p99_ms': self.jitter.percentile(99) / NS_PER_MS,
+            'jitter_max_ms': (self.jitter.max or 0) / NS_PER_MS,
+        }
+
+    def dump(self, stream: Optional[TextIO] = None) -> None:
+        """Writes the stats on one line to stream, stderr by default."""
+        stream = sys.stderr if stream is None else stream
+        stream.write(' '.join(f"{name}={value:g}" for name, value in self.stats().items()) + '\n')
+        stream.flush()
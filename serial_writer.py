@@ -0,0 +1,139 @@
+"""Writes motor commands to a serial port from a thread of its own.
+
+The control loop hands each command to a SerialWriter, which never blocks: every
+sender has a mailbox holding only its newest command, so while the port is busy
+a newer command replaces the one still waiting rather than queueing behind it.
+Once the port has drained, the writer sends whatever is in the mailboxes in one
+write. A stalled USB serial adapter then only delays the motors getting their
+latest setpoint, it never stalls the loop or delivers stale ones afterwards.
+"""
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, TextIO, Tuple
+
+from latency import LatencyTracker
+
+# Stages recorded by SerialWriter: mailbox to the write starting, and the write itself
+WRITER_STAGES = ('queued', 'write')
+
+
+class SerialWriter:
+    """A writer thread for one serial port with a latest-wins mailbox per sender.
+
+    Args:
+      port: The port to write to, e.g. a pyserial Serial. Its out_waiting is used for backpressure when it has one.
+      max_waiting: Bytes the port may still have queued for a write to go ahead, None to never wait.
+      backoff: Seconds to wait before checking a busy port again.
+      clock: Returns the time in nanoseconds, time.monotonic_ns by default.
+    """
+
+    def __init__(self, port, max_waiting: Optional[int] = 256, backoff: float = 0.001,
+                 clock: Callable[[], int] = time.monotonic_ns) -> None:
+        self.port = port
+        self.max_waiting = max_waiting
+        self.backoff = backoff
+        self.clock = clock
+        self.latency = LatencyTracker(WRITER_STAGES)
+        self._condition = threading.Condition()
+        self._pending: Dict[Hashable, Tuple[bytes, int, Optional[Callable[[], None]]]] = {}
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.submitted = 0
+        self.superseded = 0
+        self.writes = 0
+        self.commands_written = 0
+        self.backpressure_waits = 0
+        self.peak_waiting = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        """Starts the writer thread."""
+        if self._thread is not None:
+            raise RuntimeError('Serial writer is already running')
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='SerialWriter', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Writes anything still waiting, then stops the writer thread."""
+        if self._thread is not None:
+            with self._condition:
+                self._stopping = True
+                self._condition.notify()
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, key: Hashable, data, on_failure: Optional[Callable[[], None]] = None) -> None:
+        """Puts data in key's mailbox to be written, replacing anything of key's not yet written. Never blocks.
+
+        Args:
+          key: The sender, which has one mailbox.
+          data: The bytes to write.
+          on_failure: Called from the writer thread if writing data fails, as it is dropped rather than retried.
+        """
+        now = self.clock()
+        # Copied, as command frames are reused buffers
+        data = bytes(data)
+        with self._condition:
+            if key in self._pending:
+                self.superseded += 1
+            self._pending[key] = (data, now, on_failure)
+            self.submitted += 1
+            self._condition.notify()
+
+    def _waiting_bytes(self) -> int:
+        try:
+            return self.port.out_waiting
+        except (AttributeError, OSError):
+            return 0
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+            # While the port is still busy, newer commands replace the ones waiting here
+            if self.max_waiting is not None and not self._stopping:
+                waiting = self._waiting_bytes()
+                self.peak_waiting = max(self.peak_waiting, waiting)
+                if waiting > self.max_waiting:
+                    self.backpressure_waits += 1
+                    time.sleep(self.backoff)
+                    continue
+            with self._condition:
+                pending = self._pending
+                self._pending = {}
+            start = self.clock()
+            try:
+                self.port.write(b''.join([data for data, _, _ in pending.values()]))
+            except Exception as e:
+                # Dropped rather than retried, the next command is newer anyway. Not only OSError,
+                # anything escaping here would end the thread and every later command with it
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                for _, _, on_failure in pending.values():
+                    if on_failure is not None:
+                        on_failure()
+                continue
+            end = self.clock()
+            self.writes += 1
+            self.commands_written += len(pending)
+            for _, submitted, _ in pending.values():
+                self.latency.record('queued', submitted, start)
+            self.latency.record('write', start, end)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the command, write, backpressure and error counters."""
+        return {'submitted': self.submitted, 'superseded': self.superseded, 'writes': self.writes,
+                'commands_written': self.commands_written, 'backpressure_waits': self.backpressure_waits,
+                'peak_waiting': self.peak_waiting, 'errors': self.errors, 'last_error': self.last_error}
+
+    def dump(self, stream: Optional[TextIO] = None) -> None:
+        """Writes the counters and the queued / write latency percentiles to stream, stderr by default."""
+        stream = sys.stderr if stream is None else stream
+        stream.write(f"Serial writer: {self.stats()}\n")
+        self.latency.dump(stream)
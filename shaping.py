@@ -0,0 +1,197 @@
+"""Precomputed lookup tables for the stick to wheel speed shaping.
+
+The drive kinematics are a fixed function of the stick position, so they can be
+sampled once onto a grid and then read back with a single bilinear lookup per
+tick instead of the chain of deadzone, square, mix and desaturate calls. The
+speed mode multiplier scales both outputs linearly, so it is applied after the
+lookup and one table serves every mode.
+
+drive_loop does not use a table. In CPython the lookup was not consistently faster than
+arcade_drive_ik (see benchmarks/shaping.py), as the index and interpolation
+arithmetic costs as much as the kinematics it replaces. A table only pays off
+for kinematics that are expensive to work out.
+
+Tables are cached on disk under $XDG_CACHE_HOME (or ~/.cache), keyed by the
+table parameters and by sample outputs of the kinematics, so a change to
+either builds a fresh table rather than loading a stale one.
+"""
+import array
+import hashlib
+import os
+import struct
+from typing import Callable, Dict, Optional, Tuple
+
+import drive
+
+TABLE_MAGIC = b'CSHAPE01'
+DEFAULT_RESOLUTION = 161
+# The deadband mathutils.scale_and_deadzone_inputs applies by default
+DEADBAND = 0.05
+
+# Kinematics a table can be built for, by name
+IK_FUNCTIONS: Dict[str, Callable[[float, float], Tuple[float, float]]] = {
+    'arcade': drive.arcade_drive_ik,
+    'curvature': drive.curvture_drive_ik,
+}
+
+# Stick positions the kinematics are sampled at for the cache key
+_PROBE_POINTS = ((0.0, 0.0), (0.05, -0.05), (0.3, 0.7), (-0.9, 0.4), (1.0, 1.0), (-1.0, 0.2))
+
+
+def cache_directory() -> str:
+    """Returns the directory shaping tables are cached in."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'couch', 'shaping')
+
+
+class ShapingTable:
+    """Wheel speeds for a resolution x resolution grid of stick positions over [-1.0..1.0].
+
+    Inputs inside the deadband are zeroed before the lookup, and the grid must have
+    lines on the deadband edges, so the step the deadzone makes never falls inside
+    a grid cell. What error remains comes from the kinks where desaturation starts,
+    roughly 0.8% of full scale at the default resolution (see benchmarks/shaping.py).
+
+    Args:
+      ik: Name of the kinematics in IK_FUNCTIONS.
+      resolution: Grid points along each stick axis, a grid line every 2 / (resolution - 1).
+      deadband: The deadband the kinematics apply, which must fall on a grid line.
+    """
+
+    def __init__(self, ik: str = 'arcade', resolution: int = DEFAULT_RESOLUTION, deadband: float = DEADBAND) -> None:
+        if ik not in IK_FUNCTIONS:
+            raise ValueError(f"Unknown kinematics {ik}, expected one of {sorted(IK_FUNCTIONS)}")
+        if resolution < 2:
+            raise ValueError(f"resolution must be at least 2, not {resolution}")
+        steps = deadband * (resolution - 1) / 2.0
+        if abs(steps - round(steps)) > 1e-9:
+            raise ValueError(f"A resolution of {resolution} does not put a grid line on the {deadband} deadband")
+        self.ik = ik
+        self.resolution = resolution
+        self.deadband = deadband
+        self._cells_per_row = resolution - 1
+        self._scale = (resolution - 1) / 2.0
+        self.left = array.array('d')
+        self.right = array.array('d')
+        self._cells = []
+
+    def cache_key(self) -> str:
+        """Returns a key identifying the table's contents."""
+        ik_function = IK_FUNCTIONS[self.ik]
+        probes = [ik_function(speed, rotation) for speed, rotation in _PROBE_POINTS]
+        description = repr((TABLE_MAGIC, self.ik, self.resolution, self.deadband, probes))
+        return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+    def build(self) -> None:
+        """Samples the kinematics at every grid point."""
+        ik_function = IK_FUNCTIONS[self.ik]
+        last = self.resolution - 1
+        # Exact grid positions, so 0, the deadband edges and +/-1 are sampled exactly
+        positions = [(2 * index - last) / last for index in range(self.resolution)]
+        left = array.array('d')
+        right = array.array('d')
+        for speed in positions:
+            for rotation in positions:
+                left_speed, right_speed = ik_function(speed, rotation)
+                left.append(left_speed)
+                right.append(right_speed)
+        self.left = left
+        self.right = right
+        self._compile()
+
+    def _compile(self) -> None:
+        """Turns the grid into per cell bilinear coefficients, so a lookup is one index and a few multiplies."""
+        resolution = self.resolution
+        cells = []
+        for i in range(resolution - 1):
+            for j in range(resolution - 1):
+                top = i * resolution + j
+                below = top + resolution
+                coefficients = []
+                for table in (self.left, self.right):
+                    a = table[top]
+                    b = table[top + 1]
+                    c = table[below]
+                    d = table[below + 1]
+                    coefficients += (a, b - a, c - a, d - c - b + a)
+                cells.append(tuple(coefficients))
+        self._cells = cells
+
+    def save(self, path: str) -> None:
+        """Writes the grid to path, replacing any existing file atomically."""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as table_file:
+            table_file.write(TABLE_MAGIC + struct.pack('<I', self.resolution))
+            self.left.tofile(table_file)
+            self.right.tofile(table_file)
+        os.replace(temporary, path)
+
+    def load(self, path: str) -> bool:
+        """Reads a grid written by save, returns False if it is missing or does not match."""
+        points = self.resolution * self.resolution
+        try:
+            with open(path, 'rb') as table_file:
+                header = table_file.read(len(TABLE_MAGIC) + 4)
+                if header != TABLE_MAGIC + struct.pack('<I', self.resolution):
+                    return False
+                left = array.array('d')
+                right = array.array('d')
+                left.fromfile(table_file, points)
+                right.fromfile(table_file, points)
+        except (OSError, EOFError):
+            return False
+        self.left = left
+        self.right = right
+        self._compile()
+        return True
+
+    @classmethod
+    def cached(cls, ik: str = 'arcade', resolution: int = DEFAULT_RESOLUTION, deadband: float = DEADBAND,
+               directory: Optional[str] = None) -> 'ShapingTable':
+        """Returns a table loaded from the disk cache, building and caching it if needed.
+
+        Failing to write the cache is not an error, the table is just rebuilt next time.
+        """
+        table = cls(ik, resolution, deadband)
+        directory = cache_directory() if directory is None else directory
+        path = os.path.join(directory, f"{ik}-{resolution}-{table.cache_key()}.bin")
+        if not table.load(path):
+            table.build()
+            try:
+                os.makedirs(directory, exist_ok=True)
+                table.save(path)
+            except OSError:
+                pass
+        return table
+
+    def lookup(self, speed: float, rotation: float) -> Tuple[float, float]:
+        """Bilinear interpolation of the wheel speeds, the table version of the ik function.
+
+        Args:
+          speed: The speed along the X axis [-1.0..1.0]. Forward is positive.
+          rotation: The normalized curvature [-1.0..1.0]. Counterclockwise is positive.
+
+        Returns:
+          Wheel speeds [-1.0..1.0].
+        """
+        deadband = self.deadband
+        if -deadband < speed < deadband:
+            speed = 0.0
+        if -deadband < rotation < deadband:
+            rotation = 0.0
+        cells_per_row = self._cells_per_row
+        scale = self._scale
+        row = (speed + 1.0) * scale
+        column = (rotation + 1.0) * scale
+        i = int(row)
+        j = int(column)
+        # Stick values are within [-1.0..1.0], +1.0 itself belongs to the last cell
+        if i >= cells_per_row:
+            i = cells_per_row - 1
+        if j >= cells_per_row:
+            j = cells_per_row - 1
+        row_fraction = row - i
+        column_fraction = column - j
+        a, b, c, d, right_a, right_b, right_c, right_d = self._cells[i * cells_per_row + j]
+        return (a + column_fraction * (b + row_fraction * d) + row_fraction * c,
+                right_a + column_fraction * (right_b + row_fraction * right_d) + row_fraction * right_c)
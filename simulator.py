@@ -0,0 +1,375 @@
+"""A simulated couch for running the control loop without hardware.
+
+SimulatedMotor implements MotorController with a first-order model of a VESC
+driven wheel: the VESC turns an RPM or current command into motor current, up to
+its current limit, and that current accelerates the wheel's share of the couch
+against a speed proportional drag. Commands are scaled exactly as the real
+controllers scale them, through speed_to_rpm / speed_to_current and MAX_RPM /
+MAX_CURRENT, and a motor that stops receiving commands coasts after the VESC
+command timeout.
+
+Time is a VirtualClock that only moves when something sleeps on it, integrating
+every attached model in fixed steps as it goes. Pacing drive_loop with a
+FixedRateScheduler on that clock runs the loop, the physics and a replayed
+gamepad in lock-step, as fast as the CPU allows and identically every run:
+
+    simulation = DifferentialDriveSimulation()
+    joystick = replay_joystick('session.jslog', simulation.clock)
+    run_lockstep(joystick, simulation, rate_hz=100)
+
+Or from the command line, with a built-in scripted drive if no log is given:
+    python simulator.py [session.jslog] [--rate 100] [--duration 20]
+"""
+import argparse
+import math
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import Gamepad.Gamepad as Gamepad
+from Gamepad.Recording import ReplayGamepad, writeSessionLog
+import drive
+from mathutils import clamp
+from measurements import MeasurementPoller
+from motor_controller import MotorController, VESCMotorController
+from scheduler import FixedRateScheduler
+
+if TYPE_CHECKING:
+    from pipeline import Pipeline
+    from telemetry import TelemetryLogger
+
+NS_PER_S = 1_000_000_000
+
+# Electrical RPM, which the VESC commands and reports, per wheel RPM: motor pole pairs times gear ratio
+ERPM_PER_WHEEL_RPM = 50.0
+
+# Built-in drive for the command line: seconds from the start and the controls set then
+DEMO_SCRIPT = (
+    (0.5, {'Y': -1.0}),
+    (3.0, {'Y': -1.0, 'MODEA': True}),
+    (6.0, {'Y': -0.5, 'X': 0.6, 'MODEA': False}),
+    (9.0, {'Y': 0.0, 'X': 0.0}),
+    (10.0, {'X': -1.0, 'TRIGGER': True}),
+    (12.0, {'X': 0.0, 'TRIGGER': False}),
+    (14.0, {}),
+)
+
+
+class SimulatedValues(NamedTuple):
+    """The GetValues fields a SimulatedMotor reports."""
+    rpm: int
+    avg_motor_current: float
+    tachometer_value: int
+
+
+class VirtualClock:
+    """Simulated monotonic time, advanced by sleep and integrating models in fixed steps.
+
+    Args:
+      step: Seconds per integration step.
+      start: The time the clock starts at, in seconds.
+    """
+
+    def __init__(self, step: float = 0.001, start: float = 0.0) -> None:
+        self.step_ns = int(round(step * NS_PER_S))
+        self.now_ns = int(start * NS_PER_S)
+        self._integrated_ns = self.now_ns
+        self.models: List = []
+        self.listeners: List[Callable[[int], None]] = []
+
+    def monotonic_ns(self) -> int:
+        return self.now_ns
+
+    def monotonic(self) -> float:
+        return self.now_ns / NS_PER_S
+
+    def add_model(self, model) -> None:
+        """Steps model.step(seconds) every integration step from now on."""
+        self.models.append(model)
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        """Calls listener(now_ns) at the end of every advance."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int], None]) -> None:
+        self.listeners.remove(listener)
+
+    def advance(self, seconds: float) -> None:
+        """Moves time forward, integrating every whole step that has become due.
+
+        A part step is carried over to the next advance, so the physics never
+        drift from the clock however the advances are split.
+        """
+        if seconds > 0:
+            self.now_ns += int(round(seconds * NS_PER_S))
+        step = self.step_ns / NS_PER_S
+        while self._integrated_ns + self.step_ns <= self.now_ns:
+            for model in self.models:
+                model.step(step)
+            self._integrated_ns += self.step_ns
+        for listener in list(self.listeners):
+            listener(self.now_ns)
+
+    # Passed as the sleep of a scheduler, sleeping is what moves simulated time on
+    sleep = advance
+
+
+class SimulatedMotor(MotorController):
+    """A VESC and its wheel, carrying a share of the couch.
+
+    Args:
+      clock: The clock the motor is stepped by.
+      torque_per_amp: Wheel torque per amp of motor current in Nm/A, the motor's torque constant times the gearing.
+      inertia: Inertia at the wheel in kg m^2, including its share of the couch and rider.
+      drag: Torque opposing the wheel per rad/s of wheel speed, in Nm s/rad.
+      erpm_per_wheel_rpm: Electrical RPM per wheel RPM.
+      current_limit: Most current the VESC gives the motor, in amps.
+      speed_kp: Amps per electrical RPM of speed error when commanded by RPM.
+      speed_ki: Amps per electrical RPM second of accumulated speed error.
+      command_timeout: Seconds without a command before the VESC lets the motor coast, None for never.
+    """
+
+    def __init__(self, clock: VirtualClock, torque_per_amp: float = 0.35, inertia: float = 0.7, drag: float = 0.1,
+                 erpm_per_wheel_rpm: float = ERPM_PER_WHEEL_RPM, current_limit: float = VESCMotorController.MAX_CURRENT,
+                 speed_kp: float = 0.01, speed_ki: float = 0.05, command_timeout: Optional[float] = 1.0) -> None:
+        self.clock = clock
+        self.torque_per_amp = torque_per_amp
+        self.inertia = inertia
+        self.drag = drag
+        self.erpm_per_rad_s = erpm_per_wheel_rpm * 60.0 / (2.0 * math.pi)
+        self.current_limit = current_limit
+        self.speed_kp = speed_kp
+        self.speed_ki = speed_ki
+        self.command_timeout_ns = None if command_timeout is None else int(command_timeout * NS_PER_S)
+        self.mode: Optional[str] = None
+        self.target = 0
+        self.last_command_ns: Optional[int] = None
+        self.commands = 0
+        # Wheel speed in rad/s, turns travelled in rad, and the motor current in amps
+        self.omega = 0.0
+        self.angle = 0.0
+        self.current = 0.0
+        self._integral = 0.0
+
+    @property
+    def erpm(self) -> float:
+        return self.omega * self.erpm_per_rad_s
+
+    def set_rpm(self, speed: float):
+        self._command('rpm', self.speed_to_rpm(speed))
+
+    def set_current(self, speed: float):
+        self._command('current', self.speed_to_current(speed))
+
+    def _command(self, mode: str, target: int) -> None:
+        if mode != self.mode:
+            self._integral = 0.0
+        self.mode = mode
+        self.target = target
+        self.last_command_ns = self.clock.now_ns
+        self.commands += 1
+
+    def get_rpm(self):
+        return int(self.erpm)
+
+    def get_measurements(self):
+        return SimulatedValues(int(self.erpm), self.current, int(self.angle * self.erpm_per_rad_s / 60.0))
+
+    def step(self, dt: float) -> None:
+        """Integrates the motor and wheel over dt seconds."""
+        limit = self.current_limit
+        timed_out = (self.last_command_ns is None or (self.command_timeout_ns is not None and
+                     self.clock.now_ns - self.last_command_ns > self.command_timeout_ns))
+        if timed_out:
+            self.current = 0.0
+            self._integral = 0.0
+        elif self.mode == 'rpm':
+            # The VESC speed controller, a PI loop on electrical RPM with the integral held within the limit
+            error = self.target - self.erpm
+            self._integral = clamp(self._integral + self.speed_ki * error * dt, -limit, limit)
+            self.current = clamp(self.speed_kp * error + self._integral, -limit, limit)
+        else:
+            self.current = clamp(float(self.target), -limit, limit)
+        torque = self.torque_per_amp * self.current - self.drag * self.omega
+        self.omega += torque / self.inertia * dt
+        self.angle += self.omega * dt
+
+
+class DifferentialDriveSimulation:
+    """Two SimulatedMotors driving the couch, tracking where it goes.
+
+    Args:
+      clock: The clock to step with, a new VirtualClock by default.
+      wheel_radius: In metres.
+      track_width: Distance between the wheels in metres.
+      motor_options: Passed on to both SimulatedMotors.
+    """
+
+    def __init__(self, clock: Optional[VirtualClock] = None, wheel_radius: float = 0.1, track_width: float = 0.6,
+                 **motor_options) -> None:
+        self.clock = VirtualClock() if clock is None else clock
+        self.wheel_radius = wheel_radius
+        self.track_width = track_width
+        self.left = SimulatedMotor(self.clock, **motor_options)
+        self.right = SimulatedMotor(self.clock, **motor_options)
+        # Position in metres and heading in radians, counterclockwise from the starting direction
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0
+        self.distance = 0.0
+        self.top_speed = 0.0
+        self.clock.add_model(self)
+
+    @property
+    def speed(self) -> float:
+        """Forward speed in m/s."""
+        return (self.left.omega + self.right.omega) * self.wheel_radius / 2.0
+
+    @property
+    def yaw_rate(self) -> float:
+        """Turn rate in rad/s, counterclockwise positive."""
+        return (self.right.omega - self.left.omega) * self.wheel_radius / self.track_width
+
+    def step(self, dt: float) -> None:
+        self.left.step(dt)
+        self.right.step(dt)
+        speed = self.speed
+        self.heading += self.yaw_rate * dt
+        self.x += speed * math.cos(self.heading) * dt
+        self.y += speed * math.sin(self.heading) * dt
+        self.distance += abs(speed) * dt
+        self.top_speed = max(self.top_speed, abs(speed))
+
+    def state(self) -> Dict[str, float]:
+        """Returns the time, pose, speeds and motor currents."""
+        return {'time': self.clock.monotonic(), 'x': self.x, 'y': self.y, 'heading': math.degrees(self.heading),
+                'speed': self.speed, 'left_rpm': self.left.erpm, 'right_rpm': self.right.erpm,
+                'left_current': self.left.current, 'right_current': self.right.current}
+
+
+def scripted_session(log_path: str, script: Sequence[Tuple[float, Dict[str, float]]],
+                     controller: str = 'Joystick') -> None:
+    """Writes a session log for replay_joystick from a script of control changes.
+
+    Args:
+      log_path: Where to write the log.
+      script: (seconds from the start, {control name: value}) pairs in time order.
+        Axes take positions [-1.0..1.0], buttons True or False, and controls keep
+        their values until changed. An empty dict just marks the end of the session.
+      controller: The mapping the control names come from.
+    """
+    mapping = Gamepad.controllerMapping(controller)
+    axis_indices = dict((name, index) for index, name in mapping.axisNames.items())
+    button_indices = dict((name, index) for index, name in mapping.buttonNames.items())
+    events = [(0, 0, Gamepad.Gamepad.EVENT_CODE_INIT_BUTTON, index) for index in sorted(mapping.buttonNames)]
+    events += [(0, 0, Gamepad.Gamepad.EVENT_CODE_INIT_AXIS, index) for index in sorted(mapping.axisNames)]
+    first_axis = min(mapping.axisNames)
+    positions = {}
+    for seconds, controls in script:
+        timestamp = int(round(seconds * 1000))
+        if not controls:
+            # Repeats the first axis position, changing nothing but making the session last until now
+            events.append((timestamp, positions.get(first_axis, 0), Gamepad.Gamepad.EVENT_CODE_AXIS, first_axis))
+        for name, value in controls.items():
+            if name in axis_indices:
+                positions[axis_indices[name]] = int(round(value * 32767))
+                events.append((timestamp, positions[axis_indices[name]], Gamepad.Gamepad.EVENT_CODE_AXIS, axis_indices[name]))
+            elif name in button_indices:
+                events.append((timestamp, 1 if value else 0, Gamepad.Gamepad.EVENT_CODE_BUTTON, button_indices[name]))
+            else:
+                raise ValueError(f"{controller} has no control called {name}")
+    writeSessionLog(log_path, events)
+
+
+def replay_joystick(log_path: str, clock: VirtualClock, controller: str = 'Joystick') -> ReplayGamepad:
+    """Returns a ReplayGamepad playing a session log back in real time on the virtual clock."""
+    return ReplayGamepad(log_path, controller, speed=1.0, clock=clock.monotonic)
+
+
+def run_lockstep(joystick: ReplayGamepad, simulation: DifferentialDriveSimulation, rate_hz: float = 100.0,
+                 duration: Optional[float] = None, pipeline: Optional['Pipeline'] = None,
+                 telemetry: Optional['TelemetryLogger'] = None,
+                 on_tick: Optional[Callable[[DifferentialDriveSimulation], None]] = None) -> FixedRateScheduler:
+    """Runs drive_loop against the simulation until the session ends or duration simulated seconds pass.
+
+    Every scheduler sleep advances the simulation by one loop period, then
+    delivers the gamepad events that have become due, so each tick sees the
+    inputs and motor measurements of the same simulated moment. Nothing runs in
+    the background, the results only depend on the inputs.
+
+    Args:
+      joystick: A gamepad replaying on simulation.clock, see replay_joystick. Do not start its background updates.
+      simulation: The simulated couch.
+      rate_hz: The control loop rate.
+      duration: Simulated seconds to stop after, by default the end of the session.
+      pipeline: Passed on to drive_loop. A SlewRateLimit in it should use simulation.clock.monotonic as its clock.
+      telemetry: Passed on to drive_loop, its timestamps are real rather than simulated time.
+      on_tick: Called with the simulation after every loop period.
+
+    Returns:
+      The scheduler, whose tick count is the number of loop iterations.
+    """
+    clock = simulation.clock
+    scheduler = FixedRateScheduler(rate_hz, clock=clock.monotonic_ns, sleep=clock.sleep)
+    measurements = MeasurementPoller((simulation.left, simulation.right), clock=clock.monotonic_ns)
+    end_ns = None if duration is None else clock.now_ns + int(duration * NS_PER_S)
+
+    def pump(now_ns):
+        measurements.poll()
+        if on_tick is not None:
+            on_tick(simulation)
+        if end_ns is not None and now_ns >= end_ns:
+            joystick.connected = False
+            return
+        try:
+            while joystick.updateStateBatch(coalesceAxes=True, block=False) >= Gamepad.Gamepad.MAX_BATCH_EVENTS:
+                pass
+        except IOError:
+            # The end of the session, drive_loop sees the joystick disconnected
+            pass
+
+    clock.add_listener(pump)
+    try:
+        # Deliver the events due at the start before the first tick
+        clock.advance(0)
+        drive.drive_loop(joystick, simulation.left, simulation.right, scheduler=scheduler, pipeline=pipeline,
+                         telemetry=telemetry, measurements=measurements)
+    finally:
+        clock.remove_listener(pump)
+    return scheduler
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Drives the simulated couch from a gamepad session log.')
+    parser.add_argument('log', nargs='?', help='session log to replay, a built-in scripted drive by default')
+    parser.add_argument('--rate', type=float, default=100.0, help='control loop rate in Hz')
+    parser.add_argument('--duration', type=float, help='simulated seconds to stop after')
+    parser.add_argument('--every', type=float, default=0.5, help='simulated seconds between printed states')
+    options = parser.parse_args()
+
+    log_path = options.log
+    if log_path is None:
+        log_path = os.path.join(tempfile.mkdtemp(prefix='simulator-'), 'demo.jslog')
+        scripted_session(log_path, DEMO_SCRIPT)
+    simulation = DifferentialDriveSimulation()
+    joystick = replay_joystick(log_path, simulation.clock)
+    next_print = [0.0]
+
+    def print_state(simulation):
+        state = simulation.state()
+        if state['time'] >= next_print[0]:
+            next_print[0] += options.every
+            print(f"{state['time']:6.2f}s  x {state['x']:+7.2f} m  y {state['y']:+7.2f} m  "
+                  f"heading {state['heading']:+7.1f}  speed {state['speed']:+5.2f} m/s  "
+                  f"RPM {state['left_rpm']:+7.0f} {state['right_rpm']:+7.0f}  "
+                  f"current {state['left_current']:+6.1f} {state['right_current']:+6.1f} A")
+
+    start = time.perf_counter()
+    scheduler = run_lockstep(joystick, simulation, options.rate, options.duration, on_tick=print_state)
+    elapsed = time.perf_counter() - start
+    simulated = simulation.clock.monotonic()
+    print(f"{scheduler.ticks} ticks, {simulated:.2f} simulated seconds in {elapsed:.2f} s "
+          f"({simulated / elapsed:.0f}x real time), {simulation.distance:.2f} m travelled, "
+          f"top speed {simulation.top_speed:.2f} m/s")
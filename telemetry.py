@@ -0,0 +1,238 @@
+"""Structured telemetry from the control loop.
+
+TelemetryLogger.record copies one tick's values into preallocated column arrays
+forming a ring buffer, which is all the control thread does. A background thread
+takes whatever has built up, writes it to a compact columnar log file in blocks,
+rotates the file once it reaches a size limit and prints a short summary to the
+console at most once per summary interval.
+
+File layout: LOG_MAGIC, then blocks of BLOCK_MAGIC, a '<I' record count and each
+column of FIELDS in turn as that many little-endian values. read_log loads a
+file back into NumPy arrays.
+"""
+import array
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Dict, Optional, TextIO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy
+
+LOG_MAGIC = b'CTLM0001'
+BLOCK_MAGIC = b'TBLK'
+BLOCK_HEADER = '<4sI'
+
+# Column name and array typecode, in file order
+FIELDS = (
+    ('timestamp_ns', 'q'),
+    ('speed', 'f'),
+    ('rotation', 'f'),
+    ('left', 'f'),
+    ('right', 'f'),
+    ('left_rpm', 'f'),
+    ('right_rpm', 'f'),
+    ('mode', 'B'),
+    ('use_current', 'B'),
+)
+
+# Values of the mode column
+MODE_NAMES = ('slow', 'medium', 'max')
+
+
+def default_log_path() -> str:
+    """Returns where the couch's telemetry log goes, $COUCH_TELEMETRY_LOG if set."""
+    path = os.environ.get('COUCH_TELEMETRY_LOG')
+    if path:
+        return os.path.abspath(path)
+    base = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'couch', 'telemetry.bin')
+
+
+class TelemetryLogger:
+    """Logs one record per control tick without blocking the loop.
+
+    Args:
+      path: Log file, rotated copies are path.1, path.2 and so on. A log left by
+        an earlier run is rotated on start rather than overwritten, as after a
+        crash it is the one needed.
+      capacity: Records the ring buffer holds. Records arriving while it is full are dropped and counted.
+      flush_interval: Seconds between writes to the file.
+      max_bytes: Size at which the file is rotated.
+      backups: Rotated copies kept.
+      summary_interval: Seconds between console summaries, None for none.
+      console: Where summaries are written, stdout by default.
+    """
+
+    def __init__(self, path: str, capacity: int = 4096, flush_interval: float = 0.5,
+                 max_bytes: int = 16 * 1024 * 1024, backups: int = 3,
+                 summary_interval: Optional[float] = 1.0, console: Optional[TextIO] = None) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.summary_interval = summary_interval
+        self.console = sys.stdout if console is None else console
+        self.columns = [array.array(typecode, bytes(array.array(typecode).itemsize * capacity))
+                        for _, typecode in FIELDS]
+        # Written only by the control thread / only by the flush thread respectively
+        self.head = 0
+        self.tail = 0
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+        self._file = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_summary = 0.0
+        self._summary_recorded = 0
+
+    def start(self) -> None:
+        """Opens the log and starts the background flush thread."""
+        if self._thread is not None:
+            raise RuntimeError('Telemetry logger is already running')
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self._shift_backups()
+        self._open()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='TelemetryLogger', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stops the flush thread after writing everything still buffered."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def record(self, timestamp_ns: int, speed: float, rotation: float, left: float, right: float,
+               left_rpm: float, right_rpm: float, mode: int, use_current: bool) -> None:
+        """Adds one tick to the ring buffer, called from the control loop."""
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return
+        slot = head % self.capacity
+        timestamps, speeds, rotations, lefts, rights, left_rpms, right_rpms, modes, currents = self.columns
+        timestamps[slot] = timestamp_ns
+        speeds[slot] = speed
+        rotations[slot] = rotation
+        lefts[slot] = left
+        rights[slot] = right
+        left_rpms[slot] = left_rpm
+        right_rpms[slot] = right_rpm
+        modes[slot] = mode
+        currents[slot] = use_current
+        # Publish the record only once every column is filled in
+        self.head = head + 1
+        self.recorded += 1
+
+    def _open(self) -> None:
+        self._file = open(self.path, 'wb')
+        self._file.write(LOG_MAGIC)
+
+    def _shift_backups(self) -> None:
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{number + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._shift_backups()
+        self.rotations += 1
+        self._open()
+
+    def flush(self) -> int:
+        """Writes every buffered record as one block, returns how many. Called by the flush thread."""
+        head = self.head
+        tail = self.tail
+        count = head - tail
+        if count <= 0 or self._file is None:
+            return 0
+        start = tail % self.capacity
+        end = start + count
+        parts = [struct.pack(BLOCK_HEADER, BLOCK_MAGIC, count)]
+        for column in self.columns:
+            if end <= self.capacity:
+                values = column[start:end]
+            else:
+                values = column[start:] + column[:end - self.capacity]
+            if sys.byteorder != 'little':
+                values.byteswap()
+            parts.append(values.tobytes())
+        self._file.write(b''.join(parts))
+        self._file.flush()
+        # Only now may the control thread reuse the slots
+        self.tail = head
+        self.written += count
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+        return count
+
+    def summary(self) -> str:
+        """Returns a one line description of the latest record and the counters."""
+        if self.head == 0:
+            return 'telemetry: no records yet'
+        slot = (self.head - 1) % self.capacity
+        values = dict((name, column[slot]) for (name, _), column in zip(FIELDS, self.columns))
+        return (f"Left: {values['left']:+.3f}, Right: {values['right']:+.3f}, "
+                f"Left RPM: {values['left_rpm']:.0f}, Right RPM: {values['right_rpm']:.0f}, "
+                f"mode {MODE_NAMES[values['mode']]}{' current' if values['use_current'] else ''} "
+                f"({self.recorded} records, {self.dropped} dropped)")
+
+    def _run(self) -> None:
+        while True:
+            stopping = self._stopping.wait(self.flush_interval)
+            self.flush()
+            now = time.monotonic()
+            if self.summary_interval is not None and now >= self._next_summary and self.recorded != self._summary_recorded:
+                self._summary_recorded = self.recorded
+                self._next_summary = now + self.summary_interval
+                self.console.write(self.summary() + '\n')
+                self.console.flush()
+            if stopping:
+                return
+
+    def stats(self) -> Dict[str, int]:
+        return {'recorded': self.recorded, 'written': self.written, 'dropped': self.dropped, 'rotations': self.rotations}
+
+
+def read_log(path: str) -> Dict[str, 'numpy.ndarray']:
+    """Loads a telemetry log into one NumPy array per field of FIELDS.
+
+    A block cut short by the program stopping part way through writing it is ignored.
+    """
+    import numpy as np
+
+    with open(path, 'rb') as log_file:
+        data = log_file.read()
+    if not data.startswith(LOG_MAGIC):
+        raise ValueError(f"{path} is not a telemetry log")
+    dtypes = [np.dtype(typecode).newbyteorder('<') for _, typecode in FIELDS]
+    record_size = sum(dtype.itemsize for dtype in dtypes)
+    header_size = struct.calcsize(BLOCK_HEADER)
+    chunks = [[] for _ in FIELDS]
+    offset = len(LOG_MAGIC)
+    while offset + header_size <= len(data):
+        magic, count = struct.unpack_from(BLOCK_HEADER, data, offset)
+        if magic != BLOCK_MAGIC or offset + header_size + count * record_size > len(data):
+            break
+        offset += header_size
+        for index, dtype in enumerate(dtypes):
+            chunks[index].append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += count * dtype.itemsize
+    return dict((name, np.concatenate(chunk) if chunk else np.empty(0, dtype=dtype))
+                for (name, _), chunk, dtype in zip(FIELDS, chunks, dtypes))
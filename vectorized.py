@@ -0,0 +1,97 @@
+"""Array versions of mathutils and the drive kinematics, for offline tuning and simulation.
+
+Every function here takes NumPy arrays (or anything np.asarray accepts) and gives
+the same values, element by element, as its scalar namesake in mathutils / drive,
+including the branches and floor division. The scalar versions stay the ones used
+by the live loop, this module needs NumPy and is only imported when wanted.
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+def map_range(x, in_min, in_max, out_min, out_max) -> np.ndarray:
+    """Array version of mathutils.map_range, keeping its floor division."""
+    x = np.asarray(x, dtype=float)
+    return np.floor_divide((x - in_min) * (out_max - out_min), (in_max - in_min)) + out_min
+
+
+def speed_to_command(speed, max_value) -> np.ndarray:
+    """Array version of MotorController.speed_to_rpm / speed_to_current, i.e. int(map_range(...)).
+
+    Args:
+      speed: Speeds [-1.0..1.0].
+      max_value: MAX_RPM or MAX_CURRENT of the controller.
+
+    Returns:
+      The integer commands as int64, truncated toward zero like int().
+    """
+    return np.trunc(map_range(speed, -1, 1, -max_value, max_value)).astype(np.int64)
+
+
+def deadzone(x, min_val: float) -> np.ndarray:
+    """Array version of mathutils.deadzone."""
+    x = np.asarray(x, dtype=float)
+    return np.where(np.abs(x) < min_val, 0.0, x)
+
+
+def square(value) -> np.ndarray:
+    """Array version of mathutils.square."""
+    value = np.asarray(value, dtype=float)
+    return np.abs(value) * value
+
+
+def clamp(value, min_value: float, max_value: float) -> np.ndarray:
+    """Array version of mathutils.clamp."""
+    return np.maximum(np.minimum(np.asarray(value, dtype=float), max_value), min_value)
+
+
+def apply_deadband(value, deadband: float, max_magnitude: float) -> np.ndarray:
+    """Array version of mathutils.apply_deadband."""
+    value = np.asarray(value, dtype=float)
+    if max_magnitude / deadband > 1.0e12:
+        outside = value - np.where(value > 0.0, deadband, -deadband)
+    else:
+        outside = max_magnitude * (value - np.where(value > 0.0, deadband, -deadband)) / (max_magnitude - deadband)
+    return np.where(np.abs(value) > deadband, outside, 0.0)
+
+
+def scale_and_deadzone_inputs(speed, rotation, square_rotation: bool = True,
+                              deadband: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
+    """Array version of mathutils.scale_and_deadzone_inputs."""
+    speed = square(deadzone(speed, deadband))
+    rotation = deadzone(rotation, deadband)
+    if square_rotation:
+        rotation = square(rotation)
+    return speed, rotation
+
+
+def desaturate_wheel_speeds(left_speed, right_speed, use_max: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Array version of mathutils.desaturate_wheel_speeds."""
+    left_speed = np.asarray(left_speed, dtype=float)
+    right_speed = np.asarray(right_speed, dtype=float)
+    left_magnitude = np.abs(left_speed)
+    right_magnitude = np.abs(right_speed)
+    greater_input = np.maximum(left_magnitude, right_magnitude)
+    if use_max:
+        divisor = np.where(greater_input > 1, greater_input, 1.0)
+    else:
+        less_input = np.minimum(left_magnitude, right_magnitude)
+        # Where both are zero the scalar version returns (0, 0), dividing 0 by 1 does the same
+        stopped = greater_input == 0
+        divisor = np.where(stopped, 1.0, (greater_input + less_input) / np.where(stopped, 1.0, greater_input))
+    return left_speed / divisor, right_speed / divisor
+
+
+def curvture_drive_ik(speed, rotation) -> Tuple[np.ndarray, np.ndarray]:
+    """Array version of drive.curvture_drive_ik."""
+    speed, rotation = scale_and_deadzone_inputs(speed, rotation, square_rotation=False)
+    left_speed = speed + np.abs(speed) * rotation
+    right_speed = speed - np.abs(speed) * rotation
+    return desaturate_wheel_speeds(left_speed, right_speed)
+
+
+def arcade_drive_ik(speed, rotation) -> Tuple[np.ndarray, np.ndarray]:
+    """Array version of drive.arcade_drive_ik."""
+    speed, rotation = scale_and_deadzone_inputs(speed, rotation)
+    return desaturate_wheel_speeds(speed + rotation, speed - rotation)
@@ -0,0 +1,289 @@
+"""An asyncio transport to a VESC and the VESCs CAN forwarded from it, with requests pipelined.
+
+pyvesc's VESC writes a request and then blocks reading the reply's expected
+length, so polling N motors costs N round trips one after another. VESCTransport
+reads and writes a non-blocking serial fd from an asyncio event loop instead: a
+request is written straight away and awaits a future. The fd is read straight
+into a FrameDecoder, and each reply it splits out is routed to the future
+waiting for it by packet type and controller ID. GetValues for the local VESC
+and every CAN forwarded one can then be in flight together, so polling them all
+takes about one round trip.
+
+It also has the parts of pyvesc's VESC the motor controllers use, so
+VESCMotorController and CanVESC work on it unchanged, blocking calls included.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, TextIO, Tuple
+
+from pyvesc import encode_request
+from pyvesc.VESC.messages import GetValues
+from pyvesc.protocol.base import VESCMessage
+
+from latency import LatencyTracker
+from motor_controller import FrameDecoder, reply_controller_id, reply_rpm
+
+# The packet ID of a request forwarded to another VESC over CAN, followed by its CAN ID
+COMM_FORWARD_CAN = 34
+
+# Stages recorded by VESCTransport: a request being sent to its reply arriving
+TRANSPORT_STAGES = ('round_trip',)
+
+# A packet ID and the CAN ID a request went to, None for the VESC on the port
+Route = Tuple[int, Optional[int]]
+
+
+def request_route(packet) -> Route:
+    """Returns the packet ID an encoded request asks for and the CAN ID it is forwarded to."""
+    payload = packet[2:-3] if packet[0] == 2 else packet[3:-3]
+    if payload[0] == COMM_FORWARD_CAN:
+        return payload[2], payload[1]
+    return payload[0], None
+
+
+class VESCTransport:
+    """Requests and commands for the VESCs behind one serial port, from an asyncio event loop.
+
+    A reply goes to the oldest request still waiting for its packet ID from the
+    controller it came from: local_id for the local VESC, otherwise the CAN ID it
+    was forwarded to. A reply no request is waiting for, such as one arriving after
+    its request timed out, is counted as unmatched and dropped, never given to a
+    request for another controller. Replies carrying no controller ID go to any
+    request for their packet ID.
+
+    Use start() to run the transport on an event loop thread of its own, or await
+    connect() to use an already running loop.
+
+    Args:
+      port: An open serial port, e.g. a pyserial Serial, whose fileno() is read and written directly.
+      local_id: The controller ID of the VESC on the port, its app_controller_id.
+      timeout: Seconds to wait for a reply.
+      clock: Returns the time in nanoseconds, time.monotonic_ns by default.
+    """
+
+    def __init__(self, port, local_id: int, timeout: float = 0.1,
+                 clock: Callable[[], int] = time.monotonic_ns) -> None:
+        self.port = port
+        self.fd = port.fileno()
+        os.set_blocking(self.fd, False)
+        self.local_id = local_id
+        self.timeout = timeout
+        self.clock = clock
+        self.latency = LatencyTracker(TRANSPORT_STAGES)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.decoder = FrameDecoder()
+        self._out = bytearray()
+        self._pending: Dict[Route, Deque[Tuple[asyncio.Future, int]]] = {}
+        self._values_requests: Dict[Optional[int], bytes] = {}
+        self.requests = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.unmatched = 0
+        self.decode_errors = 0
+        self.peak_in_flight = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    async def connect(self) -> None:
+        """Starts reading replies on the running event loop."""
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    async def close(self) -> None:
+        """Stops reading and writing, failing any request still waiting."""
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self._out.clear()
+        for waiting in self._pending.values():
+            for future, _ in waiting:
+                future.cancel()
+        self._pending.clear()
+
+    def start(self) -> None:
+        """Starts an event loop in a background thread and connects on it."""
+        if self._thread is not None:
+            raise RuntimeError('VESC transport is already running')
+        loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=loop.run_forever, name='VESCTransport', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.connect(), loop).result()
+
+    def stop(self) -> None:
+        """Closes the transport and stops the event loop thread started by start()."""
+        if self._thread is not None:
+            self.run(self.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self._thread = None
+
+    def run(self, coroutine):
+        """Runs a coroutine on the transport's event loop from another thread and returns its result."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            raise RuntimeError("Blocking on the transport's own event loop would deadlock, await instead")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def request(self, message, timeout: Optional[float] = None):
+        """Sends a pyvesc request, e.g. GetValues(can_id=78), and returns the decoded reply.
+
+        Raises:
+          asyncio.TimeoutError: No reply came within the timeout.
+        """
+        return await self._request(encode_request(message), (message.id, message.can_id), timeout)
+
+    async def get_values(self, can_id: Optional[int] = None, timeout: Optional[float] = None):
+        """Returns the GetValues reply of the local VESC, or of the one with can_id over CAN."""
+        packet = self._values_requests.get(can_id)
+        if packet is None:
+            packet = self._values_requests[can_id] = encode_request(GetValues(can_id=can_id))
+        return await self._request(packet, (GetValues.id, can_id), timeout)
+
+    async def _request(self, packet: bytes, route: Route, timeout: Optional[float]):
+        waiting = self._pending.setdefault(route, deque())
+        entry = (self.loop.create_future(), self.clock())
+        waiting.append(entry)
+        self.requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, sum([len(w) for w in self._pending.values()]))
+        self._send(packet)
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(entry[0], timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            where = 'the local VESC' if route[1] is None else f"CAN ID {route[1]}"
+            raise asyncio.TimeoutError(f"No reply to packet {route[0]} from {where} within {timeout} s") from None
+        finally:
+            # Still there if it timed out or was cancelled, a late reply must not find it
+            if entry in waiting:
+                waiting.remove(entry)
+
+    def _send(self, data) -> None:
+        if not self._out:
+            try:
+                written = os.write(self.fd, data)
+            except BlockingIOError:
+                written = 0
+            except OSError as e:
+                self._error(e)
+                return
+            self.bytes_written += written
+            if written == len(data):
+                return
+            data = data[written:]
+            self.loop.add_writer(self.fd, self._on_writable)
+        self._out += data
+
+    def _on_writable(self) -> None:
+        try:
+            written = os.write(self.fd, self._out)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._error(e)
+            self._out.clear()
+            self.loop.remove_writer(self.fd)
+            return
+        self.bytes_written += written
+        del self._out[:written]
+        if not self._out:
+            self.loop.remove_writer(self.fd)
+
+    def _on_readable(self) -> None:
+        decoder = self.decoder
+        try:
+            count = os.readv(self.fd, [decoder.writable()])
+        except BlockingIOError:
+            return
+        except OSError as e:
+            # The port has gone, so stop reading rather than fail on every wakeup
+            self._error(e)
+            self.loop.remove_reader(self.fd)
+            return
+        decoder.written(count)
+        for payload in decoder:
+            try:
+                message = VESCMessage.unpack(payload)
+            except Exception:
+                # A packet with a good CRC that pyvesc does not know
+                self.decode_errors += 1
+                continue
+            self._deliver(message)
+
+    def _waiting_for(self, message) -> Optional[Deque[Tuple[asyncio.Future, int]]]:
+        packet_id = message.id
+        controller_id = reply_controller_id(message)
+        if controller_id is None:
+            return next((w for (pid, _), w in self._pending.items() if pid == packet_id and w), None)
+        if controller_id == self.local_id:
+            return self._pending.get((packet_id, None))
+        return self._pending.get((packet_id, controller_id))
+
+    def _deliver(self, message) -> None:
+        waiting = self._waiting_for(message)
+        while waiting:
+            future, sent = waiting.popleft()
+            if not future.done():
+                future.set_result(message)
+                self.replies += 1
+                self.latency.record('round_trip', sent, self.clock())
+                return
+        self.unmatched += 1
+
+    def _error(self, error: OSError) -> None:
+        self.errors += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+    # The parts of pyvesc's VESC used by VESCMotorController, CanVESC and MotorGroup
+
+    def write(self, data, num_read_bytes: Optional[int] = None):
+        """Writes a packet from any thread without blocking, as pyvesc's VESC.write does.
+
+        With num_read_bytes the packet is a request, and this blocks until its
+        decoded reply is returned, or None if none came. Its value is not needed.
+        """
+        # Copied, as command frames are reused buffers
+        data = bytes(data)
+        if num_read_bytes is None:
+            self.loop.call_soon_threadsafe(self._send, data)
+            return None
+        try:
+            return self.run(self._request(data, request_route(data), None))
+        except asyncio.TimeoutError:
+            return None
+
+    def get_measurements(self):
+        """Returns the local VESC's GetValues reply, or None if none came."""
+        try:
+            return self.run(self.get_values())
+        except asyncio.TimeoutError:
+            return None
+
+    def get_rpm(self):
+        return reply_rpm(self.get_measurements(), f"the VESC with controller ID {self.local_id}")
+
+    def stop_heartbeat(self):
+        # There is no heartbeat, commands are kept alive by MotorGroup or KeepaliveMotorController
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the request, reply, framing, decoding and error counters."""
+        return {'requests': self.requests, 'replies': self.replies, 'timeouts': self.timeouts,
+                'unmatched': self.unmatched, 'decode_errors': self.decode_errors,
+                'peak_in_flight': self.peak_in_flight, 'bytes_written': self.bytes_written,
+                'errors': self.errors, 'last_error': self.last_error, 'framing': self.decoder.stats()}
+
+    def dump(self, stream: Optional[TextIO] = None) -> None:
+        """Writes the counters and the round trip latency percentiles to stream, stderr by default."""
+        stream = sys.stderr if stream is None else stream
+        stream.write(f"VESC transport: {self.stats()}\n")
+        self.latency.dump(stream)